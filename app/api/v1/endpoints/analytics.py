@@ -2,28 +2,26 @@
 API endpoints для аналитики
 """
 
-from typing import List
+from decimal import Decimal
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import cached
 from app.core.database import get_db
+from app.core.pagination import decode_cursor, encode_cursor, set_next_link
+from app.core.responses import ORJSONResponse, json_response
 from app.schemas.base import PaginationParams
 from app.schemas.order import CategoryChildrenCount, ClientOrderSummary
 
 router = APIRouter()
 
-
-@router.get("/client-summary", response_model=List[ClientOrderSummary])
-async def get_client_order_summary(db: Session = Depends(get_db), pagination: PaginationParams = Depends()):
-    """
-    Получение информации о сумме товаров заказанных под каждого клиента
-    (Наименование клиента, сумма)
-    """
-    query = text(
-        """
+_CLIENT_SUMMARY_TEMPLATE = """
+    WITH summary AS (
         SELECT
+            c.id AS client_id,
             c.name AS client_name,
             COALESCE(SUM(oi.total_price), 0) AS total_amount,
             COUNT(DISTINCT o.id) AS orders_count,
@@ -33,223 +31,219 @@ async def get_client_order_summary(db: Session = Depends(get_db), pagination: Pa
         LEFT JOIN app.order_items oi ON o.id = oi.order_id
         WHERE c.is_active = TRUE
         GROUP BY c.id, c.name
-        ORDER BY total_amount DESC, c.name
-        LIMIT :limit OFFSET :offset
+    )
+    SELECT client_id, client_name, total_amount, orders_count, last_order
+    FROM summary
+    {keyset}
+    ORDER BY total_amount DESC, client_name, client_id
+    LIMIT :limit OFFSET :offset
+"""
+
+_CLIENT_SUMMARY_SQL = text(_CLIENT_SUMMARY_TEMPLATE.format(keyset=""))
+
+# Сортировка по убыванию суммы и возрастанию имени, поэтому предикат раскрыт вручную
+_CLIENT_SUMMARY_AFTER_SQL = text(
+    _CLIENT_SUMMARY_TEMPLATE.format(
+        keyset="""WHERE total_amount < :after_amount
+       OR (total_amount = :after_amount AND (client_name, client_id) > (:after_name, :after_id))"""
+    )
+)
+
+# Счетчик активных дочерних категорий поддерживается триггером: корни читаются
+# по частичному индексу idx_categories_root_active_name без агрегации и без задержки обновления
+_CATEGORY_CHILDREN_TEMPLATE = """
+    SELECT id AS category_id, name AS category_name, children_count, level, name AS full_path
+    FROM app.categories
+    WHERE parent_id IS NULL AND is_active = TRUE {keyset}
+    ORDER BY name, id
+    LIMIT :limit OFFSET :offset
+"""
+
+_CATEGORY_CHILDREN_SQL = text(_CATEGORY_CHILDREN_TEMPLATE.format(keyset=""))
+
+_CATEGORY_CHILDREN_AFTER_SQL = text(
+    _CATEGORY_CHILDREN_TEMPLATE.format(keyset="AND (name, id) > (:after_name, :after_id)")
+)
+
+_TOP_CLIENTS_SQL = text(
+    """
+    SELECT
+        c.name AS client_name,
+        cr.total_amount::float8 AS total_amount,
+        cr.orders_count,
+        (cr.total_amount / cr.items_count)::float8 AS avg_order,
+        (
+            SELECT MAX(o.order_date) FROM app.orders o WHERE o.client_id = cr.client_id AND o.status != 'cancelled'
+        ) AS last_order
+    FROM app.client_revenue cr
+    JOIN app.clients c ON c.id = cr.client_id
+    WHERE cr.items_count > 0 AND c.is_active = TRUE
+    ORDER BY cr.total_amount DESC
+    LIMIT :limit
+"""
+)
+
+_CATEGORY_STATS_SQL = text(
     """
+    SELECT category_name, products_count, total_quantity, avg_price, min_price, max_price, total_value
+    FROM app.mv_category_stats
+    ORDER BY total_value DESC
+"""
+)
+
+# Завершенные месяцы читаются из снимка, живой запрос сканирует только заказы после него
+_SALES_BY_MONTH_SQL = text(
+    """
+    WITH snapshot_end AS (
+        SELECT COALESCE(MAX(month) + INTERVAL '1 month', '-infinity') AS since FROM app.fact_sales_month
     )
+    SELECT
+        month, orders_count, items_count, total_amount::float8 AS total_amount, avg_order::float8 AS avg_order
+    FROM app.fact_sales_month
+    UNION ALL
+    SELECT
+        DATE_TRUNC('month', o.order_date) AS month,
+        COUNT(DISTINCT o.id) AS orders_count,
+        COUNT(oi.id) AS items_count,
+        SUM(oi.total_price)::float8 AS total_amount,
+        AVG(oi.total_price)::float8 AS avg_order
+    FROM app.orders o
+    JOIN app.order_items oi ON o.id = oi.order_id
+    WHERE o.status != 'cancelled' AND o.order_date >= (SELECT since FROM snapshot_end)
+    GROUP BY DATE_TRUNC('month', o.order_date)
+    ORDER BY month DESC
+"""
+)
+
+_TOP_PRODUCTS_SQL = text(
+    """
+    SELECT
+        n.name AS product_name,
+        n.sku,
+        cat.name AS category_name,
+        pr.total_sold,
+        pr.total_revenue::float8 AS total_revenue,
+        pr.orders_count
+    FROM app.product_revenue pr
+    JOIN app.nomenclature n ON n.id = pr.nomenclature_id
+    JOIN app.categories cat ON n.category_id = cat.id
+    WHERE pr.orders_count > 0 AND n.is_active = TRUE
+    ORDER BY pr.total_revenue DESC
+    LIMIT :limit
+"""
+)
+
 
-    result = db.execute(query, {"limit": pagination.size, "offset": pagination.offset})
+@cached("analytics")
+async def _client_summary(db: AsyncSession, limit: int, offset: int, after: Optional[List[Any]]) -> List[dict]:
+    """Страница суммы заказов по клиентам (по смещению или после курсора)"""
+    params = {"limit": limit, "offset": offset}
+    if after is None:
+        result = await db.execute(_CLIENT_SUMMARY_SQL, params)
+    else:
+        after_amount, after_name, after_id = after
+        params.update(after_amount=after_amount, after_name=after_name, after_id=after_id)
+        result = await db.execute(_CLIENT_SUMMARY_AFTER_SQL, params)
 
-    return [
-        ClientOrderSummary(
-            client_name=row.client_name,
-            total_amount=row.total_amount,
-            orders_count=row.orders_count,
-            last_order=row.last_order,
+    return [dict(row) for row in result.mappings()]
+
+
+async def _category_children(db: AsyncSession, limit: int, offset: int, after: Optional[List[Any]]) -> List[dict]:
+    """Страница количества дочерних категорий (по смещению или после курсора)"""
+    params = {"limit": limit, "offset": offset}
+    if after is None:
+        result = await db.execute(_CATEGORY_CHILDREN_SQL, params)
+    else:
+        after_name, after_id = after
+        params.update(after_name=after_name, after_id=after_id)
+        result = await db.execute(_CATEGORY_CHILDREN_AFTER_SQL, params)
+
+    return [dict(row) for row in result.mappings()]
+
+
+@router.get("/client-summary", response_model=List[ClientOrderSummary])
+async def get_client_order_summary(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    pagination: PaginationParams = Depends(),
+):
+    """
+    Получение информации о сумме товаров заказанных под каждого клиента
+    (Наименование клиента, сумма)
+    """
+    after = decode_cursor(pagination.after, (Decimal, str, int))
+    rows = await _client_summary(db=db, limit=pagination.size, offset=pagination.offset, after=after)
+    # Строки уже нужной формы: response_model используется только для документации
+    response = ORJSONResponse(rows)
+
+    if len(rows) == pagination.size:
+        last = rows[-1]
+        set_next_link(
+            request, response, encode_cursor([str(last["total_amount"]), last["client_name"], last["client_id"]])
         )
-        for row in result
-    ]
+
+    return response
 
 
 @router.get("/category-children", response_model=List[CategoryChildrenCount])
-async def get_category_children_count(db: Session = Depends(get_db), pagination: PaginationParams = Depends()):
+async def get_category_children_count(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    pagination: PaginationParams = Depends(),
+):
     """
     Найти количество дочерних элементов первого уровня вложенности для категорий номенклатуры
     """
-    query = text(
-        """
-        WITH RECURSIVE category_hierarchy AS (
-            SELECT
-                id,
-                name,
-                parent_id,
-                level,
-                0 as depth,
-                name as full_path,
-                ARRAY[id] as path_array
-            FROM app.categories
-            WHERE parent_id IS NULL AND is_active = TRUE
-
-            UNION ALL
-
-            SELECT
-                c.id,
-                c.name,
-                c.parent_id,
-                c.level,
-                ch.depth + 1,
-                ch.full_path || ' -> ' || c.name,
-                ch.path_array || c.id
-            FROM app.categories c
-            INNER JOIN category_hierarchy ch ON c.parent_id = ch.id
-            WHERE c.is_active = TRUE
-        )
-        SELECT
-            parent.name AS category_name,
-            COUNT(child.id) AS children_count,
-            parent.level,
-            parent.full_path
-        FROM category_hierarchy parent
-        LEFT JOIN category_hierarchy child ON child.parent_id = parent.id AND child.depth = 1
-        WHERE parent.depth = 0
-        GROUP BY parent.id, parent.name, parent.level, parent.full_path
-        ORDER BY parent.name
-        LIMIT :limit OFFSET :offset
-    """
-    )
+    after = decode_cursor(pagination.after, (str, int))
+    rows = await _category_children(db=db, limit=pagination.size, offset=pagination.offset, after=after)
+    response = ORJSONResponse(rows)
 
-    result = db.execute(query, {"limit": pagination.size, "offset": pagination.offset})
+    if len(rows) == pagination.size:
+        last = rows[-1]
+        set_next_link(request, response, encode_cursor([last["category_name"], last["category_id"]]))
 
-    return [
-        CategoryChildrenCount(
-            category_name=row.category_name, children_count=row.children_count, level=row.level, full_path=row.full_path
-        )
-        for row in result
-    ]
+    return response
 
 
 @router.get("/top-clients")
+@json_response
+@cached("analytics")
 async def get_top_clients(
-    limit: int = Query(5, ge=1, le=50, description="Количество клиентов"), db: Session = Depends(get_db)
+    limit: int = Query(5, ge=1, le=50, description="Количество клиентов"), db: AsyncSession = Depends(get_db)
 ):
     """Топ клиентов по сумме заказов"""
-    query = text(
-        """
-        SELECT
-            c.name AS client_name,
-            SUM(oi.total_price) AS total_amount,
-            COUNT(DISTINCT o.id) AS orders_count,
-            AVG(oi.total_price) AS avg_order,
-            MAX(o.order_date) AS last_order
-        FROM app.clients c
-        JOIN app.orders o ON c.id = o.client_id
-        JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE o.status != 'cancelled' AND c.is_active = TRUE
-        GROUP BY c.id, c.name
-        ORDER BY total_amount DESC
-        LIMIT :limit
-    """
-    )
-
-    result = db.execute(query, {"limit": limit})
+    result = await db.execute(_TOP_CLIENTS_SQL, {"limit": limit})
 
-    return [
-        {
-            "client_name": row.client_name,
-            "total_amount": float(row.total_amount),
-            "orders_count": row.orders_count,
-            "avg_order": float(row.avg_order),
-            "last_order": row.last_order,
-        }
-        for row in result
-    ]
+    return [dict(row) for row in result.mappings()]
 
 
 @router.get("/category-stats")
-async def get_category_stats(db: Session = Depends(get_db)):
+@json_response
+@cached("analytics")
+async def get_category_stats(db: AsyncSession = Depends(get_db)):
     """Статистика по категориям"""
-    query = text(
-        """
-        SELECT
-            c.name AS category_name,
-            COUNT(n.id) AS products_count,
-            COALESCE(SUM(n.quantity), 0) AS total_quantity,
-            COALESCE(AVG(n.price), 0) AS avg_price,
-            COALESCE(MIN(n.price), 0) AS min_price,
-            COALESCE(MAX(n.price), 0) AS max_price,
-            COALESCE(SUM(n.price * n.quantity), 0) AS total_value
-        FROM app.categories c
-        LEFT JOIN app.nomenclature n ON c.id = n.category_id AND n.is_active = TRUE
-        WHERE c.is_active = TRUE
-        GROUP BY c.id, c.name
-        ORDER BY total_value DESC NULLS LAST
-    """
-    )
-
-    result = db.execute(query)
+    result = await db.execute(_CATEGORY_STATS_SQL)
 
-    return [
-        {
-            "category_name": row.category_name,
-            "products_count": row.products_count,
-            "total_quantity": row.total_quantity,
-            "avg_price": float(row.avg_price),
-            "min_price": float(row.min_price),
-            "max_price": float(row.max_price),
-            "total_value": float(row.total_value),
-        }
-        for row in result
-    ]
+    return [dict(row) for row in result.mappings()]
 
 
 @router.get("/sales-by-month")
-async def get_sales_by_month(db: Session = Depends(get_db)):
+@json_response
+@cached("analytics")
+async def get_sales_by_month(db: AsyncSession = Depends(get_db)):
     """Продажи по месяцам"""
-    query = text(
-        """
-        SELECT
-            DATE_TRUNC('month', o.order_date) AS month,
-            COUNT(DISTINCT o.id) AS orders_count,
-            COUNT(oi.id) AS items_count,
-            SUM(oi.total_price) AS total_amount,
-            AVG(oi.total_price) AS avg_order
-        FROM app.orders o
-        JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE o.status != 'cancelled'
-        GROUP BY DATE_TRUNC('month', o.order_date)
-        ORDER BY month DESC
-    """
-    )
+    result = await db.execute(_SALES_BY_MONTH_SQL)
 
-    result = db.execute(query)
-
-    return [
-        {
-            "month": row.month,
-            "orders_count": row.orders_count,
-            "items_count": row.items_count,
-            "total_amount": float(row.total_amount),
-            "avg_order": float(row.avg_order),
-        }
-        for row in result
-    ]
+    return [dict(row) for row in result.mappings()]
 
 
 @router.get("/top-products")
+@json_response
+@cached("analytics")
 async def get_top_products(
-    limit: int = Query(10, ge=1, le=50, description="Количество товаров"), db: Session = Depends(get_db)
+    limit: int = Query(10, ge=1, le=50, description="Количество товаров"), db: AsyncSession = Depends(get_db)
 ):
     """Топ товаров по продажам"""
-    query = text(
-        """
-        SELECT
-            n.name AS product_name,
-            n.sku,
-            cat.name AS category_name,
-            SUM(oi.quantity) AS total_sold,
-            SUM(oi.total_price) AS total_revenue,
-            COUNT(DISTINCT o.id) AS orders_count
-        FROM app.nomenclature n
-        JOIN app.categories cat ON n.category_id = cat.id
-        JOIN app.order_items oi ON n.id = oi.nomenclature_id
-        JOIN app.orders o ON oi.order_id = o.id
-        WHERE o.status != 'cancelled' AND n.is_active = TRUE
-        GROUP BY n.id, n.name, n.sku, cat.name
-        ORDER BY total_revenue DESC
-        LIMIT :limit
-    """
-    )
+    result = await db.execute(_TOP_PRODUCTS_SQL, {"limit": limit})
 
-    result = db.execute(query, {"limit": limit})
-
-    return [
-        {
-            "product_name": row.product_name,
-            "sku": row.sku,
-            "category_name": row.category_name,
-            "total_sold": row.total_sold,
-            "total_revenue": float(row.total_revenue),
-            "orders_count": row.orders_count,
-        }
-        for row in result
-    ]
+    return [dict(row) for row in result.mappings()]
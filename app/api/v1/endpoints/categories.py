@@ -4,13 +4,17 @@ API endpoints для категорий
 
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
+from app.core.pagination import decode_cursor, encode_cursor, set_next_link
+from app.core.responses import ORJSONResponse, stream_json
 from app.schemas.base import PaginationParams
 from app.schemas.category import (
+    CategoryBundle,
     CategoryCreate,
     CategoryHierarchy,
     CategoryResponse,
@@ -21,362 +25,322 @@ from app.schemas.category import (
 
 router = APIRouter()
 
+_CATEGORY_EXISTS_SQL = text("SELECT EXISTS (SELECT 1 FROM app.categories WHERE id = :category_id)")
 
-@router.get("/", response_model=List[CategoryResponse])
-async def get_categories(
-    db: Session = Depends(get_db),
-    pagination: PaginationParams = Depends(),
-    is_active: Optional[bool] = Query(None, description="Фильтр по активности"),
-):
-    """Получение списка категорий"""
-    query = text(
-        """
-        SELECT
-            c.id, c.uuid, c.name, c.parent_id, c.level, c.path, c.is_active,
-            c.created_at, c.updated_at, c.created_by, c.updated_by,
-            COUNT(child.id) as children_count
-        FROM app.categories c
-        LEFT JOIN app.categories child ON c.id = child.parent_id AND child.is_active = TRUE
-        WHERE c.is_active = :is_active OR :is_active IS NULL
-        GROUP BY c.id, c.uuid, c.name, c.parent_id, c.level, c.path, c.is_active,
-                 c.created_at, c.updated_at, c.created_by, c.updated_by
-        ORDER BY c.name
-        LIMIT :limit OFFSET :offset
-    """
-    )
+_ACTIVE_CATEGORY_EXISTS_SQL = text(
+    "SELECT EXISTS (SELECT 1 FROM app.categories WHERE id = :category_id AND is_active = TRUE)"
+)
+
+_CATEGORIES_TEMPLATE = """
+    SELECT
+        id, uuid, name, parent_id, level, path, is_active,
+        created_at, updated_at, created_by, updated_by, children_count
+    FROM app.categories
+    WHERE {where}
+    ORDER BY name, id
+    LIMIT :limit OFFSET :offset
+"""
+
+# Фильтр активности подставляется литералом (а не OR с параметром), чтобы планировщик мог выбрать частичный индекс
+_ACTIVE_FILTERS = {None: None, True: "is_active = TRUE", False: "is_active = FALSE"}
 
-    result = db.execute(query, {"is_active": is_active, "limit": pagination.size, "offset": pagination.offset})
-
-    return [
-        CategoryResponse(
-            id=row.id,
-            uuid=row.uuid,
-            name=row.name,
-            parent_id=row.parent_id,
-            level=row.level,
-            path=row.path,
-            is_active=row.is_active,
-            created_at=row.created_at,
-            updated_at=row.updated_at,
-            created_by=row.created_by,
-            updated_by=row.updated_by,
-            children_count=row.children_count,
+_CATEGORIES_KEYSET = "(name, id) > (:after_name, :after_id)"
+
+# Запросы списка категорий по значению фильтра активности и наличию курсора
+_CATEGORIES_SQL = {
+    (is_active, keyset): text(
+        _CATEGORIES_TEMPLATE.format(
+            where=" AND ".join(filter(None, (active_filter, keyset and _CATEGORIES_KEYSET))) or "TRUE"
         )
-        for row in result
-    ]
+    )
+    for is_active, active_filter in _ACTIVE_FILTERS.items()
+    for keyset in (False, True)
+}
 
+_CATEGORY_SQL = text(
+    """
+    SELECT
+        id, uuid, name, parent_id, level, path, is_active,
+        created_at, updated_at, created_by, updated_by, children_count
+    FROM app.categories
+    WHERE id = :category_id
+"""
+)
 
-@router.get("/{category_id}", response_model=CategoryResponse)
-async def get_category(category_id: int, db: Session = Depends(get_db)):
-    """Получение категории по ID"""
-    query = text(
-        """
+_CREATE_CATEGORY_SQL = text(
+    """
+    WITH parent_ok AS (
+        SELECT 1 FROM app.categories WHERE id = CAST(:parent_id AS INTEGER) AND is_active = TRUE
+    ),
+    duplicate AS (
+        SELECT 1 FROM app.categories
+        WHERE name = :name AND parent_id IS NOT DISTINCT FROM CAST(:parent_id AS INTEGER) AND is_active = TRUE
+    )
+    INSERT INTO app.categories (name, parent_id, created_by)
+    SELECT :name, CAST(:parent_id AS INTEGER), :created_by
+    WHERE (CAST(:parent_id AS INTEGER) IS NULL OR EXISTS (SELECT 1 FROM parent_ok))
+      AND NOT EXISTS (SELECT 1 FROM duplicate)
+    RETURNING id, uuid, name, parent_id, level, path, is_active, created_at, updated_at, created_by, updated_by,
+              children_count
+"""
+)
+
+_DELETE_CATEGORY_SQL = text(
+    """
+    WITH target AS (
         SELECT
-            c.id, c.uuid, c.name, c.parent_id, c.level, c.path, c.is_active,
-            c.created_at, c.updated_at, c.created_by, c.updated_by,
-            COUNT(child.id) as children_count
+            c.id,
+            EXISTS (SELECT 1 FROM app.categories WHERE parent_id = c.id) AS has_children,
+            EXISTS (SELECT 1 FROM app.nomenclature WHERE category_id = c.id) AS has_products
         FROM app.categories c
-        LEFT JOIN app.categories child ON c.id = child.parent_id AND child.is_active = TRUE
         WHERE c.id = :category_id
-        GROUP BY c.id, c.uuid, c.name, c.parent_id, c.level, c.path, c.is_active,
-                 c.created_at, c.updated_at, c.created_by, c.updated_by
-    """
+    ),
+    deleted AS (
+        DELETE FROM app.categories
+        WHERE id IN (SELECT id FROM target WHERE NOT has_children AND NOT has_products)
+        RETURNING id
     )
+    SELECT has_children, has_products FROM target
+"""
+)
 
-    result = db.execute(query, {"category_id": category_id}).first()
+# Одно выражение для любого набора полей: непереданные поля (NULL) остаются без изменений.
+# Проверка родителя выполняется в том же запросе, что и обновление
+_UPDATE_CATEGORY_SQL = text(
+    """
+    UPDATE app.categories
+    SET name = COALESCE(CAST(:name AS VARCHAR), name),
+        parent_id = COALESCE(CAST(:parent_id AS INTEGER), parent_id),
+        is_active = COALESCE(CAST(:is_active AS BOOLEAN), is_active),
+        updated_by = :updated_by
+    WHERE id = :category_id
+      AND (
+          CAST(:parent_id AS INTEGER) IS NULL
+          OR EXISTS (SELECT 1 FROM app.categories WHERE id = CAST(:parent_id AS INTEGER) AND is_active = TRUE)
+      )
+    RETURNING id, uuid, name, parent_id, level, path, is_active, created_at, updated_at, created_by, updated_by,
+              children_count
+"""
+)
 
-    if not result:
-        raise HTTPException(status_code=404, detail="Категория не найдена")
+_CATEGORY_TREE_SQL = text("SELECT app.category_tree_json(NULL)::text")
 
-    return CategoryResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        parent_id=result.parent_id,
-        level=result.level,
-        path=result.path,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        children_count=result.children_count,
-    )
+_CATEGORY_HIERARCHY_SQL = text("SELECT id, name, level, path FROM app.category_hierarchy ORDER BY path")
 
+# Один рекурсивный обход для дерева, иерархии и количества дочерних элементов;
+# visible - категория и все ее предки активны (так же, как в дереве)
+_CATEGORY_BUNDLE_SQL = text(
+    """
+    WITH RECURSIVE ch AS (
+        SELECT id, name, parent_id, path, level, children_count, is_active AS visible
+        FROM app.categories
+        WHERE parent_id IS NULL
 
-@router.post("/", response_model=CategoryResponse)
-async def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
-    """Создание новой категории"""
-    # Проверяем существование родительской категории
-    if category.parent_id:
-        parent_query = text("SELECT id FROM app.categories WHERE id = :parent_id AND is_active = TRUE")
-        parent_result = db.execute(parent_query, {"parent_id": category.parent_id}).first()
-        if not parent_result:
-            raise HTTPException(status_code=400, detail="Родительская категория не найдена")
+        UNION ALL
 
-    # Проверяем уникальность имени в рамках одного уровня
-    name_query = text(
-        """
-        SELECT id FROM app.categories
-        WHERE name = :name AND parent_id = :parent_id AND is_active = TRUE
-    """
+        SELECT c.id, c.name, c.parent_id, c.path, c.level, c.children_count, ch.visible AND c.is_active
+        FROM app.categories c
+        JOIN ch ON c.parent_id = ch.id
     )
-    existing = db.execute(name_query, {"name": category.name, "parent_id": category.parent_id}).first()
-
-    if existing:
-        raise HTTPException(status_code=400, detail="Категория с таким именем уже существует")
+    SELECT
+        id, name, parent_id, path::text AS path, level, children_count, visible,
+        ROW_NUMBER() OVER (ORDER BY path) AS path_order
+    FROM ch
+    ORDER BY name
+"""
+)
 
-    # Создаем категорию
-    insert_query = text(
-        """
-        INSERT INTO app.categories (name, parent_id, created_by)
-        VALUES (:name, :parent_id, :created_by)
-        RETURNING id, uuid, name, parent_id, level, path, is_active, created_at, updated_at, created_by, updated_by
+_CATEGORY_STATS_SQL = text(
     """
-    )
+    SELECT category_id, category_name, products_count, total_quantity, avg_price, min_price, max_price, total_value
+    FROM app.mv_category_stats
+    ORDER BY total_value DESC
+"""
+)
 
-    result = db.execute(
-        insert_query, {"name": category.name, "parent_id": category.parent_id, "created_by": "api_user"}
-    ).first()
 
-    db.commit()
-
-    return CategoryResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        parent_id=result.parent_id,
-        level=result.level,
-        path=result.path,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        children_count=0,
-    )
+def _with_indent(row: dict) -> dict:
+    """Отступ по уровню вложенности для отображения дерева (считается на стороне приложения)"""
+    row["full_path"] = "  " * row["level"] + row["name"]
+    return row
 
 
-@router.put("/{category_id}", response_model=CategoryResponse)
-async def update_category(category_id: int, category_update: CategoryUpdate, db: Session = Depends(get_db)):
-    """Обновление категории"""
-    # Проверяем существование категории
-    check_query = text("SELECT id FROM app.categories WHERE id = :category_id")
-    existing = db.execute(check_query, {"category_id": category_id}).first()
+def _build_bundle(rows: List[dict]) -> dict:
+    """Сборка дерева, иерархии и количества дочерних элементов из строк, отсортированных по имени"""
+    nodes = {
+        row["id"]: {
+            "id": row["id"],
+            "name": row["name"],
+            "parent_id": row["parent_id"],
+            "level": row["level"],
+            "path": row["path"],
+            "children": [],
+        }
+        for row in rows
+        if row["visible"]
+    }
+
+    tree = []
+    children_counts = []
+    for row in rows:
+        node = nodes.get(row["id"])
+        if node is None:
+            continue
+        if row["parent_id"] is None:
+            tree.append(node)
+            children_counts.append(
+                {
+                    "category_name": row["name"],
+                    "children_count": row["children_count"],
+                    "level": row["level"],
+                    "full_path": row["name"],
+                }
+            )
+        else:
+            nodes[row["parent_id"]]["children"].append(node)
+
+    hierarchy = [
+        _with_indent({"id": row["id"], "name": row["name"], "level": row["level"], "path": row["path"]})
+        for row in sorted(rows, key=lambda row: row["path_order"])
+    ]
+
+    return {"tree": tree, "hierarchy": hierarchy, "children_counts": children_counts}
+
+
+async def _category_exists(db: AsyncSession, category_id: int) -> bool:
+    """Проверка существования категории"""
+    return (await db.execute(_CATEGORY_EXISTS_SQL, {"category_id": category_id})).scalar()
+
 
-    if not existing:
+async def _active_category_exists(db: AsyncSession, category_id: int) -> bool:
+    """Проверка существования активной категории"""
+    return (await db.execute(_ACTIVE_CATEGORY_EXISTS_SQL, {"category_id": category_id})).scalar()
+
+
+@router.get("/", response_model=List[CategoryResponse])
+async def get_categories(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    pagination: PaginationParams = Depends(),
+    is_active: Optional[bool] = Query(None, description="Фильтр по активности"),
+):
+    """Получение списка категорий"""
+    params = {"limit": pagination.size, "offset": pagination.offset}
+    after = decode_cursor(pagination.after, (str, int))
+    if after is not None:
+        params.update(after_name=after[0], after_id=after[1])
+
+    result = await db.execute(_CATEGORIES_SQL[is_active, after is not None], params)
+
+    # Данные из типизированных колонок БД, повторная валидация при создании модели не нужна
+    categories = [CategoryResponse.model_construct(**row._mapping) for row in result]
+
+    if len(categories) == pagination.size:
+        last = categories[-1]
+        set_next_link(request, response, encode_cursor([last.name, last.id]))
+
+    return categories
+
+
+@router.get("/{category_id}", response_model=CategoryResponse)
+async def get_category(category_id: int, db: AsyncSession = Depends(get_db)):
+    """Получение категории по ID"""
+    result = (await db.execute(_CATEGORY_SQL, {"category_id": category_id})).first()
+
+    if not result:
         raise HTTPException(status_code=404, detail="Категория не найдена")
 
-    # Проверяем родительскую категорию
-    if category_update.parent_id:
-        parent_query = text("SELECT id FROM app.categories WHERE id = :parent_id AND is_active = TRUE")
-        parent_result = db.execute(parent_query, {"parent_id": category_update.parent_id}).first()
-        if not parent_result:
+    return CategoryResponse.model_construct(**result._mapping)
+
+
+@router.post("/", response_model=CategoryResponse)
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
+    """Создание новой категории"""
+    # Проверки родителя и уникальности имени выполняются в том же запросе, что и вставка
+    result = (
+        await db.execute(
+            _CREATE_CATEGORY_SQL, {"name": category.name, "parent_id": category.parent_id, "created_by": "api_user"}
+        )
+    ).first()
+
+    if not result:
+        # Определяем причину отказа только в неуспешной ветке
+        if category.parent_id is not None and not await _active_category_exists(db, category.parent_id):
             raise HTTPException(status_code=400, detail="Родительская категория не найдена")
+        raise HTTPException(status_code=400, detail="Категория с таким именем уже существует")
 
-    # Обновляем категорию
-    update_fields = []
-    update_values = {"category_id": category_id}
+    await db.commit()
 
-    if category_update.name is not None:
-        update_fields.append("name = :name")
-        update_values["name"] = category_update.name
+    return CategoryResponse.model_construct(**result._mapping)
 
-    if category_update.parent_id is not None:
-        update_fields.append("parent_id = :parent_id")
-        update_values["parent_id"] = category_update.parent_id
 
-    if category_update.is_active is not None:
-        update_fields.append("is_active = :is_active")
-        update_values["is_active"] = category_update.is_active
+@router.put("/{category_id}", response_model=CategoryResponse)
+async def update_category(category_id: int, category_update: CategoryUpdate, db: AsyncSession = Depends(get_db)):
+    """Обновление категории"""
+    update_values = category_update.model_dump()
 
-    if not update_fields:
+    if all(value is None for value in update_values.values()):
         raise HTTPException(status_code=400, detail="Нет данных для обновления")
 
-    update_query = text(
-        f"""
-        UPDATE app.categories
-        SET {', '.join(update_fields)}, updated_by = :updated_by
-        WHERE id = :category_id
-        RETURNING id, uuid, name, parent_id, level, path, is_active, created_at, updated_at, created_by, updated_by
-    """
-    )
+    update_values.update(category_id=category_id, updated_by="api_user")
 
-    update_values["updated_by"] = "api_user"
-
-    result = db.execute(update_query, update_values).first()
-    db.commit()
-
-    # Получаем количество дочерних элементов
-    children_query = text("SELECT COUNT(*) FROM app.categories WHERE parent_id = :category_id AND is_active = TRUE")
-    children_count = db.execute(children_query, {"category_id": category_id}).scalar()
-
-    return CategoryResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        parent_id=result.parent_id,
-        level=result.level,
-        path=result.path,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        children_count=children_count,
-    )
+    result = (await db.execute(_UPDATE_CATEGORY_SQL, update_values)).first()
+
+    if not result:
+        if not await _category_exists(db, category_id):
+            raise HTTPException(status_code=404, detail="Категория не найдена")
+        raise HTTPException(status_code=400, detail="Родительская категория не найдена")
+
+    await db.commit()
+
+    return CategoryResponse.model_construct(**result._mapping)
 
 
 @router.delete("/{category_id}")
-async def delete_category(category_id: int, db: Session = Depends(get_db)):
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
     """Удаление категории"""
-    # Проверяем существование категории
-    check_query = text("SELECT id FROM app.categories WHERE id = :category_id")
-    existing = db.execute(check_query, {"category_id": category_id}).first()
+    # Проверки и удаление выполняются одним запросом
+    result = (await db.execute(_DELETE_CATEGORY_SQL, {"category_id": category_id})).first()
 
-    if not existing:
+    if not result:
         raise HTTPException(status_code=404, detail="Категория не найдена")
 
-    # Проверяем наличие дочерних категорий
-    children_query = text("SELECT COUNT(*) FROM app.categories WHERE parent_id = :category_id")
-    children_count = db.execute(children_query, {"category_id": category_id}).scalar()
-
-    if children_count > 0:
+    if result.has_children:
         raise HTTPException(status_code=400, detail="Нельзя удалить категорию с дочерними элементами")
 
-    # Проверяем наличие товаров в категории
-    products_query = text("SELECT COUNT(*) FROM app.nomenclature WHERE category_id = :category_id")
-    products_count = db.execute(products_query, {"category_id": category_id}).scalar()
-
-    if products_count > 0:
+    if result.has_products:
         raise HTTPException(status_code=400, detail="Нельзя удалить категорию с товарами")
 
-    # Удаляем категорию
-    delete_query = text("DELETE FROM app.categories WHERE id = :category_id")
-    db.execute(delete_query, {"category_id": category_id})
-    db.commit()
+    await db.commit()
 
     return {"message": "Категория удалена"}
 
 
 @router.get("/tree/", response_model=List[CategoryTree])
-async def get_category_tree(db: Session = Depends(get_db)):
+async def get_category_tree(db: AsyncSession = Depends(get_db)):
     """Получение дерева категорий"""
-    query = text(
-        """
-        WITH RECURSIVE category_tree AS (
-            SELECT
-                id, name, parent_id, level, path,
-                0 as depth,
-                name as full_path
-            FROM app.categories
-            WHERE parent_id IS NULL AND is_active = TRUE
-
-            UNION ALL
-
-            SELECT
-                c.id, c.name, c.parent_id, c.level, c.path,
-                ct.depth + 1,
-                ct.full_path || ' -> ' || c.name
-            FROM app.categories c
-            JOIN category_tree ct ON c.parent_id = ct.id
-            WHERE c.is_active = TRUE
-        )
-        SELECT
-            id, name, parent_id, level, path, depth, full_path
-        FROM category_tree
-        ORDER BY path
-    """
-    )
-
-    result = db.execute(query)
+    # Дерево собирается в PostgreSQL, ответ отдается без промежуточных Python-объектов
+    tree = (await db.execute(_CATEGORY_TREE_SQL)).scalar()
 
-    # Строим дерево
-    categories_dict = {}
-    root_categories = []
+    return Response(content=tree, media_type="application/json")
 
-    for row in result:
-        category_data = {
-            "id": row.id,
-            "name": row.name,
-            "parent_id": row.parent_id,
-            "level": row.level,
-            "path": row.path,
-            "children": [],
-        }
 
-        categories_dict[row.id] = category_data
-
-        if row.parent_id is None:
-            root_categories.append(category_data)
-        else:
-            if row.parent_id in categories_dict:
-                categories_dict[row.parent_id]["children"].append(category_data)
-
-    return root_categories
-
-
-@router.get("/hierarchy/", response_model=List[CategoryHierarchy])
-async def get_category_hierarchy(db: Session = Depends(get_db)):
+@router.get("/hierarchy/", response_model=List[CategoryHierarchy], response_class=StreamingResponse)
+async def get_category_hierarchy(db: AsyncSession = Depends(get_db)):
     """Получение иерархии категорий"""
-    query = text(
-        """
-        SELECT
-            id, name, level, path,
-            CASE
-                WHEN level = 0 THEN name
-                WHEN level = 1 THEN '  ' || name
-                WHEN level = 2 THEN '    ' || name
-                WHEN level = 3 THEN '      ' || name
-                ELSE REPEAT('  ', level) || name
-            END AS tree_display
-        FROM app.category_hierarchy
-        ORDER BY path
-    """
-    )
+    return stream_json(db, _CATEGORY_HIERARCHY_SQL, transform=_with_indent)
 
-    result = db.execute(query)
 
-    return [
-        CategoryHierarchy(id=row.id, name=row.name, level=row.level, path=row.path, full_path=row.tree_display)
-        for row in result
-    ]
+@router.get("/bundle/", response_model=CategoryBundle)
+async def get_category_bundle(db: AsyncSession = Depends(get_db)):
+    """Дерево, иерархия и количество дочерних категорий за один обход иерархии"""
+    result = await db.execute(_CATEGORY_BUNDLE_SQL)
 
+    return ORJSONResponse(content=_build_bundle([dict(row) for row in result.mappings()]))
 
-@router.get("/stats/", response_model=List[CategoryStats])
-async def get_category_stats(db: Session = Depends(get_db)):
-    """Статистика по категориям"""
-    query = text(
-        """
-        SELECT
-            c.id as category_id,
-            c.name as category_name,
-            COUNT(n.id) AS products_count,
-            COALESCE(SUM(n.quantity), 0) AS total_quantity,
-            COALESCE(AVG(n.price), 0) AS avg_price,
-            COALESCE(MIN(n.price), 0) AS min_price,
-            COALESCE(MAX(n.price), 0) AS max_price,
-            COALESCE(SUM(n.price * n.quantity), 0) AS total_value
-        FROM app.categories c
-        LEFT JOIN app.nomenclature n ON c.id = n.category_id AND n.is_active = TRUE
-        WHERE c.is_active = TRUE
-        GROUP BY c.id, c.name
-        ORDER BY total_value DESC NULLS LAST
-    """
-    )
 
-    result = db.execute(query)
-
-    return [
-        CategoryStats(
-            category_id=row.category_id,
-            category_name=row.category_name,
-            products_count=row.products_count,
-            total_quantity=row.total_quantity,
-            avg_price=float(row.avg_price),
-            min_price=float(row.min_price),
-            max_price=float(row.max_price),
-            total_value=float(row.total_value),
-        )
-        for row in result
-    ]
+@router.get("/stats/", response_model=List[CategoryStats], response_class=StreamingResponse)
+async def get_category_stats(db: AsyncSession = Depends(get_db)):
+    """Статистика по категориям"""
+    return stream_json(db, _CATEGORY_STATS_SQL)
@@ -2,13 +2,21 @@
 API endpoints для клиентов
 """
 
-from typing import List
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
+from app.core.cache import client_cache
 from app.core.database import get_db
+from app.core.pagination import decode_cursor, encode_cursor, set_next_link
+from app.core.responses import ORJSONResponse, stream_json
+from app.db.errors import is_unique_violation
 from app.schemas.base import PaginationParams
 from app.schemas.client import (
     ClientCreate,
@@ -20,298 +28,237 @@ from app.schemas.client import (
 
 router = APIRouter()
 
+# Фильтр активности подставляется литералом, чтобы планировщик мог выбрать частичный индекс
+_ACTIVE_FILTERS = {None: None, True: "c.is_active = TRUE", False: "c.is_active = FALSE"}
+
+# Статистика заказов считается только для строк страницы: LATERAL применяется после LIMIT/OFFSET.
+# Сумма заказа уже агрегирована в orders.total_amount (триггер update_order_total), позиции не соединяются
+_CLIENTS_LIST_TEMPLATE = """
+    SELECT page.*, stats.orders_count, stats.total_spent
+    FROM (
+        SELECT
+            c.id, c.uuid, c.name, c.email, c.phone, c.address, c.is_active,
+            c.created_at, c.updated_at, c.created_by, c.updated_by
+        FROM app.clients c
+        WHERE {where}
+        ORDER BY c.name, c.id
+        LIMIT :limit OFFSET :offset
+    ) page
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS orders_count, COALESCE(SUM(o.total_amount), 0)::float8 AS total_spent
+        FROM app.orders o
+        WHERE o.client_id = page.id AND o.status != 'cancelled'
+    ) stats
+    ORDER BY page.name, page.id
+"""
+
+
+@lru_cache(maxsize=32)
+def _clients_list_sql(conditions: Tuple[Optional[str], ...]) -> TextClause:
+    """Запрос списка для набора фильтров"""
+    return text(_CLIENTS_LIST_TEMPLATE.format(where=" AND ".join(filter(None, conditions)) or "TRUE"))
+
+
+# Один и тот же текст запроса на каждый вызов: asyncpg берет подготовленное выражение из кэша соединения
+_CLIENT_SQL = text(
+    """
+    SELECT
+        c.id, c.uuid, c.name, c.email, c.phone, c.address, c.is_active,
+        c.created_at, c.updated_at, c.created_by, c.updated_by,
+        stats.orders_count, stats.total_spent
+    FROM app.clients c
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS orders_count, COALESCE(SUM(o.total_amount), 0)::float8 AS total_spent
+        FROM app.orders o
+        WHERE o.client_id = c.id AND o.status != 'cancelled'
+    ) stats
+    WHERE c.id = :client_id
+"""
+)
+
+# Статистика читается из материализованного представления (обновляется по pg_notify)
+_CLIENT_STATS_SQL = text(
+    """
+    SELECT client_id, client_name, total_amount, orders_count, avg_order, last_order
+    FROM app.mv_client_stats
+    ORDER BY total_amount DESC
+"""
+)
+
+_CREATE_CLIENT_SQL = text(
+    """
+    INSERT INTO app.clients (name, email, phone, address, created_by)
+    VALUES (:name, :email, :phone, :address, :created_by)
+    RETURNING id, uuid, name, email, phone, address, is_active, created_at, updated_at, created_by, updated_by
+"""
+)
+
+# Одно выражение для любого набора полей: непереданные поля (NULL) остаются без изменений.
+# Статистика заказов считается в том же запросе, что и обновление
+_UPDATE_CLIENT_SQL = text(
+    """
+    WITH upd AS (
+        UPDATE app.clients
+        SET name = COALESCE(CAST(:name AS VARCHAR), name),
+            email = COALESCE(CAST(:email AS VARCHAR), email),
+            phone = COALESCE(CAST(:phone AS VARCHAR), phone),
+            address = COALESCE(CAST(:address AS TEXT), address),
+            is_active = COALESCE(CAST(:is_active AS BOOLEAN), is_active),
+            updated_by = :updated_by
+        WHERE id = :client_id
+        RETURNING id, uuid, name, email, phone, address, is_active, created_at, updated_at, created_by, updated_by
+    )
+    SELECT upd.*, stats.orders_count, stats.total_spent
+    FROM upd
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS orders_count, COALESCE(SUM(o.total_amount), 0)::float8 AS total_spent
+        FROM app.orders o
+        WHERE o.client_id = upd.id AND o.status != 'cancelled'
+    ) stats
+"""
+)
+
+_DELETE_CLIENT_SQL = text(
+    """
+    WITH target AS (
+        SELECT c.id, EXISTS (SELECT 1 FROM app.orders WHERE client_id = c.id) AS has_orders
+        FROM app.clients c
+        WHERE c.id = :client_id
+    ),
+    deleted AS (
+        DELETE FROM app.clients
+        WHERE id IN (SELECT id FROM target WHERE NOT has_orders)
+        RETURNING id
+    )
+    SELECT has_orders FROM target
+"""
+)
+
 
 @router.get("/", response_model=List[ClientResponse])
 async def get_clients(
-    db: Session = Depends(get_db), pagination: PaginationParams = Depends(), search: ClientSearch = Depends()
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    pagination: PaginationParams = Depends(),
+    search: ClientSearch = Depends(),
 ):
     """Получение списка клиентов"""
-    where_conditions = ["c.is_active = :is_active"]
-    params = {"is_active": search.is_active}
+    where_conditions = [_ACTIVE_FILTERS[search.is_active]]
+    params = {"limit": pagination.size, "offset": pagination.offset}
 
     if search.query:
         where_conditions.append("(c.name ILIKE :query OR c.email ILIKE :query OR c.phone ILIKE :query)")
         params["query"] = f"%{search.query}%"
 
-    where_clause = " AND ".join(where_conditions)
+    after = decode_cursor(pagination.after, (str, int))
+    if after is not None:
+        where_conditions.append("(c.name, c.id) > (:after_name, :after_id)")
+        params.update(after_name=after[0], after_id=after[1])
 
-    query = text(
-        f"""
-        SELECT
-            c.id, c.uuid, c.name, c.email, c.phone, c.address, c.is_active,
-            c.created_at, c.updated_at, c.created_by, c.updated_by,
-            COUNT(DISTINCT o.id) as orders_count,
-            COALESCE(SUM(oi.total_price), 0) as total_spent
-        FROM app.clients c
-        LEFT JOIN app.orders o ON c.id = o.client_id AND o.status != 'cancelled'
-        LEFT JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE {where_clause}
-        GROUP BY c.id, c.uuid, c.name, c.email, c.phone, c.address, c.is_active,
-                 c.created_at, c.updated_at, c.created_by, c.updated_by
-        ORDER BY c.name
-        LIMIT :limit OFFSET :offset
-    """
-    )
+    rows = [dict(row) for row in (await db.execute(_clients_list_sql(tuple(where_conditions)), params)).mappings()]
 
-    params.update({"limit": pagination.size, "offset": pagination.offset})
-
-    result = db.execute(query, params)
-
-    return [
-        ClientResponse(
-            id=row.id,
-            uuid=row.uuid,
-            name=row.name,
-            email=row.email,
-            phone=row.phone,
-            address=row.address,
-            is_active=row.is_active,
-            created_at=row.created_at,
-            updated_at=row.updated_at,
-            created_by=row.created_by,
-            updated_by=row.updated_by,
-            orders_count=row.orders_count,
-            total_spent=float(row.total_spent),
-        )
-        for row in result
-    ]
+    # Строки уже нужной формы: response_model используется только для документации
+    response = ORJSONResponse(rows)
+
+    if len(rows) == pagination.size:
+        last = rows[-1]
+        set_next_link(request, response, encode_cursor([last["name"], last["id"]]))
+
+    return response
 
 
 @router.get("/{client_id}", response_model=ClientResponse)
-async def get_client(client_id: int, db: Session = Depends(get_db)):
+async def get_client(client_id: int, db: AsyncSession = Depends(get_db)):
     """Получение клиента по ID"""
-    query = text(
-        """
-        SELECT
-            c.id, c.uuid, c.name, c.email, c.phone, c.address, c.is_active,
-            c.created_at, c.updated_at, c.created_by, c.updated_by,
-            COUNT(DISTINCT o.id) as orders_count,
-            COALESCE(SUM(oi.total_price), 0) as total_spent
-        FROM app.clients c
-        LEFT JOIN app.orders o ON c.id = o.client_id AND o.status != 'cancelled'
-        LEFT JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE c.id = :client_id
-        GROUP BY c.id, c.uuid, c.name, c.email, c.phone, c.address, c.is_active,
-                 c.created_at, c.updated_at, c.created_by, c.updated_by
-    """
-    )
+    client = client_cache.get(client_id)
+    if client is None:
+        result = (await db.execute(_CLIENT_SQL, {"client_id": client_id})).mappings().first()
 
-    result = db.execute(query, {"client_id": client_id}).first()
+        if not result:
+            raise HTTPException(status_code=404, detail="Клиент не найден")
 
-    if not result:
-        raise HTTPException(status_code=404, detail="Клиент не найден")
+        client = dict(result)
+        client_cache.set(client_id, client)
 
-    return ClientResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        email=result.email,
-        phone=result.phone,
-        address=result.address,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        orders_count=result.orders_count,
-        total_spent=float(result.total_spent),
-    )
+    return ORJSONResponse(client)
 
 
 @router.post("/", response_model=ClientResponse)
-async def create_client(client: ClientCreate, db: Session = Depends(get_db)):
+async def create_client(client: ClientCreate, db: AsyncSession = Depends(get_db)):
     """Создание нового клиента"""
-    # Проверяем уникальность email
-    if client.email:
-        email_query = text("SELECT id FROM app.clients WHERE email = :email")
-        existing_email = db.execute(email_query, {"email": client.email}).first()
-        if existing_email:
+    # Уникальность email обеспечивается ограничением в БД
+    try:
+        result = (
+            await db.execute(
+                _CREATE_CLIENT_SQL,
+                {
+                    "name": client.name,
+                    "email": client.email,
+                    "phone": client.phone,
+                    "address": client.address,
+                    "created_by": "api_user",
+                },
+            )
+        ).first()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e):
             raise HTTPException(status_code=400, detail="Клиент с таким email уже существует")
+        raise
 
-    # Создаем клиента
-    insert_query = text(
-        """
-        INSERT INTO app.clients (name, email, phone, address, created_by)
-        VALUES (:name, :email, :phone, :address, :created_by)
-        RETURNING id, uuid, name, email, phone, address, is_active, created_at, updated_at, created_by, updated_by
-    """
-    )
+    await db.commit()
 
-    result = db.execute(
-        insert_query,
-        {
-            "name": client.name,
-            "email": client.email,
-            "phone": client.phone,
-            "address": client.address,
-            "created_by": "api_user",
-        },
-    ).first()
-
-    db.commit()
-
-    return ClientResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        email=result.email,
-        phone=result.phone,
-        address=result.address,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        orders_count=0,
-        total_spent=0.0,
-    )
+    # Новый клиент без заказов; строка уже типизирована БД, повторная валидация не нужна
+    return ClientResponse.model_construct(**result._mapping, orders_count=0, total_spent=0.0)
 
 
 @router.put("/{client_id}", response_model=ClientResponse)
-async def update_client(client_id: int, client_update: ClientUpdate, db: Session = Depends(get_db)):
+async def update_client(client_id: int, client_update: ClientUpdate, db: AsyncSession = Depends(get_db)):
     """Обновление клиента"""
-    # Проверяем существование клиента
-    check_query = text("SELECT id FROM app.clients WHERE id = :client_id")
-    existing = db.execute(check_query, {"client_id": client_id}).first()
-
-    if not existing:
-        raise HTTPException(status_code=404, detail="Клиент не найден")
-
-    # Проверяем уникальность email
-    if client_update.email:
-        email_query = text("SELECT id FROM app.clients WHERE email = :email AND id != :client_id")
-        existing_email = db.execute(email_query, {"email": client_update.email, "client_id": client_id}).first()
-        if existing_email:
-            raise HTTPException(status_code=400, detail="Клиент с таким email уже существует")
-
-    # Обновляем клиента
-    update_fields = []
-    update_values = {"client_id": client_id}
-
-    if client_update.name is not None:
-        update_fields.append("name = :name")
-        update_values["name"] = client_update.name
-
-    if client_update.email is not None:
-        update_fields.append("email = :email")
-        update_values["email"] = client_update.email
-
-    if client_update.phone is not None:
-        update_fields.append("phone = :phone")
-        update_values["phone"] = client_update.phone
+    update_values = client_update.model_dump()
 
-    if client_update.address is not None:
-        update_fields.append("address = :address")
-        update_values["address"] = client_update.address
-
-    if client_update.is_active is not None:
-        update_fields.append("is_active = :is_active")
-        update_values["is_active"] = client_update.is_active
-
-    if not update_fields:
+    if all(value is None for value in update_values.values()):
         raise HTTPException(status_code=400, detail="Нет данных для обновления")
 
-    update_query = text(
-        f"""
-        UPDATE app.clients
-        SET {', '.join(update_fields)}, updated_by = :updated_by
-        WHERE id = :client_id
-        RETURNING id, uuid, name, email, phone, address, is_active, created_at, updated_at, created_by, updated_by
-    """
-    )
+    update_values.update(client_id=client_id, updated_by="api_user")
 
-    update_values["updated_by"] = "api_user"
+    # Существование проверяется самим UPDATE: нет строки - нет клиента
+    try:
+        result = (await db.execute(_UPDATE_CLIENT_SQL, update_values)).first()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e):
+            raise HTTPException(status_code=400, detail="Клиент с таким email уже существует")
+        raise
 
-    result = db.execute(update_query, update_values).first()
-    db.commit()
+    if not result:
+        raise HTTPException(status_code=404, detail="Клиент не найден")
 
-    # Получаем статистику
-    stats_query = text(
-        """
-        SELECT
-            COUNT(DISTINCT o.id) as orders_count,
-            COALESCE(SUM(oi.total_price), 0) as total_spent
-        FROM app.orders o
-        LEFT JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE o.client_id = :client_id AND o.status != 'cancelled'
-    """
-    )
+    await db.commit()
+    client_cache.delete(client_id)
 
-    stats = db.execute(stats_query, {"client_id": client_id}).first()
-
-    return ClientResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        email=result.email,
-        phone=result.phone,
-        address=result.address,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        orders_count=stats.orders_count,
-        total_spent=float(stats.total_spent),
-    )
+    return ClientResponse.model_construct(**result._mapping)
 
 
 @router.delete("/{client_id}")
-async def delete_client(client_id: int, db: Session = Depends(get_db)):
+async def delete_client(client_id: int, db: AsyncSession = Depends(get_db)):
     """Удаление клиента"""
-    # Проверяем существование клиента
-    check_query = text("SELECT id FROM app.clients WHERE id = :client_id")
-    existing = db.execute(check_query, {"client_id": client_id}).first()
+    # Проверки и удаление выполняются одним запросом
+    result = (await db.execute(_DELETE_CLIENT_SQL, {"client_id": client_id})).first()
 
-    if not existing:
+    if not result:
         raise HTTPException(status_code=404, detail="Клиент не найден")
 
-    # Проверяем наличие заказов
-    orders_query = text("SELECT COUNT(*) FROM app.orders WHERE client_id = :client_id")
-    orders_count = db.execute(orders_query, {"client_id": client_id}).scalar()
-
-    if orders_count > 0:
+    if result.has_orders:
         raise HTTPException(status_code=400, detail="Нельзя удалить клиента с заказами")
 
-    # Удаляем клиента
-    delete_query = text("DELETE FROM app.clients WHERE id = :client_id")
-    db.execute(delete_query, {"client_id": client_id})
-    db.commit()
+    await db.commit()
+    client_cache.delete(client_id)
 
     return {"message": "Клиент удален"}
 
 
-@router.get("/stats/", response_model=List[ClientStats])
-async def get_client_stats(db: Session = Depends(get_db)):
+@router.get("/stats/", response_model=List[ClientStats], response_class=StreamingResponse)
+async def get_client_stats(db: AsyncSession = Depends(get_db)):
     """Статистика по клиентам"""
-    query = text(
-        """
-        SELECT
-            c.id as client_id,
-            c.name as client_name,
-            COALESCE(SUM(oi.total_price), 0) AS total_amount,
-            COUNT(DISTINCT o.id) AS orders_count,
-            COALESCE(AVG(oi.total_price), 0) AS avg_order,
-            MAX(o.order_date) AS last_order
-        FROM app.clients c
-        LEFT JOIN app.orders o ON c.id = o.client_id AND o.status != 'cancelled'
-        LEFT JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE c.is_active = TRUE
-        GROUP BY c.id, c.name
-        ORDER BY total_amount DESC
-    """
-    )
-
-    result = db.execute(query)
-
-    return [
-        ClientStats(
-            client_id=row.client_id,
-            client_name=row.client_name,
-            total_amount=float(row.total_amount),
-            orders_count=row.orders_count,
-            avg_order=float(row.avg_order),
-            last_order=row.last_order,
-        )
-        for row in result
-    ]
+    return stream_json(db, _CLIENT_STATS_SQL)
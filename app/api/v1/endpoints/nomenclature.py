@@ -2,13 +2,21 @@
 API endpoints для номенклатуры
 """
 
-from typing import List
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
+from app.core.cache import nomenclature_cache
 from app.core.database import get_db
+from app.core.pagination import decode_cursor, encode_cursor, set_next_link
+from app.core.responses import ORJSONResponse, stream_json
+from app.db.errors import is_unique_violation
 from app.schemas.base import PaginationParams
 from app.schemas.nomenclature import (
     NomenclatureCreate,
@@ -20,14 +28,122 @@ from app.schemas.nomenclature import (
 
 router = APIRouter()
 
+_ACTIVE_FILTERS = {None: None, True: "n.is_active = TRUE", False: "n.is_active = FALSE"}
+
+_NOMENCLATURE_LIST_TEMPLATE = """
+    SELECT
+        n.id, n.uuid, n.name, n.description, n.sku, n.quantity, n.price, n.cost,
+        n.category_id, n.is_active, n.created_at, n.updated_at, n.created_by, n.updated_by,
+        c.name as category_name
+    FROM app.nomenclature n
+    JOIN app.categories c ON n.category_id = c.id
+    WHERE {where}
+    ORDER BY n.name, n.id
+    LIMIT :limit OFFSET :offset
+"""
+
+
+@lru_cache(maxsize=256)
+def _nomenclature_list_sql(conditions: Tuple[Optional[str], ...]) -> TextClause:
+    """Запрос списка для набора фильтров (набор условий конечен, запрос собирается один раз)"""
+    return text(_NOMENCLATURE_LIST_TEMPLATE.format(where=" AND ".join(filter(None, conditions)) or "TRUE"))
+
+
+_NOMENCLATURE_EXISTS_SQL = text("SELECT EXISTS (SELECT 1 FROM app.nomenclature WHERE id = :nomenclature_id)")
+
+_NOMENCLATURE_ITEM_SQL = text(
+    """
+    SELECT
+        n.id, n.uuid, n.name, n.description, n.sku, n.quantity, n.price, n.cost,
+        n.category_id, n.is_active, n.created_at, n.updated_at, n.created_by, n.updated_by,
+        c.name as category_name
+    FROM app.nomenclature n
+    JOIN app.categories c ON n.category_id = c.id
+    WHERE n.id = :nomenclature_id
+"""
+)
+
+# Статистика читается из материализованного представления (обновляется по pg_notify)
+_NOMENCLATURE_STATS_SQL = text(
+    """
+    SELECT nomenclature_id, name, sku, category_name, total_sold, total_revenue, orders_count, avg_price
+    FROM app.mv_nomenclature_stats
+    ORDER BY total_revenue DESC
+"""
+)
+
+_CREATE_NOMENCLATURE_SQL = text(
+    """
+    WITH ins AS (
+        INSERT INTO app.nomenclature (name, description, sku, quantity, price, cost, category_id, created_by)
+        SELECT :name, :description, :sku, :quantity, :price, :cost, id, :created_by
+        FROM app.categories
+        WHERE id = :category_id AND is_active = TRUE
+        RETURNING id, uuid, name, description, sku, quantity, price, cost, category_id, is_active,
+                  created_at, updated_at, created_by, updated_by
+    )
+    SELECT ins.*, c.name AS category_name
+    FROM ins
+    JOIN app.categories c ON c.id = ins.category_id
+"""
+)
+
+# Одно выражение для любого набора полей: непереданные поля (NULL) остаются без изменений.
+# Проверка активной категории выполняется в том же запросе, что и обновление
+_UPDATE_NOMENCLATURE_SQL = text(
+    """
+    WITH upd AS (
+        UPDATE app.nomenclature
+        SET name = COALESCE(CAST(:name AS VARCHAR), name),
+            description = COALESCE(CAST(:description AS TEXT), description),
+            sku = COALESCE(CAST(:sku AS VARCHAR), sku),
+            quantity = COALESCE(CAST(:quantity AS INTEGER), quantity),
+            price = COALESCE(CAST(:price AS NUMERIC), price),
+            cost = COALESCE(CAST(:cost AS NUMERIC), cost),
+            category_id = COALESCE(CAST(:category_id AS INTEGER), category_id),
+            is_active = COALESCE(CAST(:is_active AS BOOLEAN), is_active),
+            updated_by = :updated_by
+        WHERE id = :nomenclature_id
+          AND (
+              CAST(:category_id AS INTEGER) IS NULL
+              OR EXISTS (SELECT 1 FROM app.categories WHERE id = CAST(:category_id AS INTEGER) AND is_active = TRUE)
+          )
+        RETURNING id, uuid, name, description, sku, quantity, price, cost, category_id, is_active,
+                  created_at, updated_at, created_by, updated_by
+    )
+    SELECT upd.*, c.name AS category_name
+    FROM upd
+    JOIN app.categories c ON c.id = upd.category_id
+"""
+)
+
+_DELETE_NOMENCLATURE_SQL = text(
+    """
+    WITH target AS (
+        SELECT n.id, EXISTS (SELECT 1 FROM app.order_items WHERE nomenclature_id = n.id) AS in_orders
+        FROM app.nomenclature n
+        WHERE n.id = :nomenclature_id
+    ),
+    deleted AS (
+        DELETE FROM app.nomenclature
+        WHERE id IN (SELECT id FROM target WHERE NOT in_orders)
+        RETURNING id
+    )
+    SELECT in_orders FROM target
+"""
+)
+
 
 @router.get("/", response_model=List[NomenclatureResponse])
 async def get_nomenclature(
-    db: Session = Depends(get_db), pagination: PaginationParams = Depends(), search: NomenclatureSearch = Depends()
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    pagination: PaginationParams = Depends(),
+    search: NomenclatureSearch = Depends(),
 ):
     """Получение списка номенклатуры"""
-    where_conditions = ["n.is_active = :is_active"]
-    params = {"is_active": search.is_active}
+    where_conditions = [_ACTIVE_FILTERS[search.is_active]]
+    params = {"limit": pagination.size, "offset": pagination.offset}
 
     if search.query:
         where_conditions.append("(n.name ILIKE :query OR n.sku ILIKE :query OR n.description ILIKE :query)")
@@ -48,314 +164,126 @@ async def get_nomenclature(
     if search.in_stock:
         where_conditions.append("n.quantity > 0")
 
-    where_clause = " AND ".join(where_conditions)
+    after = decode_cursor(pagination.after, (str, int))
+    if after is not None:
+        where_conditions.append("(n.name, n.id) > (:after_name, :after_id)")
+        params.update(after_name=after[0], after_id=after[1])
 
-    query = text(
-        f"""
-        SELECT
-            n.id, n.uuid, n.name, n.description, n.sku, n.quantity, n.price, n.cost,
-            n.category_id, n.is_active, n.created_at, n.updated_at, n.created_by, n.updated_by,
-            c.name as category_name
-        FROM app.nomenclature n
-        JOIN app.categories c ON n.category_id = c.id
-        WHERE {where_clause}
-        ORDER BY n.name
-        LIMIT :limit OFFSET :offset
-    """
-    )
+    rows = [dict(row) for row in (await db.execute(_nomenclature_list_sql(tuple(where_conditions)), params)).mappings()]
 
-    params.update({"limit": pagination.size, "offset": pagination.offset})
-
-    result = db.execute(query, params)
-
-    return [
-        NomenclatureResponse(
-            id=row.id,
-            uuid=row.uuid,
-            name=row.name,
-            description=row.description,
-            sku=row.sku,
-            quantity=row.quantity,
-            price=row.price,
-            cost=row.cost,
-            category_id=row.category_id,
-            is_active=row.is_active,
-            created_at=row.created_at,
-            updated_at=row.updated_at,
-            created_by=row.created_by,
-            updated_by=row.updated_by,
-            category_name=row.category_name,
-        )
-        for row in result
-    ]
+    # Строки уже нужной формы: response_model используется только для документации
+    response = ORJSONResponse(rows)
+
+    if len(rows) == pagination.size:
+        last = rows[-1]
+        set_next_link(request, response, encode_cursor([last["name"], last["id"]]))
+
+    return response
 
 
 @router.get("/{nomenclature_id}", response_model=NomenclatureResponse)
-async def get_nomenclature_item(nomenclature_id: int, db: Session = Depends(get_db)):
+async def get_nomenclature_item(nomenclature_id: int, db: AsyncSession = Depends(get_db)):
     """Получение товара по ID"""
-    query = text(
-        """
-        SELECT
-            n.id, n.uuid, n.name, n.description, n.sku, n.quantity, n.price, n.cost,
-            n.category_id, n.is_active, n.created_at, n.updated_at, n.created_by, n.updated_by,
-            c.name as category_name
-        FROM app.nomenclature n
-        JOIN app.categories c ON n.category_id = c.id
-        WHERE n.id = :nomenclature_id
-    """
-    )
+    item = nomenclature_cache.get(nomenclature_id)
+    if item is None:
+        result = (await db.execute(_NOMENCLATURE_ITEM_SQL, {"nomenclature_id": nomenclature_id})).mappings().first()
 
-    result = db.execute(query, {"nomenclature_id": nomenclature_id}).first()
+        if not result:
+            raise HTTPException(status_code=404, detail="Товар не найден")
 
-    if not result:
-        raise HTTPException(status_code=404, detail="Товар не найден")
+        item = dict(result)
+        nomenclature_cache.set(nomenclature_id, item)
 
-    return NomenclatureResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        description=result.description,
-        sku=result.sku,
-        quantity=result.quantity,
-        price=result.price,
-        cost=result.cost,
-        category_id=result.category_id,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        category_name=result.category_name,
-    )
+    return ORJSONResponse(item)
 
 
 @router.post("/", response_model=NomenclatureResponse)
-async def create_nomenclature(nomenclature: NomenclatureCreate, db: Session = Depends(get_db)):
+async def create_nomenclature(nomenclature: NomenclatureCreate, db: AsyncSession = Depends(get_db)):
     """Создание нового товара"""
-    # Проверяем существование категории
-    category_query = text("SELECT id FROM app.categories WHERE id = :category_id AND is_active = TRUE")
-    category_result = db.execute(category_query, {"category_id": nomenclature.category_id}).first()
-    if not category_result:
-        raise HTTPException(status_code=400, detail="Категория не найдена")
-
-    # Проверяем уникальность SKU
-    if nomenclature.sku:
-        sku_query = text("SELECT id FROM app.nomenclature WHERE sku = :sku")
-        existing_sku = db.execute(sku_query, {"sku": nomenclature.sku}).first()
-        if existing_sku:
+    # Проверка активной категории выполняется в том же запросе, что и вставка,
+    # уникальность SKU обеспечивается ограничением в БД; название категории возвращается тем же запросом
+    try:
+        result = (
+            await db.execute(
+                _CREATE_NOMENCLATURE_SQL,
+                {
+                    "name": nomenclature.name,
+                    "description": nomenclature.description,
+                    "sku": nomenclature.sku,
+                    "quantity": nomenclature.quantity,
+                    "price": nomenclature.price,
+                    "cost": nomenclature.cost,
+                    "category_id": nomenclature.category_id,
+                    "created_by": "api_user",
+                },
+            )
+        ).first()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e):
             raise HTTPException(status_code=400, detail="Товар с таким артикулом уже существует")
+        raise
 
-    # Создаем товар
-    insert_query = text(
-        """
-        INSERT INTO app.nomenclature (name, description, sku, quantity, price, cost, category_id, created_by)
-        VALUES (:name, :description, :sku, :quantity, :price, :cost, :category_id, :created_by)
-        RETURNING id, uuid, name, description, sku, quantity, price, cost, category_id, is_active, created_at, updated_at, created_by, updated_by
-    """
-    )
+    if not result:
+        raise HTTPException(status_code=400, detail="Категория не найдена")
 
-    result = db.execute(
-        insert_query,
-        {
-            "name": nomenclature.name,
-            "description": nomenclature.description,
-            "sku": nomenclature.sku,
-            "quantity": nomenclature.quantity,
-            "price": nomenclature.price,
-            "cost": nomenclature.cost,
-            "category_id": nomenclature.category_id,
-            "created_by": "api_user",
-        },
-    ).first()
-
-    db.commit()
-
-    # Получаем название категории
-    category_name_query = text("SELECT name FROM app.categories WHERE id = :category_id")
-    category_name = db.execute(category_name_query, {"category_id": nomenclature.category_id}).scalar()
-
-    return NomenclatureResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        description=result.description,
-        sku=result.sku,
-        quantity=result.quantity,
-        price=result.price,
-        cost=result.cost,
-        category_id=result.category_id,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        category_name=category_name,
-    )
+    await db.commit()
+
+    return NomenclatureResponse.model_construct(**result._mapping)
 
 
 @router.put("/{nomenclature_id}", response_model=NomenclatureResponse)
 async def update_nomenclature(
-    nomenclature_id: int, nomenclature_update: NomenclatureUpdate, db: Session = Depends(get_db)
+    nomenclature_id: int, nomenclature_update: NomenclatureUpdate, db: AsyncSession = Depends(get_db)
 ):
     """Обновление товара"""
-    # Проверяем существование товара
-    check_query = text("SELECT id FROM app.nomenclature WHERE id = :nomenclature_id")
-    existing = db.execute(check_query, {"nomenclature_id": nomenclature_id}).first()
-
-    if not existing:
-        raise HTTPException(status_code=404, detail="Товар не найден")
-
-    # Проверяем категорию
-    if nomenclature_update.category_id:
-        category_query = text("SELECT id FROM app.categories WHERE id = :category_id AND is_active = TRUE")
-        category_result = db.execute(category_query, {"category_id": nomenclature_update.category_id}).first()
-        if not category_result:
-            raise HTTPException(status_code=400, detail="Категория не найдена")
-
-    # Проверяем уникальность SKU
-    if nomenclature_update.sku:
-        sku_query = text("SELECT id FROM app.nomenclature WHERE sku = :sku AND id != :nomenclature_id")
-        existing_sku = db.execute(
-            sku_query, {"sku": nomenclature_update.sku, "nomenclature_id": nomenclature_id}
-        ).first()
-        if existing_sku:
-            raise HTTPException(status_code=400, detail="Товар с таким артикулом уже существует")
-
-    # Обновляем товар
-    update_fields = []
-    update_values = {"nomenclature_id": nomenclature_id}
-
-    if nomenclature_update.name is not None:
-        update_fields.append("name = :name")
-        update_values["name"] = nomenclature_update.name
+    update_values = nomenclature_update.model_dump()
 
-    if nomenclature_update.description is not None:
-        update_fields.append("description = :description")
-        update_values["description"] = nomenclature_update.description
-
-    if nomenclature_update.sku is not None:
-        update_fields.append("sku = :sku")
-        update_values["sku"] = nomenclature_update.sku
-
-    if nomenclature_update.quantity is not None:
-        update_fields.append("quantity = :quantity")
-        update_values["quantity"] = nomenclature_update.quantity
-
-    if nomenclature_update.price is not None:
-        update_fields.append("price = :price")
-        update_values["price"] = nomenclature_update.price
-
-    if nomenclature_update.cost is not None:
-        update_fields.append("cost = :cost")
-        update_values["cost"] = nomenclature_update.cost
+    if all(value is None for value in update_values.values()):
+        raise HTTPException(status_code=400, detail="Нет данных для обновления")
 
-    if nomenclature_update.category_id is not None:
-        update_fields.append("category_id = :category_id")
-        update_values["category_id"] = nomenclature_update.category_id
+    update_values.update(nomenclature_id=nomenclature_id, updated_by="api_user")
 
-    if nomenclature_update.is_active is not None:
-        update_fields.append("is_active = :is_active")
-        update_values["is_active"] = nomenclature_update.is_active
+    # Существование товара и категории проверяется самим UPDATE, уникальность SKU - ограничением в БД
+    try:
+        result = (await db.execute(_UPDATE_NOMENCLATURE_SQL, update_values)).first()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e):
+            raise HTTPException(status_code=400, detail="Товар с таким артикулом уже существует")
+        raise
 
-    if not update_fields:
-        raise HTTPException(status_code=400, detail="Нет данных для обновления")
+    if not result:
+        # Определяем причину отказа только в неуспешной ветке
+        if not (await db.execute(_NOMENCLATURE_EXISTS_SQL, {"nomenclature_id": nomenclature_id})).scalar():
+            raise HTTPException(status_code=404, detail="Товар не найден")
+        raise HTTPException(status_code=400, detail="Категория не найдена")
 
-    update_query = text(
-        f"""
-        UPDATE app.nomenclature
-        SET {', '.join(update_fields)}, updated_by = :updated_by
-        WHERE id = :nomenclature_id
-        RETURNING id, uuid, name, description, sku, quantity, price, cost, category_id, is_active, created_at, updated_at, created_by, updated_by
-    """
-    )
+    await db.commit()
+    nomenclature_cache.delete(nomenclature_id)
 
-    update_values["updated_by"] = "api_user"
-
-    result = db.execute(update_query, update_values).first()
-    db.commit()
-
-    # Получаем название категории
-    category_name_query = text("SELECT name FROM app.categories WHERE id = :category_id")
-    category_name = db.execute(category_name_query, {"category_id": result.category_id}).scalar()
-
-    return NomenclatureResponse(
-        id=result.id,
-        uuid=result.uuid,
-        name=result.name,
-        description=result.description,
-        sku=result.sku,
-        quantity=result.quantity,
-        price=result.price,
-        cost=result.cost,
-        category_id=result.category_id,
-        is_active=result.is_active,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        category_name=category_name,
-    )
+    return NomenclatureResponse.model_construct(**result._mapping)
 
 
 @router.delete("/{nomenclature_id}")
-async def delete_nomenclature(nomenclature_id: int, db: Session = Depends(get_db)):
+async def delete_nomenclature(nomenclature_id: int, db: AsyncSession = Depends(get_db)):
     """Удаление товара"""
-    # Проверяем существование товара
-    check_query = text("SELECT id FROM app.nomenclature WHERE id = :nomenclature_id")
-    existing = db.execute(check_query, {"nomenclature_id": nomenclature_id}).first()
+    # Проверки и удаление выполняются одним запросом
+    result = (await db.execute(_DELETE_NOMENCLATURE_SQL, {"nomenclature_id": nomenclature_id})).first()
 
-    if not existing:
+    if not result:
         raise HTTPException(status_code=404, detail="Товар не найден")
 
-    # Проверяем наличие в заказах
-    orders_query = text("SELECT COUNT(*) FROM app.order_items WHERE nomenclature_id = :nomenclature_id")
-    orders_count = db.execute(orders_query, {"nomenclature_id": nomenclature_id}).scalar()
-
-    if orders_count > 0:
+    if result.in_orders:
         raise HTTPException(status_code=400, detail="Нельзя удалить товар, который есть в заказах")
 
-    # Удаляем товар
-    delete_query = text("DELETE FROM app.nomenclature WHERE id = :nomenclature_id")
-    db.execute(delete_query, {"nomenclature_id": nomenclature_id})
-    db.commit()
+    await db.commit()
+    nomenclature_cache.delete(nomenclature_id)
 
     return {"message": "Товар удален"}
 
 
-@router.get("/stats/", response_model=List[NomenclatureStats])
-async def get_nomenclature_stats(db: Session = Depends(get_db)):
+@router.get("/stats/", response_model=List[NomenclatureStats], response_class=StreamingResponse)
+async def get_nomenclature_stats(db: AsyncSession = Depends(get_db)):
     """Статистика по номенклатуре"""
-    query = text(
-        """
-        SELECT
-            n.id as nomenclature_id,
-            n.name,
-            n.sku,
-            c.name as category_name,
-            COALESCE(SUM(oi.quantity), 0) AS total_sold,
-            COALESCE(SUM(oi.total_price), 0) AS total_revenue,
-            COUNT(DISTINCT o.id) AS orders_count
-        FROM app.nomenclature n
-        JOIN app.categories c ON n.category_id = c.id
-        LEFT JOIN app.order_items oi ON n.id = oi.nomenclature_id
-        LEFT JOIN app.orders o ON oi.order_id = o.id AND o.status != 'cancelled'
-        WHERE n.is_active = TRUE
-        GROUP BY n.id, n.name, n.sku, c.name
-        ORDER BY total_revenue DESC
-    """
-    )
-
-    result = db.execute(query)
-
-    return [
-        NomenclatureStats(
-            nomenclature_id=row.nomenclature_id,
-            name=row.name,
-            sku=row.sku,
-            category_name=row.category_name,
-            total_sold=row.total_sold,
-            total_revenue=row.total_revenue,
-            orders_count=row.orders_count,
-        )
-        for row in result
-    ]
+    return stream_json(db, _NOMENCLATURE_STATS_SQL)
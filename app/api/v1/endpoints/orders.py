@@ -3,18 +3,21 @@ API endpoints для заказов
 """
 
 from datetime import datetime
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
+from app.core.cache import cached, client_cache, nomenclature_cache
 from app.core.database import get_db
+from app.core.responses import ORJSONResponse, json_response
 from app.schemas.base import PaginationParams
 from app.schemas.order import (
     OrderCreate,
     OrderDetail,
-    OrderItemResponse,
     OrderResponse,
     OrderSearch,
     OrderStats,
@@ -23,10 +26,158 @@ from app.schemas.order import (
 
 router = APIRouter()
 
+_ORDERS_LIST_TEMPLATE = """
+    SELECT
+        o.id, o.uuid, o.client_id, o.order_number, o.order_date, o.total_amount,
+        o.status, o.payment_status, o.notes, o.created_at, o.updated_at, o.created_by, o.updated_by,
+        o.items_count,
+        c.name as client_name
+    FROM app.orders o
+    JOIN app.clients c ON o.client_id = c.id
+    WHERE {where}
+    ORDER BY o.order_date DESC, o.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+# Семь необязательных фильтров дают не больше 2^7 вариантов текста запроса
+@lru_cache(maxsize=128)
+def _orders_list_sql(conditions: Tuple[str, ...]) -> TextClause:
+    """Запрос списка для набора фильтров"""
+    return text(_ORDERS_LIST_TEMPLATE.format(where=" AND ".join(conditions) or "TRUE"))
+
+
+_ORDER_SQL = text(
+    """
+    SELECT
+        o.id, o.uuid, o.client_id, o.order_number, o.order_date, o.total_amount,
+        o.status, o.payment_status, o.notes, o.created_at, o.updated_at, o.created_by, o.updated_by,
+        c.name as client_name
+    FROM app.orders o
+    JOIN app.clients c ON o.client_id = c.id
+    WHERE o.id = :order_id
+"""
+)
+
+_ORDER_ITEMS_SQL = text(
+    """
+    SELECT
+        oi.id, oi.uuid, oi.order_id, oi.nomenclature_id, oi.quantity, oi.price, oi.total_price,
+        oi.created_at, oi.created_by,
+        n.name as nomenclature_name,
+        n.sku as nomenclature_sku
+    FROM app.order_items oi
+    JOIN app.nomenclature n ON oi.nomenclature_id = n.id
+    WHERE oi.order_id = :order_id
+    ORDER BY oi.id
+"""
+)
+
+_CLIENT_NAME_SQL = text("SELECT name FROM app.clients WHERE id = :client_id AND is_active = TRUE")
+
+# Все товары заказа читаются и блокируются одним запросом. Блокировки берутся по возрастанию id,
+# поэтому параллельные заказы с общими товарами ждут друг друга, а не попадают в deadlock
+_LOCK_NOMENCLATURE_SQL = text(
+    """
+    SELECT id, quantity, price FROM app.nomenclature
+    WHERE id = ANY(:nomenclature_ids) AND is_active = TRUE
+    ORDER BY id
+    FOR UPDATE
+"""
+)
+
+_CREATE_ORDER_SQL = text(
+    """
+    INSERT INTO app.orders (client_id, order_date, status, payment_status, notes, created_by)
+    VALUES (:client_id, :order_date, :status, :payment_status, :notes, :created_by)
+    RETURNING id, uuid, client_id, order_number, order_date, status, payment_status, notes, created_at, updated_at, created_by, updated_by
+"""
+)
+
+# Все позиции заказа вставляются одним многострочным INSERT: колонки передаются массивами.
+# Сумма заказа пересчитывается триггером уже после RETURNING заказа, поэтому для ответа
+# она складывается из total_price вставленных позиций
+_CREATE_ORDER_ITEMS_SQL = text(
+    """
+    WITH ins AS (
+        INSERT INTO app.order_items (order_id, nomenclature_id, quantity, price, created_by)
+        SELECT :order_id, v.nomenclature_id, v.quantity, v.price, :created_by
+        FROM unnest(
+            CAST(:nomenclature_ids AS INTEGER[]),
+            CAST(:quantities AS INTEGER[]),
+            CAST(:prices AS NUMERIC[])
+        ) AS v(nomenclature_id, quantity, price)
+        RETURNING total_price
+    )
+    SELECT SUM(total_price) FROM ins
+"""
+)
+
+_WRITE_OFF_STOCK_SQL = text(
+    """
+    UPDATE app.nomenclature n
+    SET quantity = n.quantity - v.quantity, updated_by = :updated_by
+    FROM unnest(CAST(:nomenclature_ids AS INTEGER[]), CAST(:quantities AS INTEGER[])) AS v(id, quantity)
+    WHERE n.id = v.id
+"""
+)
+
+_ORDER_EXISTS_SQL = text("SELECT id, client_id, status FROM app.orders WHERE id = :order_id")
+
+# Одно выражение для любого набора полей: непереданные поля (NULL) остаются без изменений.
+# Имя клиента для ответа читается в том же запросе, что и обновление
+_UPDATE_ORDER_SQL = text(
+    """
+    WITH upd AS (
+        UPDATE app.orders
+        SET status = COALESCE(CAST(:status AS VARCHAR), status),
+            payment_status = COALESCE(CAST(:payment_status AS VARCHAR), payment_status),
+            notes = COALESCE(CAST(:notes AS TEXT), notes),
+            updated_by = :updated_by
+        WHERE id = :order_id
+        RETURNING id, uuid, client_id, order_number, order_date, total_amount, items_count, status, payment_status, notes, created_at, updated_at, created_by, updated_by
+    )
+    SELECT upd.*, c.name AS client_name
+    FROM upd
+    JOIN app.clients c ON c.id = upd.client_id
+"""
+)
+
+# Позиции заказа возвращаются на склад одним запросом (по товару суммарно)
+_RETURN_STOCK_SQL = text(
+    """
+    UPDATE app.nomenclature n
+    SET quantity = n.quantity + oi.quantity, updated_by = :updated_by
+    FROM (
+        SELECT nomenclature_id, SUM(quantity) AS quantity
+        FROM app.order_items
+        WHERE order_id = :order_id
+        GROUP BY nomenclature_id
+    ) oi
+    WHERE n.id = oi.nomenclature_id
+    RETURNING n.id
+"""
+)
+
+_DELETE_ORDER_SQL = text("DELETE FROM app.orders WHERE id = :order_id")
+
+_ORDER_STATS_SQL = text(
+    """
+    SELECT
+        COUNT(*) as total_orders,
+        COALESCE(SUM(total_amount), 0) as total_amount,
+        COALESCE(AVG(total_amount), 0) as avg_order,
+        COUNT(*) FILTER (WHERE status = 'pending') as pending_orders,
+        COUNT(*) FILTER (WHERE status = 'completed') as completed_orders
+    FROM app.orders
+    WHERE status != 'cancelled'
+"""
+)
+
 
 @router.get("/", response_model=List[OrderResponse])
 async def get_orders(
-    db: Session = Depends(get_db), pagination: PaginationParams = Depends(), search: OrderSearch = Depends()
+    db: AsyncSession = Depends(get_db), pagination: PaginationParams = Depends(), search: OrderSearch = Depends()
 ):
     """Получение списка заказов"""
     where_conditions = []
@@ -60,147 +211,50 @@ async def get_orders(
         where_conditions.append("o.total_amount <= :max_amount")
         params["max_amount"] = search.max_amount
 
-    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-
-    query = text(
-        f"""
-        SELECT
-            o.id, o.uuid, o.client_id, o.order_number, o.order_date, o.total_amount,
-            o.status, o.payment_status, o.notes, o.created_at, o.updated_at, o.created_by, o.updated_by,
-            c.name as client_name,
-            COUNT(oi.id) as items_count
-        FROM app.orders o
-        JOIN app.clients c ON o.client_id = c.id
-        LEFT JOIN app.order_items oi ON o.id = oi.order_id
-        WHERE {where_clause}
-        GROUP BY o.id, o.uuid, o.client_id, o.order_number, o.order_date, o.total_amount,
-                 o.status, o.payment_status, o.notes, o.created_at, o.updated_at, o.created_by, o.updated_by,
-                 c.name
-        ORDER BY o.order_date DESC
-        LIMIT :limit OFFSET :offset
-    """
-    )
-
     params.update({"limit": pagination.size, "offset": pagination.offset})
 
-    result = db.execute(query, params)
-
-    return [
-        OrderResponse(
-            id=row.id,
-            uuid=row.uuid,
-            client_id=row.client_id,
-            order_number=row.order_number,
-            order_date=row.order_date,
-            total_amount=row.total_amount,
-            status=row.status,
-            payment_status=row.payment_status,
-            notes=row.notes,
-            created_at=row.created_at,
-            updated_at=row.updated_at,
-            created_by=row.created_by,
-            updated_by=row.updated_by,
-            client_name=row.client_name,
-            items_count=row.items_count,
-            items=[],  # Будет заполнено в детальном запросе
-        )
-        for row in result
-    ]
+    result = await db.execute(_orders_list_sql(tuple(where_conditions)), params)
+
+    # Строки уже нужной формы: response_model используется только для документации
+    return ORJSONResponse([dict(row) for row in result.mappings()])
 
 
 @router.get("/{order_id}", response_model=OrderDetail)
-async def get_order(order_id: int, db: Session = Depends(get_db)):
+async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
     """Получение заказа по ID"""
     # Получаем основную информацию о заказе
-    order_query = text(
-        """
-        SELECT
-            o.id, o.uuid, o.client_id, o.order_number, o.order_date, o.total_amount,
-            o.status, o.payment_status, o.notes, o.created_at, o.updated_at, o.created_by, o.updated_by,
-            c.name as client_name
-        FROM app.orders o
-        JOIN app.clients c ON o.client_id = c.id
-        WHERE o.id = :order_id
-    """
-    )
-
-    order_result = db.execute(order_query, {"order_id": order_id}).first()
+    order_result = (await db.execute(_ORDER_SQL, {"order_id": order_id})).mappings().first()
 
     if not order_result:
         raise HTTPException(status_code=404, detail="Заказ не найден")
 
     # Получаем позиции заказа
-    items_query = text(
-        """
-        SELECT
-            oi.id, oi.uuid, oi.order_id, oi.nomenclature_id, oi.quantity, oi.price, oi.total_price,
-            oi.created_at, oi.created_by,
-            n.name as nomenclature_name,
-            n.sku as nomenclature_sku
-        FROM app.order_items oi
-        JOIN app.nomenclature n ON oi.nomenclature_id = n.id
-        WHERE oi.order_id = :order_id
-        ORDER BY oi.id
-    """
-    )
+    items = [dict(row) for row in (await db.execute(_ORDER_ITEMS_SQL, {"order_id": order_id})).mappings()]
 
-    items_result = db.execute(items_query, {"order_id": order_id})
-
-    items = [
-        OrderItemResponse(
-            id=row.id,
-            uuid=row.uuid,
-            order_id=row.order_id,
-            nomenclature_id=row.nomenclature_id,
-            quantity=row.quantity,
-            price=row.price,
-            total_price=row.total_price,
-            created_at=row.created_at,
-            created_by=row.created_by,
-            nomenclature_name=row.nomenclature_name,
-            nomenclature_sku=row.nomenclature_sku,
-        )
-        for row in items_result
-    ]
-
-    return OrderDetail(
-        id=order_result.id,
-        uuid=order_result.uuid,
-        client_id=order_result.client_id,
-        order_number=order_result.order_number,
-        order_date=order_result.order_date,
-        total_amount=order_result.total_amount,
-        status=order_result.status,
-        payment_status=order_result.payment_status,
-        notes=order_result.notes,
-        created_at=order_result.created_at,
-        updated_at=order_result.updated_at,
-        created_by=order_result.created_by,
-        updated_by=order_result.updated_by,
-        client_name=order_result.client_name,
-        items_count=len(items),
-        items=items,
-    )
+    # Строки уже нужной формы: response_model используется только для документации
+    return ORJSONResponse({**order_result, "items_count": len(items), "items": items})
 
 
 @router.post("/", response_model=OrderResponse)
-async def create_order(order: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(order: OrderCreate, db: AsyncSession = Depends(get_db)):
     """Создание нового заказа"""
-    # Проверяем существование клиента
-    client_query = text("SELECT id FROM app.clients WHERE id = :client_id AND is_active = TRUE")
-    client_result = db.execute(client_query, {"client_id": order.client_id}).first()
-    if not client_result:
+    # Проверяем существование клиента (имя нужно для ответа)
+    client_name = (await db.execute(_CLIENT_NAME_SQL, {"client_id": order.client_id})).scalar()
+    if client_name is None:
         raise HTTPException(status_code=400, detail="Клиент не найден")
 
+    # Товар входит в заказ одной позицией (ограничение unique_order_nomenclature)
+    nomenclature_ids = sorted({item.nomenclature_id for item in order.items})
+    if len(nomenclature_ids) != len(order.items):
+        raise HTTPException(status_code=400, detail="Товар указан в заказе несколько раз")
+
+    nomenclature = {
+        row.id: row for row in await db.execute(_LOCK_NOMENCLATURE_SQL, {"nomenclature_ids": nomenclature_ids})
+    }
+
     # Проверяем товары
     for item in order.items:
-        nomenclature_query = text(
-            """
-            SELECT id, quantity, price FROM app.nomenclature
-            WHERE id = :nomenclature_id AND is_active = TRUE
-        """
-        )
-        nomenclature_result = db.execute(nomenclature_query, {"nomenclature_id": item.nomenclature_id}).first()
+        nomenclature_result = nomenclature.get(item.nomenclature_id)
 
         if not nomenclature_result:
             raise HTTPException(
@@ -222,169 +276,86 @@ async def create_order(order: OrderCreate, db: Session = Depends(get_db)):
             )
 
     # Создаем заказ
-    order_insert_query = text(
-        """
-        INSERT INTO app.orders (client_id, order_date, status, payment_status, notes, created_by)
-        VALUES (:client_id, :order_date, :status, :payment_status, :notes, :created_by)
-        RETURNING id, uuid, client_id, order_number, order_date, total_amount, status, payment_status, notes, created_at, updated_at, created_by, updated_by
-    """
-    )
+    order_result = (
+        await db.execute(
+            _CREATE_ORDER_SQL,
+            {
+                "client_id": order.client_id,
+                "order_date": order.order_date or datetime.now(),
+                "status": order.status.value,
+                "payment_status": order.payment_status.value,
+                "notes": order.notes,
+                "created_by": "api_user",
+            },
+        )
+    ).first()
 
-    order_result = db.execute(
-        order_insert_query,
+    # Создаем позиции заказа
+    total_amount = await db.scalar(
+        _CREATE_ORDER_ITEMS_SQL,
         {
-            "client_id": order.client_id,
-            "order_date": order.order_date or datetime.now(),
-            "status": order.status.value,
-            "payment_status": order.payment_status.value,
-            "notes": order.notes,
+            "order_id": order_result.id,
+            "nomenclature_ids": [item.nomenclature_id for item in order.items],
+            "quantities": [item.quantity for item in order.items],
+            "prices": [item.price for item in order.items],
             "created_by": "api_user",
         },
-    ).first()
-
-    # Создаем позиции заказа
-    for item in order.items:
-        item_insert_query = text(
-            """
-            INSERT INTO app.order_items (order_id, nomenclature_id, quantity, price, total_price, created_by)
-            VALUES (:order_id, :nomenclature_id, :quantity, :price, :total_price, :created_by)
-        """
-        )
+    )
 
-        db.execute(
-            item_insert_query,
-            {
-                "order_id": order_result.id,
-                "nomenclature_id": item.nomenclature_id,
-                "quantity": item.quantity,
-                "price": item.price,
-                "total_price": item.total_price,
-                "created_by": "api_user",
-            },
-        )
+    # Обновляем количество товаров на складе одним запросом
+    await db.execute(
+        _WRITE_OFF_STOCK_SQL,
+        {
+            "nomenclature_ids": [item.nomenclature_id for item in order.items],
+            "quantities": [item.quantity for item in order.items],
+            "updated_by": "api_user",
+        },
+    )
 
-        # Обновляем количество товара на складе
-        update_quantity_query = text(
-            """
-            UPDATE app.nomenclature
-            SET quantity = quantity - :quantity, updated_by = :updated_by
-            WHERE id = :nomenclature_id
-        """
-        )
+    await db.commit()
 
-        db.execute(
-            update_quantity_query,
-            {"quantity": item.quantity, "nomenclature_id": item.nomenclature_id, "updated_by": "api_user"},
-        )
+    # Заказ меняет статистику клиента и остатки товаров в их карточках
+    client_cache.delete(order.client_id)
+    for nomenclature_id in nomenclature_ids:
+        nomenclature_cache.delete(nomenclature_id)
 
-    db.commit()
-
-    # Получаем имя клиента
-    client_name_query = text("SELECT name FROM app.clients WHERE id = :client_id")
-    client_name = db.execute(client_name_query, {"client_id": order.client_id}).scalar()
-
-    return OrderResponse(
-        id=order_result.id,
-        uuid=order_result.uuid,
-        client_id=order_result.client_id,
-        order_number=order_result.order_number,
-        order_date=order_result.order_date,
-        total_amount=order_result.total_amount,
-        status=order_result.status,
-        payment_status=order_result.payment_status,
-        notes=order_result.notes,
-        created_at=order_result.created_at,
-        updated_at=order_result.updated_at,
-        created_by=order_result.created_by,
-        updated_by=order_result.updated_by,
+    # Строки уже типизированы БД, повторная валидация не нужна
+    return OrderResponse.model_construct(
+        **order_result._mapping,
+        total_amount=total_amount,
         client_name=client_name,
         items_count=len(order.items),
-        items=[],
     )
 
 
 @router.put("/{order_id}", response_model=OrderResponse)
-async def update_order(order_id: int, order_update: OrderUpdate, db: Session = Depends(get_db)):
+async def update_order(order_id: int, order_update: OrderUpdate, db: AsyncSession = Depends(get_db)):
     """Обновление заказа"""
-    # Проверяем существование заказа
-    check_query = text("SELECT id FROM app.orders WHERE id = :order_id")
-    existing = db.execute(check_query, {"order_id": order_id}).first()
+    update_values = order_update.model_dump(mode="json")
 
-    if not existing:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
-
-    # Обновляем заказ
-    update_fields = []
-    update_values = {"order_id": order_id}
-
-    if order_update.status is not None:
-        update_fields.append("status = :status")
-        update_values["status"] = order_update.status.value
-
-    if order_update.payment_status is not None:
-        update_fields.append("payment_status = :payment_status")
-        update_values["payment_status"] = order_update.payment_status.value
-
-    if order_update.notes is not None:
-        update_fields.append("notes = :notes")
-        update_values["notes"] = order_update.notes
-
-    if not update_fields:
+    if all(value is None for value in update_values.values()):
         raise HTTPException(status_code=400, detail="Нет данных для обновления")
 
-    update_query = text(
-        f"""
-        UPDATE app.orders
-        SET {', '.join(update_fields)}, updated_by = :updated_by
-        WHERE id = :order_id
-        RETURNING id, uuid, client_id, order_number, order_date, total_amount, status, payment_status, notes, created_at, updated_at, created_by, updated_by
-    """
-    )
+    update_values.update(order_id=order_id, updated_by="api_user")
 
-    update_values["updated_by"] = "api_user"
+    # Существование проверяется самим UPDATE: нет строки - нет заказа
+    result = (await db.execute(_UPDATE_ORDER_SQL, update_values)).first()
 
-    result = db.execute(update_query, update_values).first()
-    db.commit()
+    if not result:
+        raise HTTPException(status_code=404, detail="Заказ не найден")
 
-    # Получаем имя клиента и количество позиций
-    client_info_query = text(
-        """
-        SELECT c.name as client_name, COUNT(oi.id) as items_count
-        FROM app.clients c
-        LEFT JOIN app.order_items oi ON oi.order_id = :order_id
-        WHERE c.id = :client_id
-        GROUP BY c.name
-    """
-    )
+    await db.commit()
+    # Отмена заказа исключает его из статистики клиента
+    client_cache.delete(result.client_id)
 
-    client_info = db.execute(client_info_query, {"order_id": order_id, "client_id": result.client_id}).first()
-
-    return OrderResponse(
-        id=result.id,
-        uuid=result.uuid,
-        client_id=result.client_id,
-        order_number=result.order_number,
-        order_date=result.order_date,
-        total_amount=result.total_amount,
-        status=result.status,
-        payment_status=result.payment_status,
-        notes=result.notes,
-        created_at=result.created_at,
-        updated_at=result.updated_at,
-        created_by=result.created_by,
-        updated_by=result.updated_by,
-        client_name=client_info.client_name,
-        items_count=client_info.items_count,
-        items=[],
-    )
+    return OrderResponse.model_construct(**result._mapping)
 
 
 @router.delete("/{order_id}")
-async def delete_order(order_id: int, db: Session = Depends(get_db)):
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_db)):
     """Удаление заказа"""
     # Проверяем существование заказа
-    check_query = text("SELECT id, status FROM app.orders WHERE id = :order_id")
-    existing = db.execute(check_query, {"order_id": order_id}).first()
+    existing = (await db.execute(_ORDER_EXISTS_SQL, {"order_id": order_id})).first()
 
     if not existing:
         raise HTTPException(status_code=404, detail="Заказ не найден")
@@ -394,60 +365,25 @@ async def delete_order(order_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Нельзя удалить заказ в статусе 'completed' или 'processing'")
 
     # Возвращаем товары на склад
-    items_query = text(
-        """
-        SELECT nomenclature_id, quantity
-        FROM app.order_items
-        WHERE order_id = :order_id
-    """
-    )
-
-    items = db.execute(items_query, {"order_id": order_id})
-
-    for item in items:
-        return_quantity_query = text(
-            """
-            UPDATE app.nomenclature
-            SET quantity = quantity + :quantity, updated_by = :updated_by
-            WHERE id = :nomenclature_id
-        """
-        )
-
-        db.execute(
-            return_quantity_query,
-            {"quantity": item.quantity, "nomenclature_id": item.nomenclature_id, "updated_by": "api_user"},
-        )
+    returned = (await db.execute(_RETURN_STOCK_SQL, {"order_id": order_id, "updated_by": "api_user"})).scalars().all()
 
     # Удаляем заказ (позиции удалятся каскадно)
-    delete_query = text("DELETE FROM app.orders WHERE id = :order_id")
-    db.execute(delete_query, {"order_id": order_id})
-    db.commit()
+    await db.execute(_DELETE_ORDER_SQL, {"order_id": order_id})
+    await db.commit()
+
+    client_cache.delete(existing.client_id)
+    for nomenclature_id in returned:
+        nomenclature_cache.delete(nomenclature_id)
 
     return {"message": "Заказ удален"}
 
 
+# Ключи analytics:* сбрасываются триггерами notify_cache_invalidate при любом изменении заказов
 @router.get("/stats/", response_model=OrderStats)
-async def get_order_stats(db: Session = Depends(get_db)):
+@json_response
+@cached("analytics", ttl=30)
+async def get_order_stats(db: AsyncSession = Depends(get_db)):
     """Статистика по заказам"""
-    query = text(
-        """
-        SELECT
-            COUNT(*) as total_orders,
-            COALESCE(SUM(total_amount), 0) as total_amount,
-            COALESCE(AVG(total_amount), 0) as avg_order,
-            COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_orders,
-            COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_orders
-        FROM app.orders
-        WHERE status != 'cancelled'
-    """
-    )
-
-    result = db.execute(query).first()
+    result = await db.execute(_ORDER_STATS_SQL)
 
-    return OrderStats(
-        total_orders=result.total_orders,
-        total_amount=result.total_amount,
-        avg_order=result.avg_order,
-        pending_orders=result.pending_orders,
-        completed_orders=result.completed_orders,
-    )
+    return dict(result.mappings().first())
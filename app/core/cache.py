@@ -2,115 +2,141 @@
 Система кэширования
 """
 
-import json
-from typing import Any, Optional
-
-import redis
+import functools
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+import asyncpg
+import orjson
+import redis.asyncio as aioredis
 import structlog
+from redis.asyncio.client import Pipeline
 from redis.exceptions import RedisError
 
 from app.core.config import settings
+from app.core.events import PgEventListener
 from app.core.monitoring import metrics_collector
+from app.core.responses import orjson_default
 
 logger = structlog.get_logger()
 
+# TTL по умолчанию (настройки неизменяемы, значение читается один раз)
+_DEFAULT_TTL = settings.CACHE_TTL
+
+# Количество ключей, просматриваемых за один SCAN
+_SCAN_BATCH_SIZE = 500
+
 
 class CacheManager:
     """Менеджер кэширования"""
 
     def __init__(self):
-        self.redis_client = None
-        self._connect()
+        self.redis_client: Optional[aioredis.Redis] = None
+
+    async def connect(self):
+        """Подключение к Redis (общий пул соединений на процесс)"""
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_POOL_SIZE,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            retry_on_timeout=True,
+            health_check_interval=30,
+        )
+        client = aioredis.Redis.from_pool(pool)
 
-    def _connect(self):
-        """Подключение к Redis"""
         try:
-            self.redis_client = redis.from_url(
-                settings.REDIS_URL,
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5,
-                retry_on_timeout=True,
-                health_check_interval=30,
-            )
-
-            # Проверяем подключение
-            self.redis_client.ping()
+            # Подключение проверяется один раз при старте; дальше ошибки ловятся на самих командах,
+            # а переподключение и проверку простаивающих соединений берет на себя redis-py
+            await client.ping()
+            self.redis_client = client
             logger.info("Redis connection established")
 
         except RedisError as e:
             logger.error("Failed to connect to Redis", error=str(e))
-            self.redis_client = None
-
-    def _is_connected(self) -> bool:
-        """Проверка подключения к Redis"""
-        if not self.redis_client:
-            return False
+            await client.aclose()
 
-        try:
-            self.redis_client.ping()
-            return True
-        except RedisError:
-            return False
+    async def aclose(self):
+        """Закрытие пула соединений"""
+        if self.redis_client is not None:
+            await self.redis_client.aclose()
+            self.redis_client = None
 
-    def get(self, key: str) -> Optional[Any]:
+    async def get(self, key: str) -> Optional[Any]:
         """Получение значения из кэша"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return None
 
         try:
-            value = self.redis_client.get(key)
+            value = await self.redis_client.get(key)
             if value is None:
                 metrics_collector.record_cache_miss("redis")
                 return None
 
+            metrics_collector.record_cache_hit("redis")
+
             # Пытаемся десериализовать JSON
             try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
+                return orjson.loads(value)
+            except orjson.JSONDecodeError:
                 # Если не JSON, возвращаем как строку
                 return value
 
         except RedisError as e:
             logger.error("Redis get error", key=key, error=str(e))
-            metrics_collector.record_cache_miss("redis")
+            metrics_collector.record_cache_error("redis")
             return None
 
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Получение строковых значений нескольких ключей одним MGET (без десериализации)"""
+        if self.redis_client is None:
+            return [None] * len(keys)
+
+        try:
+            return await self.redis_client.mget(keys)
+        except RedisError as e:
+            logger.error("Redis mget error", keys=keys, error=str(e))
+            metrics_collector.record_cache_error("redis")
+            return [None] * len(keys)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Сохранение значения в кэш"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return False
 
         try:
-            # Сериализуем значение
+            # Сериализуем значение (datetime и UUID orjson поддерживает сам, Decimal отдается как число)
             if isinstance(value, (dict, list)):
-                serialized_value = json.dumps(value, ensure_ascii=False)
+                serialized_value = orjson.dumps(value, default=orjson_default)
             else:
                 serialized_value = str(value)
 
             # Устанавливаем TTL
             if ttl is None:
-                ttl = settings.CACHE_TTL
+                ttl = _DEFAULT_TTL
 
-            result = self.redis_client.setex(key, ttl, serialized_value)
+            result = await self.redis_client.setex(key, ttl, serialized_value)
 
             if result:
-                metrics_collector.record_cache_hit("redis")
                 logger.debug("Cache set", key=key, ttl=ttl)
 
             return bool(result)
 
         except RedisError as e:
             logger.error("Redis set error", key=key, error=str(e))
+            metrics_collector.record_cache_error("redis")
             return False
 
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         """Удаление значения из кэша"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return False
 
         try:
-            result = self.redis_client.delete(key)
+            result = await self.redis_client.delete(key)
             logger.debug("Cache delete", key=key, deleted=bool(result))
             return bool(result)
 
@@ -118,63 +144,79 @@ class CacheManager:
             logger.error("Redis delete error", key=key, error=str(e))
             return False
 
-    def delete_pattern(self, pattern: str) -> int:
-        """Удаление значений по паттерну"""
-        if not self._is_connected():
+    def pipeline(self) -> Pipeline:
+        """Пакет команд без транзакции: все команды уходят в Redis за один round-trip"""
+        return self.redis_client.pipeline(transaction=False)
+
+    async def delete_pattern(self, *patterns: str) -> int:
+        """Удаление значений по паттернам"""
+        if self.redis_client is None:
             return 0
 
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                deleted = self.redis_client.delete(*keys)
-                logger.debug("Cache delete pattern", pattern=pattern, deleted=deleted)
-                return deleted
-            return 0
+            # SCAN обходит ключи порциями, не блокируя Redis, как KEYS; UNLINK освобождает память в фоне.
+            # UNLINK найденных порций копятся в пакете и отправляются вместе
+            async with self.pipeline() as pipe:
+                for pattern in patterns:
+                    cursor = 0
+                    while True:
+                        cursor, keys = await self.redis_client.scan(
+                            cursor=cursor, match=pattern, count=_SCAN_BATCH_SIZE
+                        )
+                        if keys:
+                            pipe.unlink(*keys)
+                        if cursor == 0:
+                            break
+
+                deleted = sum(await pipe.execute())
+
+            logger.debug("Cache delete pattern", patterns=patterns, deleted=deleted)
+            return deleted
 
         except RedisError as e:
-            logger.error("Redis delete pattern error", pattern=pattern, error=str(e))
+            logger.error("Redis delete pattern error", patterns=patterns, error=str(e))
             return 0
 
-    def exists(self, key: str) -> bool:
+    async def exists(self, key: str) -> bool:
         """Проверка существования ключа"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return False
 
         try:
-            return bool(self.redis_client.exists(key))
+            return bool(await self.redis_client.exists(key))
         except RedisError as e:
             logger.error("Redis exists error", key=key, error=str(e))
             return False
 
-    def get_ttl(self, key: str) -> int:
+    async def get_ttl(self, key: str) -> int:
         """Получение TTL ключа"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return -1
 
         try:
-            return self.redis_client.ttl(key)
+            return await self.redis_client.ttl(key)
         except RedisError as e:
             logger.error("Redis TTL error", key=key, error=str(e))
             return -1
 
-    def increment(self, key: str, amount: int = 1) -> Optional[int]:
+    async def increment(self, key: str, amount: int = 1) -> Optional[int]:
         """Увеличение числового значения"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return None
 
         try:
-            return self.redis_client.incrby(key, amount)
+            return await self.redis_client.incrby(key, amount)
         except RedisError as e:
             logger.error("Redis increment error", key=key, error=str(e))
             return None
 
-    def get_stats(self) -> dict:
+    async def get_stats(self) -> dict:
         """Получение статистики кэша"""
-        if not self._is_connected():
+        if self.redis_client is None:
             return {"status": "disconnected"}
 
         try:
-            info = self.redis_client.info()
+            info = await self.redis_client.info()
             return {
                 "status": "connected",
                 "used_memory": info.get("used_memory_human"),
@@ -192,30 +234,93 @@ class CacheManager:
 cache_manager = CacheManager()
 
 
-def cache_key(prefix: str, *args) -> str:
-    """Генерация ключа кэша"""
-    key_parts = [prefix] + [str(arg) for arg in args]
-    return ":".join(key_parts)
+class LocalCache:
+    """Кэш в памяти процесса с ограничением размера (LRU) и временем жизни записей"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        _local_caches.append(self)
 
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получение значения (None - нет в кэше или истек срок)"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
 
-def cached(prefix: str, ttl: Optional[int] = None):
-    """Декоратор для кэширования результатов функций"""
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранение значения с вытеснением самой старой записи"""
+        if self.ttl <= 0:
+            return
+
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        """Удаление значения"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очистка кэша"""
+        self._data.clear()
+
+
+_local_caches: List[LocalCache] = []
+
+
+def clear_local_caches():
+    """Очистка всех кэшей процесса"""
+    for local_cache in _local_caches:
+        local_cache.clear()
+
+
+# Короткоживущие кэши карточек клиентов и товаров. Записи сбрасываются сразу при изменении
+# через API - как самих карточек, так и заказов, от которых зависят остаток и статистика клиента
+client_cache = LocalCache(settings.LOCAL_CACHE_SIZE, settings.LOCAL_CACHE_TTL)
+nomenclature_cache = LocalCache(settings.LOCAL_CACHE_SIZE, settings.LOCAL_CACHE_TTL)
+
+
+def cache_key(prefix: str, *args, **kwargs) -> str:
+    """Генерация ключа кэша: префикс для инвалидации по паттерну и хэш канонического представления аргументов"""
+    blob = orjson.dumps([args, sorted(kwargs.items())], default=str, option=orjson.OPT_SORT_KEYS)
+    return f"{prefix}:{hashlib.blake2b(blob, digest_size=16).hexdigest()}"
+
+
+def cached(prefix: str, ttl: Optional[int] = None, exclude: Tuple[str, ...] = ("db",)):
+    """Декоратор для кэширования результатов async-функций (endpoint'ов)"""
 
     def decorator(func):
-        def wrapper(*args, **kwargs):
+        def build_key(args, kwargs) -> str:
+            # Зависимости вроде сессии БД не участвуют в ключе
+            key_kwargs = {name: value for name, value in kwargs.items() if name not in exclude}
+            return cache_key(f"{prefix}:{func.__name__}", *args, **key_kwargs)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
             # Генерируем ключ кэша
-            key = cache_key(prefix, func.__name__, *args, *kwargs.values())
+            key = build_key(args, kwargs)
 
             # Пытаемся получить из кэша
-            cached_result = cache_manager.get(key)
+            cached_result = await cache_manager.get(key)
             if cached_result is not None:
                 return cached_result
 
             # Выполняем функцию
-            result = func(*args, **kwargs)
+            result = await func(*args, **kwargs)
 
             # Сохраняем в кэш
-            cache_manager.set(key, result, ttl)
+            await cache_manager.set(key, result, ttl)
 
             return result
 
@@ -224,6 +329,17 @@ def cached(prefix: str, ttl: Optional[int] = None):
     return decorator
 
 
-def invalidate_cache(pattern: str) -> int:
-    """Инвалидация кэша по паттерну"""
-    return cache_manager.delete_pattern(pattern)
+async def invalidate_cache(*patterns: str) -> int:
+    """Инвалидация кэша по паттернам"""
+    return await cache_manager.delete_pattern(*patterns)
+
+
+async def _on_cache_invalidate(connection: asyncpg.Connection, payload: str):
+    """Обработчик pg_notify: payload содержит паттерн ключей"""
+    deleted = await invalidate_cache(payload)
+    logger.info("Cache invalidated by database event", pattern=payload, deleted=deleted)
+
+
+def register_cache_invalidation(listener: PgEventListener):
+    """Подписка инвалидации кэша на канал слушателя"""
+    listener.subscribe("cache_invalidate", _on_cache_invalidate)
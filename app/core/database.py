@@ -2,28 +2,57 @@
 Настройка подключения к базе данных
 """
 
+from typing import AsyncIterator
+from uuid import uuid4
+
 import structlog
-from sqlalchemy import MetaData, create_engine, text
+from sqlalchemy import MetaData, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
 from app.core.config import settings
 
 logger = structlog.get_logger()
 
+
+def get_async_database_url(url: str) -> str:
+    """URL базы данных с драйвером asyncpg"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def get_connect_args() -> dict:
+    """Параметры asyncpg: кэш подготовленных выражений или совместимость с PgBouncer"""
+    if settings.DATABASE_PGBOUNCER:
+        # PgBouncer в режиме transaction отдает разные серверные соединения, поэтому выражения не кэшируются,
+        # а имена подготовленных выражений делаются уникальными
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return {
+        "statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+    }
+
+
 # Создание движка базы данных
-engine = create_engine(
-    settings.DATABASE_URL,
+# LIFO-выдача держит в работе самые "горячие" соединения, а лишние простаивают и закрываются по pool_recycle
+engine = create_async_engine(
+    get_async_database_url(settings.DATABASE_URL),
     pool_size=settings.DATABASE_POOL_SIZE,
     max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    pool_use_lifo=True,
     pool_pre_ping=True,
     echo=settings.DEBUG,
-    poolclass=StaticPool if "sqlite" in settings.DATABASE_URL else None,
+    connect_args=get_connect_args(),
 )
 
 # Создание фабрики сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 # Базовый класс для моделей
 Base = declarative_base()
@@ -36,38 +65,35 @@ async def init_db():
     """Инициализация базы данных"""
     try:
         # Проверяем подключение
-        with engine.connect() as connection:
-            connection.execute(text("SELECT 1"))
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
         logger.info("Подключение к базе данных установлено")
-        
+
         # Создаем таблицы (если не существуют)
         from app.db import models
+
         try:
-            Base.metadata.create_all(bind=engine)
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
             logger.info("Таблицы базы данных созданы")
         except Exception as create_error:
             logger.warning("Таблицы уже существуют или ошибка создания", error=str(create_error))
-        
+
     except Exception as e:
         logger.error("Ошибка подключения к базе данных", error=str(e))
         raise
 
 
-def get_db():
+async def get_db() -> AsyncIterator[AsyncSession]:
     """Dependency для получения сессии базы данных"""
-    db = SessionLocal()
-    try:
+    # Транзакцию фиксирует сам endpoint одним commit() перед ответом: завершение yield-зависимости
+    # выполняется уже после отправки ответа, и commit здесь скрыл бы от клиента ошибку фиксации.
+    # Незафиксированная транзакция (HTTPException, ошибка) откатывается при закрытии сессии
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-async def get_async_db():
-    """Async dependency для получения сессии базы данных"""
-    # Для async операций можно использовать asyncpg
-    # Пока используем синхронную версию
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def close_db():
+    """Закрытие соединений пула"""
+    await engine.dispose()
+    logger.info("Соединения с базой данных закрыты")
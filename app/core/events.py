@@ -0,0 +1,146 @@
+"""
+Обработка событий PostgreSQL (LISTEN/NOTIFY)
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+# Обработчик события: получает соединение слушателя и payload уведомления
+EventHandler = Callable[[asyncpg.Connection, str], Awaitable[None]]
+
+
+# Ключ advisory-блокировки: уведомления обрабатывает только процесс, который ее держит
+LISTENER_LOCK_KEY = 7_301_001
+
+
+class PgEventListener:
+    """Слушатель уведомлений pg_notify с дебаунсом обработчиков.
+
+    Из нескольких процессов приложения слушает один - захвативший advisory-блокировку сессии;
+    остальные периодически пытаются ее захватить и подхватывают работу, если лидер отключился.
+    Потерянное соединение восстанавливается с экспоненциальной паузой.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        debounce: float = 1.0,
+        lock_key: int = LISTENER_LOCK_KEY,
+        retry_interval: float = 5.0,
+        max_backoff: float = 60.0,
+    ):
+        self.dsn = dsn
+        self.debounce = debounce
+        self.lock_key = lock_key
+        self.retry_interval = retry_interval
+        self.max_backoff = max_backoff
+        self._handlers: Dict[str, List[EventHandler]] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._connection: Optional[asyncpg.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        """Держит ли процесс блокировку слушателя"""
+        return self._connection is not None
+
+    def subscribe(self, channel: str, handler: EventHandler):
+        """Подписка обработчика на канал"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def start(self):
+        """Запуск фоновой задачи: захват блокировки, подписка на каналы и переподключение"""
+        if not self._handlers or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фоновой задачи, отмена отложенных обработчиков и закрытие соединения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def _run(self):
+        """Цикл сессий слушателя с паузой между попытками (растет при ошибках подключения)"""
+        backoff = self.retry_interval
+        while True:
+            try:
+                await self._serve()
+                backoff = self.retry_interval
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.error("PostgreSQL listener connection failed", error=str(e), retry_in=backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            await asyncio.sleep(self.retry_interval)
+
+    async def _serve(self):
+        """Одна сессия: захват блокировки и прослушивание каналов до разрыва соединения"""
+        connection = await asyncpg.connect(self.dsn)
+        try:
+            if not await connection.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key):
+                return
+
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            for channel in self._handlers:
+                await connection.add_listener(channel, self._on_notify)
+            self._connection = connection
+            logger.info("PostgreSQL listener started", channels=list(self._handlers))
+
+            # Разрыв без закрытия сокета termination listener не замечает: соединение проверяется запросом
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=self.retry_interval)
+                except asyncio.TimeoutError:
+                    async with self._lock:
+                        await connection.execute("SELECT 1", timeout=self.retry_interval)
+
+            logger.warning("PostgreSQL listener connection lost")
+        finally:
+            self._connection = None
+            # Закрытие соединения освобождает блокировку для других процессов
+            connection.terminate()
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+        """Планирование обработки уведомления (серия событий схлопывается в одно)"""
+        if channel in self._pending:
+            return
+        self._pending[channel] = asyncio.create_task(self._dispatch(channel, payload))
+
+    async def _dispatch(self, channel: str, payload: str):
+        """Вызов обработчиков канала после паузы дебаунса"""
+        await asyncio.sleep(self.debounce)
+        self._pending.pop(channel, None)
+
+        async with self._lock:
+            connection = self._connection
+            if connection is None:
+                logger.warning("PostgreSQL listener lost leadership, event skipped", channel=channel)
+                return
+
+            for handler in self._handlers.get(channel, []):
+                try:
+                    await handler(connection, payload)
+                except Exception as e:
+                    logger.error("PostgreSQL event handler failed", channel=channel, error=str(e))
+
+
+# Глобальный экземпляр слушателя
+pg_events = PgEventListener(settings.DATABASE_LISTEN_URL or settings.DATABASE_URL)
@@ -0,0 +1,135 @@
+"""
+HTTP-кэширование ответов (ETag, Cache-Control, 304 Not Modified)
+"""
+
+import hashlib
+import re
+from typing import Awaitable, Callable, Collection, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Версия данных для пути запроса (None - версия неизвестна, ETag считается по телу ответа)
+VersionResolver = Callable[[str], Awaitable[Optional[str]]]
+
+
+def weak_etag(data: bytes) -> str:
+    """Слабый ETag по хэшу данных"""
+    return f'W/"{hashlib.blake2b(data, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (слабое сравнение)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+class ETagMiddleware:
+    """ETag и Cache-Control для GET-запросов; повторный запрос с тем же ETag получает 304 без тела"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        prefixes: Sequence[str],
+        max_age: int = 60,
+        version_of: Optional[VersionResolver] = None,
+        pattern: Optional[str] = None,
+        versioned_paths: Collection[str] = (),
+    ):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        # Путь с подходящим префиксом дополнительно проверяется по шаблону (например, только карточки /{id})
+        self.pattern = re.compile(pattern) if pattern else None
+        self.cache_control = f"private, max-age={max_age}"
+        self.version_of = version_of
+        # Пути, ETag которых строится только по версии: без версии ответ (часто потоковый) не буферизуется
+        self.versioned_paths = frozenset(versioned_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self._matches(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+
+        # Для ответов из материализованных представлений ETag строится по версии данных без выполнения запроса
+        version = await self.version_of(scope["path"]) if self.version_of else None
+        if version is not None:
+            etag = weak_etag(f"{version}?{scope['query_string'].decode()}".encode())
+            if etag_matches(if_none_match, etag):
+                await self._send_not_modified(send, etag)
+                return
+            await self.app(scope, receive, self._tagging_send(send, etag))
+            return
+
+        if scope["path"] in self.versioned_paths:
+            await self.app(scope, receive, send)
+            return
+
+        await self.app(scope, receive, self._buffering_send(send, if_none_match))
+
+    def _matches(self, scope: Scope) -> bool:
+        """Обрабатывается ли запрос middleware"""
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefixes):
+            return False
+        return self.pattern is None or self.pattern.fullmatch(scope["path"]) is not None
+
+    def _set_headers(self, message: Message, etag: str):
+        """Добавление ETag и Cache-Control в начало ответа"""
+        headers = MutableHeaders(scope=message)
+        headers["ETag"] = etag
+        headers["Cache-Control"] = self.cache_control
+
+    async def _send_not_modified(self, send: Send, etag: str):
+        """Ответ 304 без тела"""
+        message = {"type": "http.response.start", "status": 304, "headers": []}
+        self._set_headers(message, etag)
+        await send(message)
+        await send({"type": "http.response.body", "body": b""})
+
+    def _tagging_send(self, send: Send, etag: str) -> Send:
+        """Отправка ответа с заранее известным ETag"""
+
+        async def tagging_send(message: Message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                self._set_headers(message, etag)
+            await send(message)
+
+        return tagging_send
+
+    def _buffering_send(self, send: Send, if_none_match: Optional[str]) -> Send:
+        """Накопление тела ответа для расчета ETag"""
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+
+        async def buffering_send(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                if start["status"] != 200:
+                    await send(start)
+                return
+
+            if message["type"] != "http.response.body" or start["status"] != 200:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            etag = weak_etag(body)
+            if etag_matches(if_none_match, etag):
+                await self._send_not_modified(send, etag)
+                return
+
+            self._set_headers(start, etag)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        return buffering_send
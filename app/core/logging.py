@@ -3,48 +3,92 @@
 """
 
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from typing import Optional
 
+import orjson
 import structlog
 
 from app.core.config import settings
 
+# Максимальное количество записей, ожидающих вывода
+LOG_QUEUE_SIZE = 10000
+
+_log_listener: Optional[QueueListener] = None
+_log_listener_running = False
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Постановка записи в очередь без ожидания: при переполнении запись отбрасывается"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _orjson_serializer(obj, **kwargs) -> str:
+    """Сериализация записи лога через orjson"""
+    return orjson.dumps(obj, **kwargs).decode()
+
 
 def setup_logging():
     """Настройка системы логирования"""
+    global _log_listener
+    min_level = getattr(logging, settings.LOG_LEVEL.upper())
 
-    # Настройка стандартного логирования
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=getattr(logging, settings.LOG_LEVEL.upper()),
-    )
+    # Запись в stdout выполняет отдельный поток: обработчик запроса только кладет запись в очередь
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter("%(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [_DroppingQueueHandler(log_queue)]
+    root.setLevel(min_level)
+
+    # Поток вывода запускается в start_logging(); до этого записи накапливаются в очереди
+    _log_listener = QueueListener(log_queue, output, respect_handler_level=True)
 
     # Настройка structlog
     structlog.configure(
         processors=[
-            structlog.stdlib.filter_by_level,
-            structlog.stdlib.add_logger_name,
-            structlog.stdlib.add_log_level,
-            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.processors.add_log_level,
             structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
             (
-                structlog.processors.JSONRenderer()
+                structlog.processors.JSONRenderer(serializer=_orjson_serializer)
                 if settings.LOG_FORMAT == "json"
                 else structlog.dev.ConsoleRenderer(colors=True)
             ),
         ],
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
+        # Уровень проверяется в самом логгере: вызовы ниже min_level - пустые методы, процессоры не выполняются
+        wrapper_class=structlog.make_filtering_bound_logger(min_level),
         cache_logger_on_first_use=True,
     )
 
 
+def start_logging():
+    """Запуск потока вывода логов"""
+    global _log_listener_running
+    if _log_listener is not None and not _log_listener_running:
+        _log_listener.start()
+        _log_listener_running = True
+
+
+def shutdown_logging():
+    """Вывод накопленных записей и остановка потока логирования"""
+    global _log_listener_running
+    if _log_listener is not None and _log_listener_running:
+        _log_listener.stop()
+        _log_listener_running = False
+
+
 def get_logger(name: Optional[str] = None) -> structlog.BoundLogger:
     """Получение логгера"""
     return structlog.get_logger(name)
@@ -2,12 +2,13 @@
 Мониторинг и метрики приложения
 """
 
+import itertools
 import time
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, Tuple
 
 import structlog
-from fastapi import Request, Response
-from fastapi.responses import PlainTextResponse
+from fastapi import Response
 from prometheus_client import (
     CONTENT_TYPE_LATEST,
     Counter,
@@ -15,6 +16,9 @@ from prometheus_client import (
     Histogram,
     generate_latest,
 )
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
 
 logger = structlog.get_logger()
 
@@ -33,33 +37,58 @@ CACHE_HITS = Counter("cache_hits_total", "Total cache hits", ["cache_type"])
 
 CACHE_MISSES = Counter("cache_misses_total", "Total cache misses", ["cache_type"])
 
+CACHE_ERRORS = Counter("cache_errors_total", "Total cache backend errors", ["cache_type"])
+
 ERROR_COUNT = Counter("errors_total", "Total errors", ["error_type", "endpoint"])
 
 
+# Дочерние ряды метрик запоминаются: число сочетаний меток ограничено таблицей маршрутов
+@lru_cache(maxsize=None)
+def _request_counter(method: str, endpoint: str, status_code: int):
+    """Ряд счетчика запросов для сочетания меток"""
+    return REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code)
+
+
+@lru_cache(maxsize=None)
+def _request_timer(method: str, endpoint: str):
+    """Ряд гистограммы длительности запросов для сочетания меток"""
+    return REQUEST_DURATION.labels(method=method, endpoint=endpoint)
+
+
+def _counter_total(counter: Counter) -> float:
+    """Сумма счетчика Prometheus по всем сочетаниям меток"""
+    return sum(sample.value for sample in counter.collect()[0].samples if sample.name.endswith("_total"))
+
+
+# Порядковые номера запросов для выборочного логирования
+_log_sample = itertools.count(1)
+
+
 class MetricsCollector:
     """Сборщик метрик"""
 
+    # Итоги запросов и ошибок хранятся только в счетчиках Prometheus, без копии в экземпляре
+    __slots__ = ("start_time",)
+
     def __init__(self):
-        self.start_time = time.time()
-        self.request_count = 0
-        self.error_count = 0
+        self.start_time = time.monotonic()  # Монотонные часы: время работы не скачет при коррекции системного времени
 
     def record_request(self, method: str, endpoint: str, status_code: int, duration: float):
         """Запись метрики запроса"""
-        REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
+        _request_counter(method, endpoint, status_code).inc()
 
-        REQUEST_DURATION.labels(method=method, endpoint=endpoint).observe(duration)
+        _request_timer(method, endpoint).observe(duration)
 
-        self.request_count += 1
-
-        logger.info("Request processed", method=method, endpoint=endpoint, status_code=status_code, duration=duration)
+        # Счетчики уже есть в Prometheus: в лог попадает только выборка запросов, и только по флагу
+        if settings.LOG_REQUESTS and (next(_log_sample) & 0x3F) == 0:
+            logger.info(
+                "Request processed", method=method, endpoint=endpoint, status_code=status_code, duration=duration
+            )
 
     def record_error(self, error_type: str, endpoint: str):
         """Запись метрики ошибки"""
         ERROR_COUNT.labels(error_type=error_type, endpoint=endpoint).inc()
 
-        self.error_count += 1
-
         logger.error("Error recorded", error_type=error_type, endpoint=endpoint)
 
     def record_cache_hit(self, cache_type: str):
@@ -70,18 +99,25 @@ class MetricsCollector:
         """Запись промаха кэша"""
         CACHE_MISSES.labels(cache_type=cache_type).inc()
 
+    def record_cache_error(self, cache_type: str):
+        """Запись ошибки кэша (не считается ни попаданием, ни промахом)"""
+        CACHE_ERRORS.labels(cache_type=cache_type).inc()
+
     def get_uptime(self) -> float:
         """Получение времени работы"""
-        return time.time() - self.start_time
+        return time.monotonic() - self.start_time
 
     def get_stats(self) -> Dict[str, Any]:
         """Получение статистики"""
+        uptime = self.get_uptime()
+        request_count = int(_counter_total(REQUEST_COUNT))
+        error_count = int(_counter_total(ERROR_COUNT))
         return {
-            "uptime_seconds": self.get_uptime(),
-            "total_requests": self.request_count,
-            "total_errors": self.error_count,
-            "requests_per_second": self.request_count / max(self.get_uptime(), 1),
-            "error_rate": self.error_count / max(self.request_count, 1),
+            "uptime_seconds": uptime,
+            "total_requests": request_count,
+            "total_errors": error_count,
+            "requests_per_second": request_count / max(uptime, 1),
+            "error_rate": error_count / max(request_count, 1),
         }
 
 
@@ -89,50 +125,101 @@ class MetricsCollector:
 metrics_collector = MetricsCollector()
 
 
-async def metrics_middleware(request: Request, call_next):
-    """Middleware для сбора метрик"""
-    start_time = time.time()
+# Метка для запросов, не совпавших ни с одним маршрутом (404): произвольные пути не порождают новых рядов
+UNMATCHED_ENDPOINT = "unmatched"
 
-    # Получаем информацию о запросе
-    method = request.method
-    endpoint = request.url.path
 
-    try:
-        # Выполняем запрос
-        response = await call_next(request)
+def endpoint_label(scope: Scope) -> str:
+    """Метка endpoint: шаблон маршрута (/api/v1/orders/{order_id}), а не фактический путь"""
+    # Маршрут появляется в scope только после маршрутизации, поэтому метка берется после обработки запроса
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ENDPOINT)
+
+
+class MetricsMiddleware:
+    """ASGI middleware для сбора метрик: без отдельной задачи и обертки над потоком ответа"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def status_send(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, status_send)
+        except Exception as e:
+            # Записываем ошибку
+            metrics_collector.record_error(type(e).__name__, endpoint_label(scope))
+            raise
 
         # Записываем метрики
-        duration = time.time() - start_time
-        metrics_collector.record_request(method, endpoint, response.status_code, duration)
+        duration = time.perf_counter() - start_time
+        metrics_collector.record_request(scope["method"], endpoint_label(scope), status_code, duration)
 
-        return response
 
-    except Exception as e:
-        # Записываем ошибку
-        metrics_collector.record_error(type(e).__name__, endpoint)
-        raise
+# Время жизни готового текста метрик: повторные опросы в пределах окна не обходят реестр заново
+METRICS_CACHE_TTL = 1.0
 
+_metrics_cache: Tuple[float, bytes] = (float("-inf"), b"")
 
-def get_metrics() -> str:
+
+def get_metrics() -> bytes:
     """Получение метрик в формате Prometheus"""
-    return generate_latest()
+    global _metrics_cache
+    now = time.monotonic()
+    created_at, payload = _metrics_cache
+    if now - created_at < METRICS_CACHE_TTL:
+        return payload
+
+    payload = generate_latest()
+    _metrics_cache = (now, payload)
+    return payload
 
 
 def get_metrics_response() -> Response:
     """Получение ответа с метриками"""
-    return PlainTextResponse(get_metrics(), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=get_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+# Время жизни статистики здоровья: одновременные опросы проб получают один и тот же результат
+HEALTH_STATS_CACHE_TTL = 0.5
+
+_health_stats_cache: Tuple[float, Dict[str, Any]] = (float("-inf"), {})
+
+# Значения gauge читаются напрямую, без поиска атрибутов на каждый опрос
+_active_connections_value = ACTIVE_CONNECTIONS._value
+_database_connections_value = DATABASE_CONNECTIONS._value
 
 
 def get_health_stats() -> Dict[str, Any]:
     """Получение статистики здоровья системы"""
+    global _health_stats_cache
+    now = time.monotonic()
+    created_at, health_stats = _health_stats_cache
+    if now - created_at < HEALTH_STATS_CACHE_TTL:
+        return health_stats
+
     stats = metrics_collector.get_stats()
 
-    return {
+    health_stats = {
         "status": "healthy",
         "uptime_seconds": stats["uptime_seconds"],
         "total_requests": stats["total_requests"],
         "requests_per_second": stats["requests_per_second"],
         "error_rate": stats["error_rate"],
-        "active_connections": ACTIVE_CONNECTIONS._value.get(),
-        "database_connections": DATABASE_CONNECTIONS._value.get(),
+        "active_connections": _active_connections_value.get(),
+        "database_connections": _database_connections_value.get(),
     }
+    _health_stats_cache = (now, health_stats)
+    return health_stats
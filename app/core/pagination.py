@@ -0,0 +1,38 @@
+"""
+Курсорная (keyset) пагинация
+"""
+
+import base64
+import binascii
+from typing import Any, Callable, List, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException, Request, Response
+
+from app.core.responses import orjson_default
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Кодирование ключа сортировки последней строки в непрозрачный курсор"""
+    return base64.urlsafe_b64encode(orjson.dumps(list(values), default=orjson_default)).decode()
+
+
+def decode_cursor(cursor: Optional[str], types: Sequence[Callable[[Any], Any]]) -> Optional[List[Any]]:
+    """Декодирование курсора в значения ключа сортировки с приведением к типам колонок"""
+    if cursor is None:
+        return None
+
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(values, list) and len(values) == len(types):
+            return [cast(value) for cast, value in zip(types, values)]
+    except (binascii.Error, TypeError, ValueError, ArithmeticError):
+        pass
+
+    raise HTTPException(status_code=400, detail="Некорректный курсор пагинации")
+
+
+def set_next_link(request: Request, response: Response, cursor: str):
+    """Заголовок Link со ссылкой на следующую страницу"""
+    url = request.url.remove_query_params("page").include_query_params(after=cursor)
+    response.headers["Link"] = f'<{url}>; rel="next"'
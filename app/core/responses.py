@@ -0,0 +1,76 @@
+"""
+Сериализация и потоковая отдача ответов
+"""
+
+import functools
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from uuid import UUID
+
+import orjson
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
+
+# Количество строк, забираемых из серверного курсора за раз
+STREAM_YIELD_PER = 500
+
+
+def orjson_default(value: Any) -> Any:
+    """Сериализация типов, которые orjson не поддерживает из коробки"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, UUID):
+        # UUID драйвера asyncpg - подкласс uuid.UUID, orjson его не распознает
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON-ответ, сериализуемый orjson (Decimal отдается как число)"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default)
+
+
+# Преобразование строки результата перед сериализацией
+RowTransform = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def json_response(func):
+    """Отдача результата endpoint'а через ORJSONResponse без jsonable_encoder и проверки response_model"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return ORJSONResponse(await func(*args, **kwargs))
+
+    return wrapper
+
+
+async def _iter_json_array(
+    db: AsyncSession, query: TextClause, params: Dict[str, Any], transform: Optional[RowTransform]
+) -> AsyncIterator[bytes]:
+    """Построчная сериализация результата запроса в JSON-массив"""
+    result = await db.stream(query, params, execution_options={"yield_per": STREAM_YIELD_PER})
+
+    yield b"["
+    first = True
+    async for row in result:
+        if not first:
+            yield b","
+        item = dict(row._mapping)
+        if transform is not None:
+            item = transform(item)
+        yield orjson.dumps(item, default=orjson_default)
+        first = False
+    yield b"]"
+
+
+def stream_json(
+    db: AsyncSession,
+    query: TextClause,
+    params: Optional[Dict[str, Any]] = None,
+    transform: Optional[RowTransform] = None,
+) -> StreamingResponse:
+    """Потоковый JSON-ответ из серверного курсора без промежуточного списка"""
+    return StreamingResponse(_iter_json_array(db, query, params or {}, transform), media_type="application/json")
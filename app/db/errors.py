@@ -0,0 +1,13 @@
+"""
+Разбор ошибок базы данных
+"""
+
+from sqlalchemy.exc import IntegrityError
+
+# Коды SQLSTATE PostgreSQL
+UNIQUE_VIOLATION = "23505"
+
+
+def is_unique_violation(error: IntegrityError) -> bool:
+    """Нарушение ограничения уникальности"""
+    return getattr(error.orig, "pgcode", None) == UNIQUE_VIOLATION
@@ -0,0 +1,48 @@
+"""
+Снимки агрегатов по завершенным периодам
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+import structlog
+from sqlalchemy import text
+
+from app.core.database import engine
+from app.core.events import pg_events
+
+logger = structlog.get_logger()
+
+_REFRESH_FACT_SALES_MONTH_SQL = text("SELECT app.refresh_fact_sales_month()")
+
+# Как часто процесс проверяет, не стал ли он лидером, секунды
+_LEADER_POLL_INTERVAL = 5.0
+
+
+async def refresh_sales_facts() -> Optional[int]:
+    """Пересборка снимка продаж по завершенным месяцам (None - пересборку уже выполняет другая транзакция)"""
+    async with engine.begin() as connection:
+        months = (await connection.execute(_REFRESH_FACT_SALES_MONTH_SQL)).scalar()
+    if months is None:
+        logger.info("Sales facts refresh skipped: already running")
+    else:
+        logger.info("Sales facts refreshed", months=months)
+    return months
+
+
+async def run_fact_refresh(interval: float):
+    """Периодическая пересборка снимков в процессе-лидере слушателя событий (первая - сразу после выборов).
+
+    Между пересборками снимок поддерживают триггеры, поэтому процессам без блокировки
+    слушателя пересобирать его незачем.
+    """
+    next_run = 0.0
+    while True:
+        if pg_events.is_leader and time.monotonic() >= next_run:
+            try:
+                await refresh_sales_facts()
+            except Exception as e:
+                logger.error("Sales facts refresh failed", error=str(e))
+            next_run = time.monotonic() + interval
+        await asyncio.sleep(_LEADER_POLL_INTERVAL)
@@ -2,21 +2,22 @@
 SQLAlchemy модели для базы данных
 """
 
-import uuid
-
 from sqlalchemy import (
     Boolean,
     Column,
+    Computed,
     DateTime,
     ForeignKey,
     Integer,
     Numeric,
+    Sequence,
     String,
     Text,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 from sqlalchemy.sql import func
 
 from app.core.database import Base
@@ -29,20 +30,21 @@ class Category(Base):
     __table_args__ = {"schema": "app"}
 
     id = Column(Integer, primary_key=True, index=True)
-    uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
+    uuid = Column(UUID(as_uuid=True), unique=True, server_default=func.gen_random_uuid(), nullable=False)
     name = Column(String(255), nullable=False, index=True)
     parent_id = Column(Integer, ForeignKey("app.categories.id", ondelete="CASCADE"), nullable=True)
     path = Column(String(255), nullable=True, index=True)
     level = Column(Integer, default=0, index=True)
-    is_active = Column(Boolean, default=True, index=True)
+    is_active = Column(Boolean, default=True)
+    children_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     created_by = Column(String(100))
     updated_by = Column(String(100))
 
-    # Связи
-    parent = relationship("Category", remote_side=[id], backref="children")
-    nomenclature = relationship("Nomenclature", back_populates="category")
+    # Связи (lazy="raise": endpoint'ы читают данные SQL-запросами, случайная ленивая загрузка - ошибка, а не N+1)
+    parent = relationship("Category", remote_side=[id], backref=backref("children", lazy="raise"), lazy="raise")
+    nomenclature = relationship("Nomenclature", back_populates="category", lazy="raise")
 
 
 class Nomenclature(Base):
@@ -52,7 +54,7 @@ class Nomenclature(Base):
     __table_args__ = {"schema": "app"}
 
     id = Column(Integer, primary_key=True, index=True)
-    uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
+    uuid = Column(UUID(as_uuid=True), unique=True, server_default=func.gen_random_uuid(), nullable=False)
     name = Column(String(255), nullable=False, index=True)
     description = Column(Text)
     sku = Column(String(100), unique=True, index=True)
@@ -60,15 +62,15 @@ class Nomenclature(Base):
     price = Column(Numeric(12, 2), nullable=False)
     cost = Column(Numeric(12, 2))
     category_id = Column(Integer, ForeignKey("app.categories.id", ondelete="RESTRICT"), nullable=False, index=True)
-    is_active = Column(Boolean, default=True, index=True)
+    is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     created_by = Column(String(100))
     updated_by = Column(String(100))
 
     # Связи
-    category = relationship("Category", back_populates="nomenclature")
-    order_items = relationship("OrderItem", back_populates="nomenclature")
+    category = relationship("Category", back_populates="nomenclature", lazy="raise")
+    order_items = relationship("OrderItem", back_populates="nomenclature", lazy="raise")
 
 
 class Client(Base):
@@ -78,19 +80,23 @@ class Client(Base):
     __table_args__ = {"schema": "app"}
 
     id = Column(Integer, primary_key=True, index=True)
-    uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
+    uuid = Column(UUID(as_uuid=True), unique=True, server_default=func.gen_random_uuid(), nullable=False)
     name = Column(String(255), nullable=False, index=True)
     email = Column(String(255), unique=True, index=True)
     phone = Column(String(20), index=True)
     address = Column(Text, nullable=False)
-    is_active = Column(Boolean, default=True, index=True)
+    is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     created_by = Column(String(100))
     updated_by = Column(String(100))
 
     # Связи
-    orders = relationship("Order", back_populates="client")
+    orders = relationship("Order", back_populates="client", lazy="raise")
+
+
+# Номера заказов выдает последовательность, а не поиск максимального номера
+orders_number_seq = Sequence("orders_number_seq", schema="app", metadata=Base.metadata)
 
 
 class Order(Base):
@@ -100,11 +106,18 @@ class Order(Base):
     __table_args__ = {"schema": "app"}
 
     id = Column(Integer, primary_key=True, index=True)
-    uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
+    uuid = Column(UUID(as_uuid=True), unique=True, server_default=func.gen_random_uuid(), nullable=False)
     client_id = Column(Integer, ForeignKey("app.clients.id", ondelete="RESTRICT"), nullable=False, index=True)
-    order_number = Column(String(50), unique=True, nullable=False, index=True)
+    order_number = Column(
+        String(50),
+        unique=True,
+        nullable=False,
+        index=True,
+        server_default=text("'ORD-' || LPAD(nextval('app.orders_number_seq')::TEXT, 6, '0')"),
+    )
     order_date = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     total_amount = Column(Numeric(12, 2), default=0.00, index=True)
+    items_count = Column(Integer, nullable=False, default=0, server_default="0")
     status = Column(String(20), default="pending", index=True)
     payment_status = Column(String(20), default="unpaid", index=True)
     notes = Column(Text)
@@ -114,8 +127,8 @@ class Order(Base):
     updated_by = Column(String(100))
 
     # Связи
-    client = relationship("Client", back_populates="orders")
-    order_items = relationship("OrderItem", back_populates="order")
+    client = relationship("Client", back_populates="orders", lazy="raise")
+    order_items = relationship("OrderItem", back_populates="order", lazy="raise")
 
 
 class OrderItem(Base):
@@ -128,17 +141,55 @@ class OrderItem(Base):
     )
 
     id = Column(Integer, primary_key=True, index=True)
-    uuid = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
+    uuid = Column(UUID(as_uuid=True), unique=True, server_default=func.gen_random_uuid(), nullable=False)
     order_id = Column(Integer, ForeignKey("app.orders.id", ondelete="CASCADE"), nullable=False, index=True)
     nomenclature_id = Column(
         Integer, ForeignKey("app.nomenclature.id", ondelete="RESTRICT"), nullable=False, index=True
     )
     quantity = Column(Integer, nullable=False)
     price = Column(Numeric(12, 2), nullable=False)
-    total_price = Column(Numeric(12, 2), nullable=False)
+    total_price = Column(Numeric(12, 2), Computed("quantity * price", persisted=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     created_by = Column(String(100))
 
     # Связи
-    order = relationship("Order", back_populates="order_items")
-    nomenclature = relationship("Nomenclature", back_populates="order_items")
+    order = relationship("Order", back_populates="order_items", lazy="raise")
+    nomenclature = relationship("Nomenclature", back_populates="order_items", lazy="raise")
+
+
+class FactSalesMonth(Base):
+    """Модель снимка продаж по завершенным месяцам"""
+
+    __tablename__ = "fact_sales_month"
+    __table_args__ = {"schema": "app"}
+
+    month = Column(DateTime(timezone=True), primary_key=True)
+    orders_count = Column(Integer, nullable=False)
+    items_count = Column(Integer, nullable=False)
+    total_amount = Column(Numeric(14, 2), nullable=False)
+    avg_order = Column(Numeric(12, 2), nullable=False)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ClientRevenue(Base):
+    """Модель выручки по клиентам (поддерживается триггерами)"""
+
+    __tablename__ = "client_revenue"
+    __table_args__ = {"schema": "app"}
+
+    client_id = Column(Integer, ForeignKey("app.clients.id", ondelete="CASCADE"), primary_key=True)
+    total_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    orders_count = Column(Integer, nullable=False, default=0)
+    items_count = Column(Integer, nullable=False, default=0)
+
+
+class ProductRevenue(Base):
+    """Модель выручки по товарам (поддерживается триггерами)"""
+
+    __tablename__ = "product_revenue"
+    __table_args__ = {"schema": "app"}
+
+    nomenclature_id = Column(Integer, ForeignKey("app.nomenclature.id", ondelete="CASCADE"), primary_key=True)
+    total_sold = Column(Integer, nullable=False, default=0)
+    total_revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    orders_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,77 @@
+"""
+Материализованные представления и их обновление
+"""
+
+import time
+from typing import Dict, Optional, Tuple
+
+import asyncpg
+import structlog
+
+from app.core.cache import cache_manager, invalidate_cache
+from app.core.events import PgEventListener
+
+logger = structlog.get_logger()
+
+# Каналы pg_notify и представления, которые нужно обновить по сигналу
+REFRESH_CHANNELS: Dict[str, Tuple[str, ...]] = {
+    "cat_refresh": ("app.mv_category_stats", "app.mv_nomenclature_stats"),
+    "nomenclature_refresh": ("app.mv_category_stats", "app.mv_nomenclature_stats"),
+    "client_refresh": ("app.mv_client_stats",),
+    "sales_refresh": ("app.mv_client_stats", "app.mv_nomenclature_stats"),
+}
+
+# Endpoint'ы, которые читают только из материализованных представлений
+VIEW_ENDPOINTS: Dict[str, Tuple[str, ...]] = {
+    "/api/v1/analytics/category-stats": ("app.mv_category_stats",),
+    "/api/v1/categories/stats/": ("app.mv_category_stats",),
+    "/api/v1/clients/stats/": ("app.mv_client_stats",),
+    "/api/v1/nomenclature/stats/": ("app.mv_nomenclature_stats",),
+}
+
+# Ключи Redis с результатами, прочитанными из представлений. Триггер cache_invalidate
+# сбрасывает их при записи, то есть до REFRESH: без повторного сброса после обновления
+# в кэш успели бы попасть старые данные
+VIEW_CACHE_PATTERNS: Dict[str, Tuple[str, ...]] = {
+    "app.mv_category_stats": ("analytics:get_category_stats:*",),
+}
+
+# Версии представлений хранятся в Redis: их пишет процесс, выполнивший REFRESH,
+# а читают ETag'и всех процессов
+VIEW_VERSION_PREFIX = "view_version:"
+
+# Срок жизни версии: без обновлений ключ истекает, и ETag снова считается по телу ответа
+VIEW_VERSION_TTL = 24 * 60 * 60
+
+
+async def endpoint_version(path: str) -> Optional[str]:
+    """Версия данных endpoint'а по версиям его представлений (None - endpoint не из представлений или версия неизвестна)"""
+    views = VIEW_ENDPOINTS.get(path)
+    if views is None:
+        return None
+    versions = await cache_manager.get_many([VIEW_VERSION_PREFIX + view for view in views])
+    if None in versions:
+        return None
+    return "-".join(versions)
+
+
+def _make_refresh_handler(views: Tuple[str, ...]):
+    """Создание обработчика, обновляющего набор представлений"""
+
+    async def refresh(connection: asyncpg.Connection, payload: str):
+        for view in views:
+            await connection.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+            # Кэш сбрасывается до смены версии, чтобы новая версия не досталась старым данным
+            patterns = VIEW_CACHE_PATTERNS.get(view)
+            if patterns:
+                await invalidate_cache(*patterns)
+            await cache_manager.set(VIEW_VERSION_PREFIX + view, format(time.time_ns(), "x"), VIEW_VERSION_TTL)
+            logger.info("Materialized view refreshed", view=view, reason=payload)
+
+    return refresh
+
+
+def register_view_refresh(listener: PgEventListener):
+    """Подписка обновления представлений на каналы слушателя"""
+    for channel, views in REFRESH_CHANNELS.items():
+        listener.subscribe(channel, _make_refresh_handler(views))
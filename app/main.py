@@ -2,34 +2,58 @@
 FastAPI приложение для системы управления заказами
 """
 
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
+import orjson
 import structlog
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 from app.api.v1.router import api_router
+from app.core.cache import cache_manager, register_cache_invalidation
 from app.core.config import settings
-from app.core.database import init_db
-from app.core.logging import setup_logging
+from app.core.database import close_db, init_db
+from app.core.events import pg_events
+from app.core.http_cache import ETagMiddleware
+from app.core.logging import setup_logging, shutdown_logging, start_logging
+from app.core.monitoring import MetricsMiddleware, get_metrics_response
+from app.core.responses import ORJSONResponse
+from app.db.facts import run_fact_refresh
+from app.db.views import VIEW_ENDPOINTS, endpoint_version, register_view_refresh
 
 # Настройка логирования
 setup_logging()
 logger = structlog.get_logger()
 
+register_view_refresh(pg_events)
+register_cache_invalidation(pg_events)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     # Startup
+    start_logging()
     logger.info("Запуск приложения", environment=settings.ENVIRONMENT)
     await init_db()
     logger.info("База данных инициализирована")
+    await cache_manager.connect()
+    await pg_events.start()
+    fact_refresh = asyncio.create_task(run_fact_refresh(settings.FACT_REFRESH_INTERVAL))
     yield
     # Shutdown
+    # Задача дожидается отмены: иначе последняя пересборка может держать соединение пула после закрытия БД
+    fact_refresh.cancel()
+    with suppress(asyncio.CancelledError):
+        await fact_refresh
+    await pg_events.stop()
+    await close_db()
+    await cache_manager.aclose()
     logger.info("Завершение работы приложения")
+    shutdown_logging()
 
 
 # Создание приложения FastAPI
@@ -40,9 +64,27 @@ app = FastAPI(
     docs_url="/docs" if settings.ENVIRONMENT != "production" else None,
     redoc_url="/redoc" if settings.ENVIRONMENT != "production" else None,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Middleware
+app.add_middleware(
+    ETagMiddleware,
+    prefixes=("/api/v1/analytics", "/api/v1/categories/stats/"),
+    max_age=settings.HTTP_CACHE_MAX_AGE,
+    version_of=endpoint_version,
+    versioned_paths=VIEW_ENDPOINTS,
+)
+
+# Карточки клиентов и товаров меняются через API: клиент всегда перепроверяет ETag.
+# Списки и потоковая статистика не тегируются - ETag по телу ответа потребовал бы буферизовать его целиком
+app.add_middleware(
+    ETagMiddleware,
+    prefixes=("/api/v1/clients/", "/api/v1/nomenclature/"),
+    max_age=0,
+    pattern=r"/api/v1/(clients|nomenclature)/\d+",
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_HOSTS,
@@ -53,18 +95,28 @@ app.add_middleware(
 
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.ALLOWED_HOSTS)
 
+# Внешний слой: метрики учитывают все ответы, включая 304 и отказы TrustedHost
+app.add_middleware(MetricsMiddleware)
+
 # Подключение роутеров
 app.include_router(api_router, prefix="/api/v1")
 
 
-@app.get("/")
-async def root():
-    """Корневой endpoint"""
-    return {
+# Ответы корневого endpoint'а и health check не меняются за время жизни процесса: тело сериализуется один раз
+_ROOT_BODY = orjson.dumps(
+    {
         "message": "Система управления заказами",
         "version": "1.0.0",
         "docs": "/docs" if settings.ENVIRONMENT != "production" else "disabled",
     }
+)
+_HEALTH_BODY = orjson.dumps({"status": "healthy", "environment": settings.ENVIRONMENT, "database": "connected"})
+
+
+@app.get("/")
+async def root():
+    """Корневой endpoint"""
+    return Response(_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
@@ -72,7 +124,7 @@ async def health_check():
     """Проверка здоровья приложения"""
     try:
         # Здесь можно добавить проверки БД, Redis и других сервисов
-        return {"status": "healthy", "environment": settings.ENVIRONMENT, "database": "connected"}
+        return Response(_HEALTH_BODY, media_type="application/json")
     except Exception as e:
         logger.error("Health check failed", error=str(e))
         raise HTTPException(status_code=503, detail="Service unavailable")
@@ -80,12 +132,17 @@ async def health_check():
 
 @app.get("/metrics")
 async def metrics():
-    """Метрики приложения"""
-    # Здесь можно добавить Prometheus метрики
-    return {"requests_total": 0, "active_connections": 0, "uptime": "0s"}
+    """Метрики приложения в формате Prometheus"""
+    return get_metrics_response()
 
 
 if __name__ == "__main__":
     uvicorn.run(
-        "app.main:app", host="0.0.0.0", port=8000, reload=settings.ENVIRONMENT == "development", log_level="info"
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=settings.ENVIRONMENT == "development",
+        log_level="info",
+        # Запросы считаются метриками Prometheus, access-лог uvicorn их только дублирует
+        access_log=False,
     )
@@ -3,10 +3,16 @@
 """
 
 from datetime import datetime
-from typing import Optional
+from decimal import Decimal
+from typing import Annotated, Generic, List, Optional, TypeVar
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer, computed_field
+
+T = TypeVar("T")
+
+# Денежная сумма: валидируется как Decimal, в JSON отдается числом (как в ORJSONResponse)
+Money = Annotated[Decimal, PlainSerializer(float, return_type=float, when_used="json")]
 
 
 class BaseSchema(BaseModel):
@@ -17,8 +23,8 @@ class BaseSchema(BaseModel):
     created_at: datetime
     updated_at: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
+    # Наследуется всеми схемами ответов
+    model_config = ConfigDict(from_attributes=True)
 
 
 class CreateSchema(BaseModel):
@@ -44,24 +50,26 @@ class PaginationParams(BaseModel):
 
     page: int = Field(1, ge=1, description="Номер страницы")
     size: int = Field(20, ge=1, le=100, description="Размер страницы")
+    after: Optional[str] = Field(None, description="Курсор следующей страницы (из заголовка Link)")
 
     @property
     def offset(self) -> int:
-        """Смещение для SQL запроса"""
+        """Смещение для SQL запроса (при курсорной пагинации не используется)"""
+        if self.after is not None:
+            return 0
         return (self.page - 1) * self.size
 
 
-class PaginatedResponse(BaseModel):
-    """Пагинированный ответ"""
+class PaginatedResponse(BaseModel, Generic[T]):
+    """Пагинированный ответ (PaginatedResponse[OrderResponse] - с типом элементов)"""
 
-    items: list
+    items: List[T]
     total: int
     page: int
     size: int
-    pages: int
 
-    @classmethod
-    def create(cls, items: list, total: int, page: int, size: int):
-        """Создание пагинированного ответа"""
-        pages = (total + size - 1) // size
-        return cls(items=items, total=total, page=page, size=size, pages=pages)
+    @computed_field
+    @property
+    def pages(self) -> int:
+        """Количество страниц (деление с округлением вверх)"""
+        return -(-self.total // self.size) if self.size else 0
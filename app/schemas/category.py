@@ -7,6 +7,7 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 
 from app.schemas.base import BaseSchema, CreateSchema, UpdateSchema
+from app.schemas.order import CategoryChildrenCount
 
 
 class CategoryBase(BaseModel):
@@ -38,18 +39,12 @@ class CategoryResponse(BaseSchema, CategoryBase):
     path: Optional[str] = Field(None, description="Путь в дереве")
     children_count: Optional[int] = Field(None, description="Количество дочерних элементов")
 
-    class Config:
-        from_attributes = True
-
 
 class CategoryTree(CategoryResponse):
     """Схема дерева категорий"""
 
     children: List["CategoryTree"] = Field(default_factory=list, description="Дочерние категории")
 
-    class Config:
-        from_attributes = True
-
 
 class CategoryHierarchy(BaseModel):
     """Схема иерархии категорий"""
@@ -74,5 +69,25 @@ class CategoryStats(BaseModel):
     total_value: float = Field(..., description="Общая стоимость")
 
 
+class CategoryTreeNode(BaseModel):
+    """Узел дерева категорий в сводном ответе"""
+
+    id: int
+    name: str
+    parent_id: Optional[int]
+    level: int
+    path: Optional[str]
+    children: List["CategoryTreeNode"] = Field(default_factory=list, description="Дочерние категории")
+
+
+class CategoryBundle(BaseModel):
+    """Дерево, иерархия и количество дочерних категорий за один запрос"""
+
+    tree: List[CategoryTreeNode]
+    hierarchy: List[CategoryHierarchy]
+    children_counts: List[CategoryChildrenCount]
+
+
 # Разрешаем forward references
 CategoryTree.model_rebuild()
+CategoryTreeNode.model_rebuild()
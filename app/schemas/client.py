@@ -2,19 +2,23 @@
 Pydantic схемы для клиентов
 """
 
-from typing import Optional
+from typing import Annotated, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, StringConstraints
 
 from app.schemas.base import BaseSchema, CreateSchema, UpdateSchema
 
+# Телефон в свободной записи: "+7 (495) 123-45-67", "84951234567".
+# Один тип на создание и обновление, чтобы ограничения не расходились
+PhoneStr = Annotated[str, StringConstraints(max_length=20, pattern=r"^\+?[0-9][0-9 ()-]{4,19}$")]
+
 
 class ClientBase(BaseModel):
     """Базовая схема клиента"""
 
     name: str = Field(..., min_length=1, max_length=255, description="ФИО клиента")
     email: Optional[EmailStr] = Field(None, description="Email клиента")
-    phone: Optional[str] = Field(None, max_length=20, description="Телефон клиента")
+    phone: Optional[PhoneStr] = Field(None, description="Телефон клиента")
     address: str = Field(..., min_length=1, description="Адрес клиента")
     is_active: bool = Field(True, description="Активен ли клиент")
 
@@ -30,7 +34,7 @@ class ClientUpdate(UpdateSchema):
 
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     email: Optional[EmailStr] = None
-    phone: Optional[str] = Field(None, max_length=20)
+    phone: Optional[PhoneStr] = None
     address: Optional[str] = Field(None, min_length=1)
     is_active: Optional[bool] = None
 
@@ -41,9 +45,6 @@ class ClientResponse(BaseSchema, ClientBase):
     orders_count: Optional[int] = Field(None, description="Количество заказов")
     total_spent: Optional[float] = Field(None, description="Общая сумма заказов")
 
-    class Config:
-        from_attributes = True
-
 
 class ClientStats(BaseModel):
     """Статистика по клиенту"""
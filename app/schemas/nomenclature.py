@@ -2,12 +2,14 @@
 Pydantic схемы для номенклатуры
 """
 
-from decimal import Decimal
-from typing import Optional
+from typing import Annotated, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, StringConstraints
 
-from app.schemas.base import BaseSchema, CreateSchema, UpdateSchema
+from app.schemas.base import BaseSchema, CreateSchema, Money, UpdateSchema
+
+# Артикул: латиница, цифры и разделители ("SMS-WW90T4540AE")
+SkuStr = Annotated[str, StringConstraints(max_length=100, pattern=r"^[A-Za-z0-9][A-Za-z0-9._/-]*$")]
 
 
 class NomenclatureBase(BaseModel):
@@ -15,10 +17,10 @@ class NomenclatureBase(BaseModel):
 
     name: str = Field(..., min_length=1, max_length=255, description="Название товара")
     description: Optional[str] = Field(None, description="Описание товара")
-    sku: Optional[str] = Field(None, max_length=100, description="Артикул")
+    sku: Optional[SkuStr] = Field(None, description="Артикул")
     quantity: int = Field(0, ge=0, description="Количество на складе")
-    price: Decimal = Field(..., gt=0, description="Цена")
-    cost: Optional[Decimal] = Field(None, ge=0, description="Себестоимость")
+    price: Money = Field(..., gt=0, description="Цена")
+    cost: Optional[Money] = Field(None, ge=0, description="Себестоимость")
     category_id: int = Field(..., description="ID категории")
     is_active: bool = Field(True, description="Активен ли товар")
 
@@ -34,10 +36,10 @@ class NomenclatureUpdate(UpdateSchema):
 
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     description: Optional[str] = None
-    sku: Optional[str] = Field(None, max_length=100)
+    sku: Optional[SkuStr] = None
     quantity: Optional[int] = Field(None, ge=0)
-    price: Optional[Decimal] = Field(None, gt=0)
-    cost: Optional[Decimal] = Field(None, ge=0)
+    price: Optional[Money] = Field(None, gt=0)
+    cost: Optional[Money] = Field(None, ge=0)
     category_id: Optional[int] = None
     is_active: Optional[bool] = None
 
@@ -47,9 +49,6 @@ class NomenclatureResponse(BaseSchema, NomenclatureBase):
 
     category_name: Optional[str] = Field(None, description="Название категории")
 
-    class Config:
-        from_attributes = True
-
 
 class NomenclatureStats(BaseModel):
     """Статистика по номенклатуре"""
@@ -59,9 +58,9 @@ class NomenclatureStats(BaseModel):
     sku: Optional[str]
     category_name: str
     total_sold: int = Field(..., description="Количество продано")
-    total_revenue: Decimal = Field(..., description="Общая выручка")
+    total_revenue: Money = Field(..., description="Общая выручка")
     orders_count: int = Field(..., description="Количество заказов")
-    avg_price: Decimal = Field(..., description="Средняя цена продажи")
+    avg_price: Money = Field(..., description="Средняя цена продажи")
 
 
 class NomenclatureSearch(BaseModel):
@@ -69,7 +68,7 @@ class NomenclatureSearch(BaseModel):
 
     query: Optional[str] = Field(None, description="Поисковый запрос")
     category_id: Optional[int] = Field(None, description="ID категории")
-    min_price: Optional[Decimal] = Field(None, ge=0, description="Минимальная цена")
-    max_price: Optional[Decimal] = Field(None, ge=0, description="Максимальная цена")
+    min_price: Optional[Money] = Field(None, ge=0, description="Минимальная цена")
+    max_price: Optional[Money] = Field(None, ge=0, description="Максимальная цена")
     in_stock: Optional[bool] = Field(None, description="Только в наличии")
     is_active: Optional[bool] = Field(True, description="Только активные")
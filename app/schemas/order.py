@@ -3,13 +3,12 @@ Pydantic схемы для заказов
 """
 
 from datetime import datetime
-from decimal import Decimal
 from enum import Enum
 from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
-from app.schemas.base import BaseSchema, CreateSchema, UpdateSchema
+from app.schemas.base import BaseSchema, CreateSchema, Money, UpdateSchema
 
 
 class OrderStatus(str, Enum):
@@ -36,8 +35,7 @@ class OrderItemBase(BaseModel):
 
     nomenclature_id: int = Field(..., description="ID номенклатуры")
     quantity: int = Field(..., gt=0, description="Количество")
-    price: Decimal = Field(..., gt=0, description="Цена за единицу")
-    total_price: Decimal = Field(..., gt=0, description="Общая стоимость")
+    price: Money = Field(..., gt=0, description="Цена за единицу")
 
 
 class OrderItemCreate(OrderItemBase):
@@ -49,12 +47,10 @@ class OrderItemCreate(OrderItemBase):
 class OrderItemResponse(BaseSchema, OrderItemBase):
     """Схема ответа для позиции заказа"""
 
+    total_price: Money = Field(..., description="Общая стоимость (считается БД)")
     nomenclature_name: Optional[str] = Field(None, description="Название товара")
     nomenclature_sku: Optional[str] = Field(None, description="Артикул товара")
 
-    class Config:
-        from_attributes = True
-
 
 class OrderBase(BaseModel):
     """Базовая схема заказа"""
@@ -85,13 +81,10 @@ class OrderResponse(BaseSchema, OrderBase):
     """Схема ответа для заказа"""
 
     order_number: str = Field(..., description="Номер заказа")
-    total_amount: Decimal = Field(..., description="Общая сумма заказа")
+    total_amount: Money = Field(..., description="Общая сумма заказа")
     client_name: Optional[str] = Field(None, description="Имя клиента")
     items_count: Optional[int] = Field(None, description="Количество позиций")
 
-    class Config:
-        from_attributes = True
-
 
 class OrderDetail(OrderResponse):
     """Детальная схема заказа"""
@@ -103,8 +96,8 @@ class OrderStats(BaseModel):
     """Статистика по заказам"""
 
     total_orders: int = Field(..., description="Общее количество заказов")
-    total_amount: Decimal = Field(..., description="Общая сумма заказов")
-    avg_order: Decimal = Field(..., description="Средний чек")
+    total_amount: Money = Field(..., description="Общая сумма заказов")
+    avg_order: Money = Field(..., description="Средний чек")
     pending_orders: int = Field(..., description="Количество ожидающих заказов")
     completed_orders: int = Field(..., description="Количество выполненных заказов")
 
@@ -113,7 +106,7 @@ class ClientOrderSummary(BaseModel):
     """Сумма заказов по клиентам"""
 
     client_name: str = Field(..., description="Имя клиента")
-    total_amount: Decimal = Field(..., description="Общая сумма заказов")
+    total_amount: Money = Field(..., description="Общая сумма заказов")
     orders_count: int = Field(..., description="Количество заказов")
     last_order: Optional[datetime] = Field(None, description="Последний заказ")
 
@@ -135,5 +128,5 @@ class OrderSearch(BaseModel):
     payment_status: Optional[PaymentStatus] = Field(None, description="Статус оплаты")
     date_from: Optional[datetime] = Field(None, description="Дата от")
     date_to: Optional[datetime] = Field(None, description="Дата до")
-    min_amount: Optional[Decimal] = Field(None, ge=0, description="Минимальная сумма")
-    max_amount: Optional[Decimal] = Field(None, ge=0, description="Максимальная сумма")
+    min_amount: Optional[Money] = Field(None, ge=0, description="Минимальная сумма")
+    max_amount: Optional[Money] = Field(None, ge=0, description="Максимальная сумма")
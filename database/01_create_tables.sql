@@ -7,6 +7,8 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE EXTENSION IF NOT EXISTS "pg_stat_statements";
 CREATE EXTENSION IF NOT EXISTS "btree_gin";
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+CREATE EXTENSION IF NOT EXISTS "ltree";
 
 -- Создание схемы для приложения
 CREATE SCHEMA IF NOT EXISTS app;
@@ -20,6 +22,7 @@ CREATE TABLE app.categories (
     path LTREE, -- Для быстрого поиска по иерархии
     level INTEGER DEFAULT 0,
     is_active BOOLEAN DEFAULT TRUE,
+    children_count INTEGER NOT NULL DEFAULT 0, -- Количество активных дочерних категорий (поддерживается триггером)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     created_by VARCHAR(100),
@@ -27,11 +30,14 @@ CREATE TABLE app.categories (
 );
 
 -- Индексы для оптимизации запросов по категориям
+-- Отдельных индексов по is_active нет: фильтр по активности заложен в частичные индексы (WHERE is_active = TRUE)
 CREATE INDEX CONCURRENTLY idx_categories_parent_id ON app.categories(parent_id);
 CREATE INDEX CONCURRENTLY idx_categories_name ON app.categories(name);
 CREATE INDEX CONCURRENTLY idx_categories_path ON app.categories USING GIST(path);
 CREATE INDEX CONCURRENTLY idx_categories_level ON app.categories(level);
-CREATE INDEX CONCURRENTLY idx_categories_active ON app.categories(is_active) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_categories_parent_active ON app.categories(parent_id) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_categories_active_name ON app.categories(name, id) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_categories_root_active_name ON app.categories(name, id) WHERE parent_id IS NULL AND is_active = TRUE;
 
 -- Таблица номенклатуры товаров
 CREATE TABLE app.nomenclature (
@@ -54,11 +60,18 @@ CREATE TABLE app.nomenclature (
 -- Индексы для номенклатуры
 CREATE INDEX CONCURRENTLY idx_nomenclature_category_id ON app.nomenclature(category_id);
 CREATE INDEX CONCURRENTLY idx_nomenclature_name ON app.nomenclature(name);
-CREATE INDEX CONCURRENTLY idx_nomenclature_sku ON app.nomenclature(sku);
 CREATE INDEX CONCURRENTLY idx_nomenclature_price ON app.nomenclature(price);
-CREATE INDEX CONCURRENTLY idx_nomenclature_active ON app.nomenclature(is_active) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_nomenclature_active_name ON app.nomenclature(name, id) WHERE is_active = TRUE;
 CREATE INDEX CONCURRENTLY idx_nomenclature_quantity ON app.nomenclature(quantity) WHERE quantity > 0;
 
+-- Покрывающий индекс для агрегатов по категориям (index-only scan) и фильтра по категории с диапазоном цен
+CREATE INDEX CONCURRENTLY idx_nomenclature_cat_active ON app.nomenclature(category_id, price) INCLUDE (quantity) WHERE is_active = TRUE;
+
+-- Триграммные индексы для поиска ILIKE '%...%' среди активных товаров
+CREATE INDEX CONCURRENTLY idx_nomenclature_name_trgm ON app.nomenclature USING GIN(name gin_trgm_ops) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_nomenclature_sku_trgm ON app.nomenclature USING GIN(sku gin_trgm_ops) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_nomenclature_description_trgm ON app.nomenclature USING GIN(description gin_trgm_ops) WHERE is_active = TRUE;
+
 -- Таблица клиентов
 CREATE TABLE app.clients (
     id SERIAL PRIMARY KEY,
@@ -76,9 +89,16 @@ CREATE TABLE app.clients (
 
 -- Индексы для клиентов
 CREATE INDEX CONCURRENTLY idx_clients_name ON app.clients(name);
-CREATE INDEX CONCURRENTLY idx_clients_email ON app.clients(email);
 CREATE INDEX CONCURRENTLY idx_clients_phone ON app.clients(phone);
-CREATE INDEX CONCURRENTLY idx_clients_active ON app.clients(is_active) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_clients_active_name ON app.clients(name, id) WHERE is_active = TRUE;
+
+-- Триграммные индексы для поиска ILIKE '%...%' среди активных клиентов
+CREATE INDEX CONCURRENTLY idx_clients_name_trgm ON app.clients USING GIN(name gin_trgm_ops) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_clients_email_trgm ON app.clients USING GIN(email gin_trgm_ops) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY idx_clients_phone_trgm ON app.clients USING GIN(phone gin_trgm_ops) WHERE is_active = TRUE;
+
+-- Последовательность номеров заказов
+CREATE SEQUENCE app.orders_number_seq;
 
 -- Таблица заказов
 CREATE TABLE app.orders (
@@ -88,6 +108,7 @@ CREATE TABLE app.orders (
     order_number VARCHAR(50) UNIQUE NOT NULL,
     order_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     total_amount DECIMAL(12, 2) DEFAULT 0.00 CHECK (total_amount >= 0),
+    items_count INTEGER NOT NULL DEFAULT 0 CHECK (items_count >= 0),
     status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'completed', 'cancelled', 'refunded')),
     payment_status VARCHAR(20) DEFAULT 'unpaid' CHECK (payment_status IN ('unpaid', 'paid', 'partial', 'refunded')),
     notes TEXT,
@@ -99,12 +120,21 @@ CREATE TABLE app.orders (
 
 -- Индексы для заказов
 CREATE INDEX CONCURRENTLY idx_orders_client_id ON app.orders(client_id);
-CREATE INDEX CONCURRENTLY idx_orders_order_number ON app.orders(order_number);
 CREATE INDEX CONCURRENTLY idx_orders_order_date ON app.orders(order_date);
-CREATE INDEX CONCURRENTLY idx_orders_status ON app.orders(status);
 CREATE INDEX CONCURRENTLY idx_orders_payment_status ON app.orders(payment_status);
 CREATE INDEX CONCURRENTLY idx_orders_total_amount ON app.orders(total_amount);
 
+-- Частичный индекс для аналитики по неотмененным заказам
+CREATE INDEX CONCURRENTLY idx_orders_client_active ON app.orders(client_id, order_date DESC) INCLUDE (total_amount) WHERE status != 'cancelled';
+
+-- Списки заказов фильтруются по клиенту или статусу и сортируются по дате DESC:
+-- составные индексы отдают строки сразу в нужном порядке, без сортировки
+CREATE INDEX CONCURRENTLY idx_orders_client_date ON app.orders(client_id, order_date DESC);
+CREATE INDEX CONCURRENTLY idx_orders_status_date ON app.orders(status, order_date DESC);
+
+-- Статистика заказов (счетчики по статусам и сумма) читается только из индекса
+CREATE INDEX CONCURRENTLY idx_orders_stats ON app.orders(status) INCLUDE (total_amount) WHERE status != 'cancelled';
+
 -- Таблица позиций заказа
 CREATE TABLE app.order_items (
     id SERIAL PRIMARY KEY,
@@ -113,18 +143,20 @@ CREATE TABLE app.order_items (
     nomenclature_id INTEGER NOT NULL REFERENCES app.nomenclature(id) ON DELETE RESTRICT,
     quantity INTEGER NOT NULL CHECK (quantity > 0),
     price DECIMAL(12, 2) NOT NULL CHECK (price >= 0),
-    total_price DECIMAL(12, 2) NOT NULL CHECK (total_price >= 0),
+    total_price DECIMAL(12, 2) GENERATED ALWAYS AS (quantity * price) STORED,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     created_by VARCHAR(100),
     CONSTRAINT unique_order_nomenclature UNIQUE (order_id, nomenclature_id)
 );
 
 -- Индексы для позиций заказа
-CREATE INDEX CONCURRENTLY idx_order_items_order_id ON app.order_items(order_id);
 CREATE INDEX CONCURRENTLY idx_order_items_nomenclature_id ON app.order_items(nomenclature_id);
 CREATE INDEX CONCURRENTLY idx_order_items_quantity ON app.order_items(quantity);
 CREATE INDEX CONCURRENTLY idx_order_items_total_price ON app.order_items(total_price);
 
+-- Покрывающий индекс для агрегатов по позициям заказа (index-only scan)
+CREATE INDEX CONCURRENTLY idx_order_items_order_cover ON app.order_items(order_id) INCLUDE (total_price, quantity, nomenclature_id);
+
 -- Функция для автоматического обновления updated_at
 CREATE OR REPLACE FUNCTION app.update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -134,10 +166,14 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
--- Триггеры для автоматического обновления updated_at
+-- Триггеры для автоматического обновления updated_at.
+-- У категорий не срабатывает на изменение одного children_count: счетчик меняет триггер дочерней категории,
+-- и родитель при этом не считается измененным
 CREATE TRIGGER update_categories_updated_at 
     BEFORE UPDATE ON app.categories 
-    FOR EACH ROW EXECUTE FUNCTION app.update_updated_at_column();
+    FOR EACH ROW
+    WHEN ((to_jsonb(OLD) - 'children_count') IS DISTINCT FROM (to_jsonb(NEW) - 'children_count'))
+    EXECUTE FUNCTION app.update_updated_at_column();
 
 CREATE TRIGGER update_nomenclature_updated_at 
     BEFORE UPDATE ON app.nomenclature 
@@ -168,25 +204,85 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
--- Триггер для обновления path
+-- Триггеры для обновления path (при изменении одного children_count путь не пересчитывается)
 CREATE TRIGGER update_category_path_trigger
-    BEFORE INSERT OR UPDATE ON app.categories
+    BEFORE INSERT ON app.categories
     FOR EACH ROW EXECUTE FUNCTION app.update_category_path();
 
+CREATE TRIGGER update_category_path_update_trigger
+    BEFORE UPDATE ON app.categories
+    FOR EACH ROW
+    WHEN ((to_jsonb(OLD) - 'children_count') IS DISTINCT FROM (to_jsonb(NEW) - 'children_count'))
+    EXECUTE FUNCTION app.update_category_path();
+
+-- Функция для поддержания счетчика активных дочерних категорий
+CREATE OR REPLACE FUNCTION app.update_children_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.parent_id IS NOT NULL AND OLD.is_active THEN
+        UPDATE app.categories SET children_count = children_count - 1 WHERE id = OLD.parent_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.parent_id IS NOT NULL AND NEW.is_active THEN
+        UPDATE app.categories SET children_count = children_count + 1 WHERE id = NEW.parent_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Триггеры для обновления children_count у родителя
+CREATE TRIGGER update_children_count_trigger
+    AFTER INSERT OR DELETE ON app.categories
+    FOR EACH ROW EXECUTE FUNCTION app.update_children_count();
+
+CREATE TRIGGER update_children_count_change_trigger
+    AFTER UPDATE OF parent_id, is_active ON app.categories
+    FOR EACH ROW
+    WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id OR OLD.is_active IS DISTINCT FROM NEW.is_active)
+    EXECUTE FUNCTION app.update_children_count();
+
+-- Функция для построения дерева активных категорий в JSON (NULL - от корня).
+-- Корни и дочерние категории выбираются разными условиями: "parent_id IS NOT DISTINCT FROM"
+-- индекс не использует, и каждый узел сканировал бы всю таблицу
+CREATE OR REPLACE FUNCTION app.category_tree_json(p_parent_id INTEGER)
+RETURNS JSONB AS $$
+BEGIN
+    IF p_parent_id IS NULL THEN
+        RETURN (
+            SELECT COALESCE(jsonb_agg(app.category_tree_node(c) ORDER BY c.name), '[]'::jsonb)
+            FROM app.categories c
+            WHERE c.parent_id IS NULL AND c.is_active = TRUE
+        );
+    END IF;
+
+    RETURN (
+        SELECT COALESCE(jsonb_agg(app.category_tree_node(c) ORDER BY c.name), '[]'::jsonb)
+        FROM app.categories c
+        WHERE c.parent_id = p_parent_id AND c.is_active = TRUE
+    );
+END;
+$$ language 'plpgsql' STABLE;
+
+-- Узел дерева категорий: для листьев (children_count = 0) поддерево не запрашивается
+CREATE OR REPLACE FUNCTION app.category_tree_node(c app.categories)
+RETURNS JSONB AS $$
+BEGIN
+    RETURN jsonb_build_object(
+        'id', c.id,
+        'name', c.name,
+        'parent_id', c.parent_id,
+        'level', c.level,
+        'path', c.path::text,
+        'children', CASE WHEN c.children_count > 0 THEN app.category_tree_json(c.id) ELSE '[]'::jsonb END
+    );
+END;
+$$ language 'plpgsql' STABLE;
+
 -- Функция для генерации номера заказа
+-- Номер берется из последовательности: без сканирования заказов и без гонки параллельных вставок
 CREATE OR REPLACE FUNCTION app.generate_order_number()
 RETURNS TEXT AS $$
-DECLARE
-    new_number TEXT;
-    counter INTEGER;
 BEGIN
-    SELECT COALESCE(MAX(CAST(SUBSTRING(order_number FROM '^ORD-(\d+)$') AS INTEGER)), 0) + 1
-    INTO counter
-    FROM app.orders
-    WHERE order_number ~ '^ORD-\d+$';
-    
-    new_number := 'ORD-' || LPAD(counter::TEXT, 6, '0');
-    RETURN new_number;
+    RETURN 'ORD-' || LPAD(nextval('app.orders_number_seq')::TEXT, 6, '0');
 END;
 $$ language 'plpgsql';
 
@@ -206,16 +302,19 @@ CREATE TRIGGER set_order_number_trigger
     FOR EACH ROW EXECUTE FUNCTION app.set_order_number();
 
 -- Функция для обновления общей суммы заказа
+-- Сумма и количество позиций хранятся в заказе: списки заказов читают их без агрегации позиций
 CREATE OR REPLACE FUNCTION app.update_order_total()
 RETURNS TRIGGER AS $$
 BEGIN
-    UPDATE app.orders
-    SET total_amount = (
-        SELECT COALESCE(SUM(total_price), 0)
+    UPDATE app.orders o
+    SET total_amount = totals.total_amount,
+        items_count = totals.items_count
+    FROM (
+        SELECT COALESCE(SUM(total_price), 0) AS total_amount, COUNT(*) AS items_count
         FROM app.order_items
         WHERE order_id = COALESCE(NEW.order_id, OLD.order_id)
-    )
-    WHERE id = COALESCE(NEW.order_id, OLD.order_id);
+    ) totals
+    WHERE o.id = COALESCE(NEW.order_id, OLD.order_id);
     
     RETURN COALESCE(NEW, OLD);
 END;
@@ -244,11 +343,9 @@ SELECT
     o.total_amount,
     o.status,
     o.payment_status,
-    COUNT(oi.id) as items_count
+    o.items_count
 FROM app.orders o
-JOIN app.clients c ON o.client_id = c.id
-LEFT JOIN app.order_items oi ON o.id = oi.order_id
-GROUP BY o.id, o.order_number, o.order_date, c.name, o.total_amount, o.status, o.payment_status;
+JOIN app.clients c ON o.client_id = c.id;
 
 -- Представление для иерархии категорий
 CREATE VIEW app.category_hierarchy AS
@@ -260,7 +357,7 @@ WITH RECURSIVE category_tree AS (
         path,
         level,
         0 as depth,
-        name as full_path
+        name::TEXT as full_path
     FROM app.categories
     WHERE parent_id IS NULL
     
@@ -279,6 +376,453 @@ WITH RECURSIVE category_tree AS (
 )
 SELECT * FROM category_tree;
 
+-- Материализованное представление: статистика товаров по категориям
+CREATE MATERIALIZED VIEW app.mv_category_stats AS
+SELECT
+    c.id AS category_id,
+    c.name AS category_name,
+    COUNT(n.id) AS products_count,
+    COALESCE(SUM(n.quantity), 0) AS total_quantity,
+    COALESCE(AVG(n.price), 0)::float8 AS avg_price,
+    COALESCE(MIN(n.price), 0)::float8 AS min_price,
+    COALESCE(MAX(n.price), 0)::float8 AS max_price,
+    COALESCE(SUM(n.price * n.quantity), 0)::float8 AS total_value
+FROM app.categories c
+LEFT JOIN app.nomenclature n ON c.id = n.category_id AND n.is_active = TRUE
+WHERE c.is_active = TRUE
+GROUP BY c.id, c.name;
+
+CREATE UNIQUE INDEX idx_mv_category_stats_category_id ON app.mv_category_stats(category_id);
+CREATE INDEX idx_mv_category_stats_total_value ON app.mv_category_stats(total_value DESC);
+
+-- Материализованное представление: статистика заказов по активным клиентам
+CREATE MATERIALIZED VIEW app.mv_client_stats AS
+SELECT
+    c.id AS client_id,
+    c.name AS client_name,
+    COALESCE(SUM(oi.items_total), 0)::float8 AS total_amount,
+    COUNT(o.id) AS orders_count,
+    COALESCE(SUM(oi.items_total) / NULLIF(SUM(oi.items_count), 0), 0)::float8 AS avg_order,
+    MAX(o.order_date) AS last_order
+FROM app.clients c
+LEFT JOIN app.orders o ON c.id = o.client_id AND o.status != 'cancelled'
+-- Позиции предварительно агрегируются по заказу: одна строка на заказ, COUNT(DISTINCT) не нужен
+LEFT JOIN (
+    SELECT order_id, SUM(total_price) AS items_total, COUNT(*) AS items_count
+    FROM app.order_items
+    GROUP BY order_id
+) oi ON o.id = oi.order_id
+WHERE c.is_active = TRUE
+GROUP BY c.id, c.name;
+
+CREATE UNIQUE INDEX idx_mv_client_stats_client_id ON app.mv_client_stats(client_id);
+CREATE INDEX idx_mv_client_stats_total_amount ON app.mv_client_stats(total_amount DESC);
+
+-- Материализованное представление: продажи по активным товарам
+CREATE MATERIALIZED VIEW app.mv_nomenclature_stats AS
+SELECT
+    n.id AS nomenclature_id,
+    n.name,
+    n.sku,
+    c.name AS category_name,
+    COALESCE(SUM(oi.quantity), 0) AS total_sold,
+    COALESCE(SUM(oi.total_price), 0)::float8 AS total_revenue,
+    COUNT(o.id) AS orders_count,
+    COALESCE(SUM(oi.price_sum) / NULLIF(SUM(oi.lines_count), 0), 0)::float8 AS avg_price
+FROM app.nomenclature n
+JOIN app.categories c ON n.category_id = c.id
+-- Позиции предварительно агрегируются по паре (товар, заказ): COUNT(DISTINCT) не нужен
+LEFT JOIN (
+    SELECT
+        nomenclature_id, order_id,
+        SUM(quantity) AS quantity, SUM(total_price) AS total_price, SUM(price) AS price_sum, COUNT(*) AS lines_count
+    FROM app.order_items
+    GROUP BY nomenclature_id, order_id
+) oi ON n.id = oi.nomenclature_id
+LEFT JOIN app.orders o ON oi.order_id = o.id AND o.status != 'cancelled'
+WHERE n.is_active = TRUE
+GROUP BY n.id, n.name, n.sku, c.name;
+
+CREATE UNIQUE INDEX idx_mv_nomenclature_stats_nomenclature_id ON app.mv_nomenclature_stats(nomenclature_id);
+CREATE INDEX idx_mv_nomenclature_stats_total_revenue ON app.mv_nomenclature_stats(total_revenue DESC);
+
+-- Функция для сигнала об изменении категорий (обновление выполняет приложение)
+CREATE OR REPLACE FUNCTION app.notify_category_refresh()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cat_refresh', TG_OP);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_category_refresh_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON app.categories
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_category_refresh();
+
+-- Функция для сигнала об изменении номенклатуры (обновление статистики категорий)
+CREATE OR REPLACE FUNCTION app.notify_nomenclature_refresh()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('nomenclature_refresh', TG_OP);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_nomenclature_refresh_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON app.nomenclature
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_nomenclature_refresh();
+
+-- Функция для сигнала об изменении клиентов (обновление статистики клиентов)
+CREATE OR REPLACE FUNCTION app.notify_client_refresh()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('client_refresh', TG_OP);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_client_refresh_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON app.clients
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_client_refresh();
+
+-- Функция для сигнала об изменении заказов (обновление статистики клиентов и товаров)
+CREATE OR REPLACE FUNCTION app.notify_sales_refresh()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('sales_refresh', TG_OP);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_sales_refresh_orders
+    AFTER INSERT OR UPDATE OR DELETE ON app.orders
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_sales_refresh();
+
+CREATE TRIGGER notify_sales_refresh_order_items
+    AFTER INSERT OR UPDATE OR DELETE ON app.order_items
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_sales_refresh();
+
+-- Функция для инвалидации кэша аналитики в приложении
+CREATE OR REPLACE FUNCTION app.notify_cache_invalidate()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidate', 'analytics:*');
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_cache_invalidate_categories
+    AFTER INSERT OR UPDATE OR DELETE ON app.categories
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_cache_invalidate();
+
+CREATE TRIGGER notify_cache_invalidate_nomenclature
+    AFTER INSERT OR UPDATE OR DELETE ON app.nomenclature
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_cache_invalidate();
+
+CREATE TRIGGER notify_cache_invalidate_clients
+    AFTER INSERT OR UPDATE OR DELETE ON app.clients
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_cache_invalidate();
+
+CREATE TRIGGER notify_cache_invalidate_orders
+    AFTER INSERT OR UPDATE OR DELETE ON app.orders
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_cache_invalidate();
+
+CREATE TRIGGER notify_cache_invalidate_order_items
+    AFTER INSERT OR UPDATE OR DELETE ON app.order_items
+    FOR EACH STATEMENT EXECUTE FUNCTION app.notify_cache_invalidate();
+
+-- Снимок продаж по завершенным месяцам (месяцы с изменившимися заказами пересчитываются
+-- триггерами, полная пересборка выполняется приложением раз в сутки)
+CREATE TABLE app.fact_sales_month (
+    month TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+    orders_count INTEGER NOT NULL,
+    items_count INTEGER NOT NULL,
+    total_amount DECIMAL(14,2) NOT NULL,
+    avg_order DECIMAL(12,2) NOT NULL,
+    refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Пересчет одного месяца снимка (строка удаляется, если продаж за месяц не осталось).
+-- Advisory-блокировка месяца упорядочивает параллельные пересчеты: агрегат следующей транзакции
+-- считается уже после фиксации предыдущей, и ее изменения не теряются
+CREATE OR REPLACE FUNCTION app.refresh_fact_sales_month_for(p_month TIMESTAMP WITH TIME ZONE)
+RETURNS VOID AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('app.fact_sales_month'), (EXTRACT(EPOCH FROM p_month) / 86400)::INTEGER);
+
+    INSERT INTO app.fact_sales_month (month, orders_count, items_count, total_amount, avg_order)
+    SELECT p_month, COUNT(DISTINCT o.id), COUNT(oi.id), SUM(oi.total_price), AVG(oi.total_price)
+    FROM app.orders o
+    JOIN app.order_items oi ON o.id = oi.order_id
+    WHERE o.status != 'cancelled' AND o.order_date >= p_month AND o.order_date < p_month + INTERVAL '1 month'
+    HAVING COUNT(oi.id) > 0
+    ON CONFLICT (month) DO UPDATE SET
+        orders_count = EXCLUDED.orders_count,
+        items_count = EXCLUDED.items_count,
+        total_amount = EXCLUDED.total_amount,
+        avg_order = EXCLUDED.avg_order,
+        refreshed_at = CURRENT_TIMESTAMP;
+
+    IF NOT FOUND THEN
+        DELETE FROM app.fact_sales_month WHERE month = p_month;
+    END IF;
+END;
+$$ language 'plpgsql';
+
+-- Пересчет месяцев, затронутых изменением заказов. Текущий месяц и месяцы после последнего
+-- в снимке читаются живым запросом и не фиксируются: иначе снимок пропустил бы более ранние месяцы
+CREATE OR REPLACE FUNCTION app.refresh_fact_sales_months(p_months TIMESTAMP WITH TIME ZONE[])
+RETURNS VOID AS $$
+BEGIN
+    PERFORM app.refresh_fact_sales_month_for(m.month)
+    FROM (SELECT DISTINCT unnest(p_months) AS month) m
+    WHERE m.month < DATE_TRUNC('month', CURRENT_TIMESTAMP)
+      AND m.month <= (SELECT MAX(month) FROM app.fact_sales_month)
+    ORDER BY m.month;
+END;
+$$ language 'plpgsql';
+
+-- Полная пересборка снимка по заказам до начала текущего месяца; возвращает количество месяцев.
+-- Пересборку выполняет одна транзакция, параллельные вызовы сразу возвращают NULL
+CREATE OR REPLACE FUNCTION app.refresh_fact_sales_month()
+RETURNS INTEGER AS $$
+DECLARE
+    v_month TIMESTAMP WITH TIME ZONE;
+    months_count INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('app.refresh_fact_sales_month')) THEN
+        RETURN NULL;
+    END IF;
+
+    FOR v_month IN
+        SELECT DATE_TRUNC('month', order_date) FROM app.orders
+        WHERE order_date < DATE_TRUNC('month', CURRENT_TIMESTAMP)
+        UNION
+        SELECT month FROM app.fact_sales_month
+        ORDER BY 1
+    LOOP
+        PERFORM app.refresh_fact_sales_month_for(v_month);
+    END LOOP;
+
+    SELECT COUNT(*) INTO months_count FROM app.fact_sales_month;
+    RETURN months_count;
+END;
+$$ language 'plpgsql';
+
+-- Функция для пересчета снимка при отмене, переносе даты или удалении заказов
+-- (позиции удаленного заказа к моменту вызова уже удалены каскадом)
+CREATE OR REPLACE FUNCTION app.fact_sales_orders_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM app.refresh_fact_sales_months(ARRAY(SELECT DATE_TRUNC('month', order_date) FROM old_rows));
+    ELSE
+        PERFORM app.refresh_fact_sales_months(ARRAY(
+            SELECT unnest(ARRAY[DATE_TRUNC('month', o.order_date), DATE_TRUNC('month', n.order_date)])
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            WHERE n.status IS DISTINCT FROM o.status OR n.order_date IS DISTINCT FROM o.order_date
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Функция для пересчета снимка при изменении позиций заказов прошлых месяцев
+CREATE OR REPLACE FUNCTION app.fact_sales_items_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM app.refresh_fact_sales_months(ARRAY(
+            SELECT DATE_TRUNC('month', o.order_date) FROM new_rows oi JOIN app.orders o ON o.id = oi.order_id
+        ));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM app.refresh_fact_sales_months(ARRAY(
+            SELECT DATE_TRUNC('month', o.order_date) FROM old_rows oi JOIN app.orders o ON o.id = oi.order_id
+        ));
+    ELSE
+        PERFORM app.refresh_fact_sales_months(ARRAY(
+            SELECT DATE_TRUNC('month', o.order_date)
+            FROM old_rows old_oi
+            JOIN new_rows new_oi ON new_oi.id = old_oi.id
+            JOIN app.orders o ON o.id IN (old_oi.order_id, new_oi.order_id)
+            WHERE new_oi.order_id IS DISTINCT FROM old_oi.order_id
+               OR new_oi.quantity IS DISTINCT FROM old_oi.quantity
+               OR new_oi.price IS DISTINCT FROM old_oi.price
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Триггеры уровня оператора: каждый затронутый месяц пересчитывается один раз на оператор
+-- (таблицы переходов допускают только одно событие на триггер)
+CREATE TRIGGER fact_sales_orders_update_trigger
+    AFTER UPDATE ON app.orders
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION app.fact_sales_orders_changed();
+
+CREATE TRIGGER fact_sales_orders_delete_trigger
+    AFTER DELETE ON app.orders
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION app.fact_sales_orders_changed();
+
+CREATE TRIGGER fact_sales_items_insert_trigger
+    AFTER INSERT ON app.order_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION app.fact_sales_items_changed();
+
+CREATE TRIGGER fact_sales_items_update_trigger
+    AFTER UPDATE ON app.order_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION app.fact_sales_items_changed();
+
+CREATE TRIGGER fact_sales_items_delete_trigger
+    AFTER DELETE ON app.order_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION app.fact_sales_items_changed();
+
+-- Выручка по клиентам и товарам (неотмененные заказы), поддерживается триггерами для Top-K запросов
+CREATE TABLE app.client_revenue (
+    client_id INTEGER PRIMARY KEY REFERENCES app.clients(id) ON DELETE CASCADE,
+    total_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    items_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX idx_client_revenue_total_amount ON app.client_revenue(total_amount DESC) WHERE items_count > 0;
+
+CREATE TABLE app.product_revenue (
+    nomenclature_id INTEGER PRIMARY KEY REFERENCES app.nomenclature(id) ON DELETE CASCADE,
+    total_sold INTEGER NOT NULL DEFAULT 0,
+    total_revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX idx_product_revenue_total_revenue ON app.product_revenue(total_revenue DESC) WHERE orders_count > 0;
+
+-- Изменение выручки клиента на дельту: строка блокируется на время инкремента,
+-- поэтому параллельные заказы одного клиента не теряют обновлений
+CREATE OR REPLACE FUNCTION app.add_client_revenue(p_client_id INTEGER, p_amount NUMERIC, p_orders INTEGER, p_items INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO app.client_revenue AS cr (client_id, total_amount, orders_count, items_count)
+    VALUES (p_client_id, p_amount, p_orders, p_items)
+    ON CONFLICT (client_id) DO UPDATE SET
+        total_amount = cr.total_amount + EXCLUDED.total_amount,
+        orders_count = cr.orders_count + EXCLUDED.orders_count,
+        items_count = cr.items_count + EXCLUDED.items_count;
+END;
+$$ language 'plpgsql';
+
+-- Изменение выручки товара на дельту (товар входит в заказ не больше одной позицией,
+-- поэтому количество заказов меняется вместе с количеством позиций)
+CREATE OR REPLACE FUNCTION app.add_product_revenue(p_nomenclature_id INTEGER, p_sold INTEGER, p_revenue NUMERIC, p_orders INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO app.product_revenue AS pr (nomenclature_id, total_sold, total_revenue, orders_count)
+    VALUES (p_nomenclature_id, p_sold, p_revenue, p_orders)
+    ON CONFLICT (nomenclature_id) DO UPDATE SET
+        total_sold = pr.total_sold + EXCLUDED.total_sold,
+        total_revenue = pr.total_revenue + EXCLUDED.total_revenue,
+        orders_count = pr.orders_count + EXCLUDED.orders_count;
+END;
+$$ language 'plpgsql';
+
+-- Функция для обновления выручки при изменении позиций заказа.
+-- Позиции отмененных заказов в выручку не входят; при каскадном удалении заказ уже не виден,
+-- его вклад вычитает orders_revenue()
+CREATE OR REPLACE FUNCTION app.order_items_revenue()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_client_id INTEGER;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT client_id INTO v_client_id FROM app.orders WHERE id = OLD.order_id AND status != 'cancelled';
+        IF FOUND THEN
+            PERFORM app.add_client_revenue(v_client_id, -OLD.total_price, 0, -1);
+            PERFORM app.add_product_revenue(OLD.nomenclature_id, -OLD.quantity, -OLD.total_price, -1);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT client_id INTO v_client_id FROM app.orders WHERE id = NEW.order_id AND status != 'cancelled';
+        IF FOUND THEN
+            PERFORM app.add_client_revenue(v_client_id, NEW.total_price, 0, 1);
+            PERFORM app.add_product_revenue(NEW.nomenclature_id, NEW.quantity, NEW.total_price, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Функция для обновления выручки при создании, отмене, переносе или удалении заказа
+CREATE OR REPLACE FUNCTION app.orders_revenue()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_order_id INTEGER;
+    v_was_active BOOLEAN := FALSE;
+    v_is_active BOOLEAN := FALSE;
+    v_moved BOOLEAN := FALSE;
+    v_sign INTEGER;
+    v_amount NUMERIC := 0;
+    v_items INTEGER := 0;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        v_order_id := OLD.id;
+    ELSE
+        v_order_id := NEW.id;
+        v_is_active := NEW.status != 'cancelled';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        v_was_active := OLD.status != 'cancelled';
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        v_moved := NEW.client_id IS DISTINCT FROM OLD.client_id;
+    END IF;
+
+    IF v_was_active <> v_is_active OR (v_moved AND v_is_active) THEN
+        -- У нового заказа позиций еще нет; при удалении (BEFORE) позиции еще на месте
+        IF TG_OP <> 'INSERT' THEN
+            SELECT COALESCE(SUM(total_price), 0), COUNT(*) INTO v_amount, v_items
+            FROM app.order_items
+            WHERE order_id = v_order_id;
+        END IF;
+
+        IF v_was_active AND (NOT v_is_active OR v_moved) THEN
+            PERFORM app.add_client_revenue(OLD.client_id, -v_amount, -1, -v_items);
+        END IF;
+        IF v_is_active AND (NOT v_was_active OR v_moved) THEN
+            PERFORM app.add_client_revenue(NEW.client_id, v_amount, 1, v_items);
+        END IF;
+
+        IF v_was_active <> v_is_active AND v_items > 0 THEN
+            v_sign := CASE WHEN v_is_active THEN 1 ELSE -1 END;
+            PERFORM app.add_product_revenue(nomenclature_id, v_sign * quantity, v_sign * total_price, v_sign)
+            FROM app.order_items
+            WHERE order_id = v_order_id;
+        END IF;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER order_items_revenue_trigger
+    AFTER INSERT OR UPDATE OF quantity, price, nomenclature_id, order_id OR DELETE ON app.order_items
+    FOR EACH ROW EXECUTE FUNCTION app.order_items_revenue();
+
+CREATE TRIGGER orders_revenue_trigger
+    AFTER INSERT OR UPDATE OF status, client_id ON app.orders
+    FOR EACH ROW EXECUTE FUNCTION app.orders_revenue();
+
+-- Вклад удаляемого заказа вычитается до каскадного удаления позиций
+CREATE TRIGGER orders_revenue_delete_trigger
+    BEFORE DELETE ON app.orders
+    FOR EACH ROW EXECUTE FUNCTION app.orders_revenue();
+
 -- Настройки для оптимизации
 ALTER TABLE app.categories SET (fillfactor = 90);
 ALTER TABLE app.nomenclature SET (fillfactor = 90);
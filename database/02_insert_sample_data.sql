@@ -45,30 +45,39 @@ INSERT INTO app.orders (uuid, order_number, client_id, order_date, total_amount,
 (gen_random_uuid(), 'ORD-000004', 4, '2024-01-18 11:45:00+03', 80000.00, 'completed', 'paid', 'Быстрая доставка', 'system'),
 (gen_random_uuid(), 'ORD-000005', 5, '2024-01-19 16:30:00+03', 95000.00, 'processing', 'paid', 'В обработке', 'system');
 
+-- Номера выше заданы явно: новые заказы продолжают нумерацию после них
+SELECT setval('app.orders_number_seq', 5);
+
 -- Вставка позиций заказов
-INSERT INTO app.order_items (uuid, order_id, nomenclature_id, quantity, price, total_price, created_by) VALUES
+INSERT INTO app.order_items (uuid, order_id, nomenclature_id, quantity, price, created_by) VALUES
 -- Заказ 1 (Иванов)
-(gen_random_uuid(), 1, 1, 1, 25000.00, 25000.00, 'system'),  -- Стиральная машина Samsung
-(gen_random_uuid(), 1, 3, 1, 35000.00, 35000.00, 'system'),  -- Холодильник однокамерный
-(gen_random_uuid(), 1, 4, 1, 45000.00, 45000.00, 'system'),  -- Холодильник двухкамерный
+(gen_random_uuid(), 1, 1, 1, 25000.00, 'system'),  -- Стиральная машина Samsung
+(gen_random_uuid(), 1, 3, 1, 35000.00, 'system'),  -- Холодильник однокамерный
+(gen_random_uuid(), 1, 4, 1, 45000.00, 'system'),  -- Холодильник двухкамерный
 
 -- Заказ 2 (Петров)
-(gen_random_uuid(), 2, 2, 1, 30000.00, 30000.00, 'system'),  -- Стиральная машина LG
-(gen_random_uuid(), 2, 5, 1, 55000.00, 55000.00, 'system'),  -- Телевизор Samsung
-(gen_random_uuid(), 2, 6, 1, 45000.00, 45000.00, 'system'),  -- Ноутбук ASUS 17"
+(gen_random_uuid(), 2, 2, 1, 30000.00, 'system'),  -- Стиральная машина LG
+(gen_random_uuid(), 2, 5, 1, 55000.00, 'system'),  -- Телевизор Samsung
+(gen_random_uuid(), 2, 6, 1, 45000.00, 'system'),  -- Ноутбук ASUS 17"
 
 -- Заказ 3 (Сидоров)
-(gen_random_uuid(), 3, 8, 1, 120000.00, 120000.00, 'system'), -- Моноблок Apple iMac
+(gen_random_uuid(), 3, 8, 1, 120000.00, 'system'), -- Моноблок Apple iMac
 
 -- Заказ 4 (Козлова)
-(gen_random_uuid(), 4, 1, 1, 25000.00, 25000.00, 'system'),  -- Стиральная машина Samsung
-(gen_random_uuid(), 4, 3, 1, 35000.00, 35000.00, 'system'),  -- Холодильник однокамерный
-(gen_random_uuid(), 4, 5, 1, 55000.00, 55000.00, 'system'),  -- Телевизор Samsung
+(gen_random_uuid(), 4, 1, 1, 25000.00, 'system'),  -- Стиральная машина Samsung
+(gen_random_uuid(), 4, 3, 1, 35000.00, 'system'),  -- Холодильник однокамерный
+(gen_random_uuid(), 4, 5, 1, 55000.00, 'system'),  -- Телевизор Samsung
 
 -- Заказ 5 (Смирнов)
-(gen_random_uuid(), 5, 2, 1, 30000.00, 30000.00, 'system'),  -- Стиральная машина LG
-(gen_random_uuid(), 5, 4, 1, 45000.00, 45000.00, 'system'),  -- Холодильник двухкамерный
-(gen_random_uuid(), 5, 7, 1, 50000.00, 50000.00, 'system');  -- Ноутбук HP 19"
+(gen_random_uuid(), 5, 2, 1, 30000.00, 'system'),  -- Стиральная машина LG
+(gen_random_uuid(), 5, 4, 1, 45000.00, 'system'),  -- Холодильник двухкамерный
+(gen_random_uuid(), 5, 7, 1, 50000.00, 'system');  -- Ноутбук HP 19"
+
+-- Обновляем материализованные представления
+REFRESH MATERIALIZED VIEW app.mv_category_stats;
+REFRESH MATERIALIZED VIEW app.mv_client_stats;
+REFRESH MATERIALIZED VIEW app.mv_nomenclature_stats;
+SELECT app.refresh_fact_sales_month();
 
 -- Обновляем статистику
 ANALYZE app.categories;
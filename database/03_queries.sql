@@ -16,44 +16,17 @@ GROUP BY c.id, c.name
 ORDER BY "Сумма" DESC, c.name;
 
 -- 2.2. Найти количество дочерних элементов первого уровня вложенности для категорий номенклатуры
--- Оптимизированный запрос с использованием рекурсивного CTE
-WITH RECURSIVE category_hierarchy AS (
-    -- Базовый случай: корневые категории
-    SELECT 
-        id,
-        name,
-        parent_id,
-        level,
-        0 as depth,
-        name as full_path,
-        ARRAY[id] as path_array
-    FROM app.categories 
-    WHERE parent_id IS NULL AND is_active = TRUE
-    
-    UNION ALL
-    
-    -- Рекурсивный случай: дочерние категории
-    SELECT 
-        c.id,
-        c.name,
-        c.parent_id,
-        c.level,
-        ch.depth + 1,
-        ch.full_path || ' -> ' || c.name,
-        ch.path_array || c.id
-    FROM app.categories c
-    INNER JOIN category_hierarchy ch ON c.parent_id = ch.id
-    WHERE c.is_active = TRUE
-)
+-- Дочерние элементы первого уровня - прямые потомки корня: достаточно одного соединения без рекурсии
+-- (дочерние категории ищутся по индексу idx_categories_parent_active)
 SELECT 
     parent.name AS "Категория",
     COUNT(child.id) AS "Количество дочерних элементов первого уровня",
     parent.level AS "Уровень",
-    parent.full_path AS "Полный путь"
-FROM category_hierarchy parent
-LEFT JOIN category_hierarchy child ON child.parent_id = parent.id AND child.depth = 1
-WHERE parent.depth = 0
-GROUP BY parent.id, parent.name, parent.level, parent.full_path
+    parent.name AS "Полный путь"
+FROM app.categories parent
+LEFT JOIN app.categories child ON child.parent_id = parent.id AND child.is_active = TRUE
+WHERE parent.parent_id IS NULL AND parent.is_active = TRUE
+GROUP BY parent.id, parent.name, parent.level
 ORDER BY parent.name;
 
 -- Дополнительные аналитические запросы
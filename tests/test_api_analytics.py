@@ -1,9 +1,20 @@
 """
 Тесты API для аналитики
 """
+import base64
+from decimal import Decimal
+
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 
+from app.core.pagination import decode_cursor, encode_cursor
+
+
+def raw_cursor(data: bytes) -> str:
+    """Курсор с произвольным содержимым"""
+    return base64.urlsafe_b64encode(data).decode()
+
 
 class TestAnalyticsAPI:
     """Тесты API аналитики"""
@@ -15,18 +26,15 @@ class TestAnalyticsAPI:
         
         data = response.json()
         assert len(data) == 2
+        by_client = {item["client_name"]: item for item in data}
         
         # Проверяем данные первого клиента
-        client_1 = next(
-            item for item in data if item["client_name"] == "Иванов Иван Иванович"
-        )
+        client_1 = by_client["Иванов Иван Иванович"]
         assert client_1["total_amount"] == 60000.0
         assert client_1["orders_count"] == 1
         
         # Проверяем данные второго клиента
-        client_2 = next(
-            item for item in data if item["client_name"] == "Петров Петр Петрович"
-        )
+        client_2 = by_client["Петров Петр Петрович"]
         assert client_2["total_amount"] == 45000.0
         assert client_2["orders_count"] == 1
     
@@ -37,21 +45,27 @@ class TestAnalyticsAPI:
         
         data = response.json()
         assert len(data) == 2  # Две корневые категории
+        by_category = {item["category_name"]: item for item in data}
         
         # Проверяем категорию "Бытовая техника"
-        household_tech = next(
-            item for item in data if item["category_name"] == "Бытовая техника"
-        )
+        household_tech = by_category["Бытовая техника"]
         assert household_tech["children_count"] == 2  # Стиральные машины, Холодильники
         assert household_tech["level"] == 0
         
         # Проверяем категорию "Компьютеры"
-        computers = next(
-            item for item in data if item["category_name"] == "Компьютеры"
-        )
+        computers = by_category["Компьютеры"]
         assert computers["children_count"] == 1  # Ноутбуки
         assert computers["level"] == 0
     
+    def test_category_children_count_after_create(self, client: TestClient, sample_categories):
+        """Тест количества дочерних категорий сразу после добавления категории"""
+        response = client.post("/api/v1/categories/", json={"name": "Планшеты", "parent_id": 2})
+        assert response.status_code == 200
+        
+        data = client.get("/api/v1/analytics/category-children").json()
+        computers = next(item for item in data if item["category_name"] == "Компьютеры")
+        assert computers["children_count"] == 2
+    
     def test_get_top_clients(self, client: TestClient, sample_clients, sample_orders):
         """Тест получения топ клиентов"""
         response = client.get("/api/v1/analytics/top-clients?limit=5")
@@ -128,6 +142,66 @@ class TestAnalyticsAPI:
         data = response.json()
         assert len(data) == 1
     
+    def test_analytics_keyset_pagination(self, client: TestClient, sample_clients, sample_orders):
+        """Тест курсорной пагинации в аналитике"""
+        response = client.get("/api/v1/analytics/client-summary?size=1")
+        assert response.status_code == 200
+        assert response.json()[0]["client_name"] == "Иванов Иван Иванович"
+        
+        # Следующая страница по ссылке из заголовка Link
+        next_url = response.links["next"]["url"]
+        response = client.get(next_url)
+        assert response.status_code == 200
+        assert response.json()[0]["client_name"] == "Петров Петр Петрович"
+        
+        # Некорректный курсор
+        response = client.get("/api/v1/analytics/client-summary?after=invalid")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("cursor", [
+        "invalid",  # не base64
+        raw_cursor(b"not json"),
+        raw_cursor(b'{"amount": 1}'),  # не список
+        encode_cursor(["Иванов Иван Иванович", 1]),  # не то количество значений
+        encode_cursor(["много", "Иванов Иван Иванович", 1]),  # сумма не число
+        encode_cursor([100, "Иванов Иван Иванович", None]),  # id не число
+    ])
+    def test_analytics_malformed_cursor(self, client: TestClient, cursor):
+        """Тест ответа 400 на поврежденный курсор"""
+        response = client.get("/api/v1/analytics/client-summary", params={"after": cursor})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Некорректный курсор пагинации"
+
+    def test_decode_cursor(self):
+        """Тест декодирования курсора с приведением значений к типам колонок"""
+        assert decode_cursor(None, (str, int)) is None
+        assert decode_cursor(encode_cursor([Decimal("10.50"), "Клиент", 3]), (Decimal, str, int)) == [
+            Decimal("10.50"), "Клиент", 3
+        ]
+
+        with pytest.raises(HTTPException) as error:
+            decode_cursor(encode_cursor(["Клиент"]), (str, int))
+        assert error.value.status_code == 400
+
+    def test_next_link_replaces_page(self, client: TestClient, sample_clients, sample_orders):
+        """Тест ссылки на следующую страницу: курсор заменяет номер страницы, остальные параметры сохраняются"""
+        response = client.get("/api/v1/analytics/client-summary?page=1&size=1")
+        next_url = response.links["next"]["url"]
+        assert "page=" not in next_url
+        assert "size=1" in next_url
+        assert "after=" in next_url
+    
+    def test_analytics_etag(self, client: TestClient, sample_clients, sample_orders):
+        """Тест ETag и ответа 304 для повторного запроса"""
+        response = client.get("/api/v1/analytics/top-clients")
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert "max-age" in response.headers["cache-control"]
+        
+        response = client.get("/api/v1/analytics/top-clients", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+    
     def test_analytics_empty_data(self, client: TestClient):
         """Тест аналитики с пустыми данными"""
         # Тест без данных
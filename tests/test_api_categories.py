@@ -130,6 +130,21 @@ class TestCategoriesAPI:
         household_tech = next(cat for cat in data if cat["name"] == "Бытовая техника")
         assert len(household_tech["children"]) == 2  # Стиральные машины, Холодильники
     
+    def test_get_category_bundle(self, client: TestClient, sample_categories):
+        """Тест сводного ответа: дерево, иерархия и количество дочерних категорий"""
+        response = client.get("/api/v1/categories/bundle/")
+        assert response.status_code == 200
+        
+        data = response.json()
+        assert len(data["tree"]) == 2
+        assert len(data["hierarchy"]) == 5
+        
+        household_tech = next(cat for cat in data["tree"] if cat["name"] == "Бытовая техника")
+        assert len(household_tech["children"]) == 2
+        
+        counts = {item["category_name"]: item["children_count"] for item in data["children_counts"]}
+        assert counts == {"Бытовая техника": 2, "Компьютеры": 1}
+    
     def test_get_category_hierarchy(self, client: TestClient, sample_categories):
         """Тест получения иерархии категорий"""
         response = client.get("/api/v1/categories/hierarchy/")
@@ -165,6 +180,21 @@ class TestCategoriesAPI:
         data = response.json()
         assert len(data) == 2
     
+    def test_get_categories_with_cursor(self, client: TestClient, sample_categories):
+        """Тест курсорной пагинации категорий"""
+        response = client.get("/api/v1/categories/?size=2")
+        assert response.status_code == 200
+        first_page = response.json()
+        
+        response = client.get(response.links["next"]["url"])
+        assert response.status_code == 200
+        second_page = response.json()
+        
+        # Страницы не пересекаются
+        ids = [cat["id"] for cat in first_page + second_page]
+        assert len(second_page) == 2
+        assert len(set(ids)) == 4
+    
     def test_get_categories_with_filters(self, client: TestClient, sample_categories):
         """Тест фильтрации категорий"""
         # Тест фильтра по активности
@@ -18,7 +18,7 @@ class TestClientsAPI:
         assert data[0]["name"] == "Иванов Иван Иванович"
         assert data[0]["email"] == "ivanov@example.com"
     
-    def test_get_client_by_id(self, client: TestClient, sample_clients):
+    def test_get_client_by_id(self, client: TestClient, sample_orders):
         """Тест получения клиента по ID"""
         response = client.get("/api/v1/clients/1")
         assert response.status_code == 200
@@ -29,6 +29,27 @@ class TestClientsAPI:
         assert data["orders_count"] == 1  # Из sample_orders
         assert data["total_spent"] == 60000.0
     
+    def test_get_client_etag_after_update(self, client: TestClient, sample_clients):
+        """Тест ETag карточки клиента: 304 без изменений, новые данные после обновления"""
+        response = client.get("/api/v1/clients/1")
+        etag = response.headers["etag"]
+
+        response = client.get("/api/v1/clients/1", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        client.put("/api/v1/clients/1", json={"name": "Иванов Иван Петрович"})
+
+        response = client.get("/api/v1/clients/1", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["name"] == "Иванов Иван Петрович"
+
+    @pytest.mark.parametrize("url", ["/api/v1/clients/", "/api/v1/clients/stats/"])
+    def test_client_lists_without_etag(self, client: TestClient, sample_clients, url):
+        """Тест: ETag ставится только на карточку, списки и потоковая статистика отдаются без буферизации"""
+        response = client.get(url)
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+
     def test_get_client_not_found(self, client: TestClient):
         """Тест получения несуществующего клиента"""
         response = client.get("/api/v1/clients/999")
@@ -136,7 +157,21 @@ class TestClientsAPI:
         
         data = response.json()
         assert len(data) == 1
-    
+
+    def test_get_clients_with_cursor(self, client: TestClient, sample_clients):
+        """Тест курсорной пагинации клиентов"""
+        response = client.get("/api/v1/clients/?size=1")
+        assert response.status_code == 200
+        first_page = response.json()
+
+        response = client.get(response.links["next"]["url"])
+        assert response.status_code == 200
+        second_page = response.json()
+
+        # Страницы не пересекаются
+        assert len(second_page) == 1
+        assert first_page[0]["id"] != second_page[0]["id"]
+
     def test_get_clients_with_search(self, client: TestClient, sample_clients):
         """Тест поиска клиентов"""
         response = client.get("/api/v1/clients/?query=Иванов")
@@ -163,3 +198,7 @@ class TestClientsAPI:
         # Пустой адрес
         response = client.post("/api/v1/clients/", json={"name": "Клиент", "address": ""})
         assert response.status_code == 422
+
+        # Телефон без цифр
+        response = client.post("/api/v1/clients/", json={"name": "Клиент", "phone": "телефон", "address": "Адрес"})
+        assert response.status_code == 422
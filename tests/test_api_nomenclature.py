@@ -15,9 +15,10 @@ class TestNomenclatureAPI:
         
         data = response.json()
         assert len(data) == 3
-        assert data[0]["name"] == "Стиральная машина Samsung"
-        assert data[0]["sku"] == "SMS-001"
-        assert data[0]["category_name"] == "Стиральные машины"
+        # Сортировка по названию
+        assert [item["name"] for item in data] == ["Ноутбук ASUS", "Стиральная машина Samsung", "Холодильник Bosch"]
+        assert data[1]["sku"] == "SMS-001"
+        assert data[1]["category_name"] == "Стиральные машины"
     
     def test_get_nomenclature_by_id(self, client: TestClient, sample_nomenclature):
         """Тест получения товара по ID"""
@@ -171,55 +172,31 @@ class TestNomenclatureAPI:
         assert len(data) == 1
         assert "Samsung" in data[0]["name"]
     
-    def test_get_nomenclature_with_filters(self, client: TestClient, sample_nomenclature):
+    @pytest.mark.parametrize("params, predicate", [
+        ({"category_id": 3}, lambda data: len(data) == 1 and data[0]["category_id"] == 3),  # Фильтр по категории
+        ({"min_price": 30000}, lambda data: all(item["price"] >= 30000 for item in data)),  # Фильтр по цене
+        ({"in_stock": "true"}, lambda data: all(item["quantity"] > 0 for item in data)),  # Фильтр по наличию
+    ])
+    def test_get_nomenclature_with_filters(self, client: TestClient, sample_nomenclature, params, predicate):
         """Тест фильтрации номенклатуры"""
-        # Фильтр по категории
-        response = client.get("/api/v1/nomenclature/?category_id=3")
+        response = client.get("/api/v1/nomenclature/", params=params)
         assert response.status_code == 200
-        
-        data = response.json()
-        assert len(data) == 1
-        assert data[0]["category_id"] == 3
-        
-        # Фильтр по цене
-        response = client.get("/api/v1/nomenclature/?min_price=30000")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert all(item["price"] >= 30000 for item in data)
-        
-        # Фильтр по наличию
-        response = client.get("/api/v1/nomenclature/?in_stock=true")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert all(item["quantity"] > 0 for item in data)
-    
-    def test_nomenclature_validation(self, client: TestClient, sample_categories):
+        assert predicate(response.json())
+    
+    @pytest.mark.parametrize("field, value", [
+        ("price", -1000.0),  # Отрицательная цена
+        ("quantity", -1),  # Отрицательное количество
+        ("name", ""),  # Пустое имя
+    ])
+    def test_nomenclature_validation(self, client: TestClient, field, value):
         """Тест валидации данных номенклатуры"""
-        # Отрицательная цена
-        response = client.post("/api/v1/nomenclature/", json={
-            "name": "Товар",
-            "price": -1000.0,
-            "quantity": 1,
-            "category_id": 1
-        })
-        assert response.status_code == 422
-        
-        # Отрицательное количество
-        response = client.post("/api/v1/nomenclature/", json={
+        nomenclature_data = {
             "name": "Товар",
             "price": 1000.0,
-            "quantity": -1,
-            "category_id": 1
-        })
-        assert response.status_code == 422
-        
-        # Пустое имя
-        response = client.post("/api/v1/nomenclature/", json={
-            "name": "",
-            "price": 1000.0,
             "quantity": 1,
             "category_id": 1
-        })
+        }
+        nomenclature_data[field] = value
+        
+        response = client.post("/api/v1/nomenclature/", json=nomenclature_data)
         assert response.status_code == 422
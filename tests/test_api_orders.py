@@ -32,6 +32,21 @@ class TestOrdersAPI:
         assert data["total_amount"] == 60000.0
         assert len(data["items"]) == 2  # Две позиции
     
+    def test_get_order_items_fields(self, client: TestClient, sample_orders):
+        """Тест полей позиций заказа: строки БД отдаются без повторной валидации"""
+        response = client.get("/api/v1/orders/1")
+        assert response.status_code == 200
+        
+        data = response.json()
+        assert data["items_count"] == len(data["items"])
+        for item in data["items"]:
+            assert item["order_id"] == 1
+            assert isinstance(item["quantity"], int)
+            assert isinstance(item["price"], float)
+            assert isinstance(item["total_price"], float)
+            assert item["nomenclature_name"]
+            assert item["nomenclature_sku"]
+    
     def test_get_order_not_found(self, client: TestClient):
         """Тест получения несуществующего заказа"""
         response = client.get("/api/v1/orders/999")
@@ -50,8 +65,7 @@ class TestOrdersAPI:
                 {
                     "nomenclature_id": 1,
                     "quantity": 1,
-                    "price": 25000.0,
-                    "total_price": 25000.0
+                    "price": 25000.0
                 }
             ]
         }
@@ -66,6 +80,15 @@ class TestOrdersAPI:
         assert data["items_count"] == 1
         assert data["total_amount"] == 25000.0
     
+    def test_create_order_after_sample_orders(self, client: TestClient, sample_orders):
+        """Тест: номер нового заказа продолжает последовательность после тестовых заказов"""
+        response = client.post("/api/v1/orders/", json={
+            "client_id": 2,
+            "items": [{"nomenclature_id": 1, "quantity": 1, "price": 25000.0}]
+        })
+        assert response.status_code == 200
+        assert response.json()["order_number"] == "ORD-000003"
+
     def test_create_order_invalid_client(self, client: TestClient, sample_nomenclature):
         """Тест создания заказа с несуществующим клиентом"""
         order_data = {
@@ -74,8 +97,7 @@ class TestOrdersAPI:
                 {
                     "nomenclature_id": 1,
                     "quantity": 1,
-                    "price": 25000.0,
-                    "total_price": 25000.0
+                    "price": 25000.0
                 }
             ]
         }
@@ -92,8 +114,7 @@ class TestOrdersAPI:
                 {
                     "nomenclature_id": 999,  # Не существует
                     "quantity": 1,
-                    "price": 25000.0,
-                    "total_price": 25000.0
+                    "price": 25000.0
                 }
             ]
         }
@@ -110,8 +131,7 @@ class TestOrdersAPI:
                 {
                     "nomenclature_id": 1,
                     "quantity": 100,  # Больше чем на складе (5)
-                    "price": 25000.0,
-                    "total_price": 2500000.0
+                    "price": 25000.0
                 }
             ]
         }
@@ -120,6 +140,23 @@ class TestOrdersAPI:
         assert response.status_code == 400
         assert "Недостаточно товара" in response.json()["detail"]
     
+    def test_create_order_duplicate_nomenclature(self, client: TestClient, sample_clients, sample_nomenclature):
+        """Тест создания заказа с повторяющимся товаром"""
+        order_data = {
+            "client_id": 1,
+            "items": [
+                {"nomenclature_id": 1, "quantity": 1, "price": 25000.0},
+                {"nomenclature_id": 1, "quantity": 2, "price": 25000.0}
+            ]
+        }
+        
+        response = client.post("/api/v1/orders/", json=order_data)
+        assert response.status_code == 400
+        assert "несколько раз" in response.json()["detail"]
+        
+        # Склад не изменился
+        assert client.get("/api/v1/nomenclature/1").json()["quantity"] == 5
+    
     def test_create_order_price_mismatch(self, client: TestClient, sample_clients, sample_nomenclature):
         """Тест создания заказа с неверной ценой"""
         order_data = {
@@ -172,8 +209,7 @@ class TestOrdersAPI:
                 {
                     "nomenclature_id": 1,
                     "quantity": 1,
-                    "price": 25000.0,
-                    "total_price": 25000.0
+                    "price": 25000.0
                 }
             ]
         }
@@ -184,6 +220,26 @@ class TestOrdersAPI:
         assert response.status_code == 200
         assert "удален" in response.json()["message"]
     
+    def test_order_changes_refresh_cards(self, client: TestClient, sample_clients, sample_nomenclature):
+        """Тест сброса кэша карточек клиента и товара при создании, отмене и удалении заказа"""
+        # Карточки попадают в кэш процесса
+        assert client.get("/api/v1/clients/1").json()["orders_count"] == 0
+        assert client.get("/api/v1/nomenclature/1").json()["quantity"] == 5
+
+        order_data = {"client_id": 1, "items": [{"nomenclature_id": 1, "quantity": 2, "price": 25000.0}]}
+        order_id = client.post("/api/v1/orders/", json=order_data).json()["id"]
+
+        client_card = client.get("/api/v1/clients/1").json()
+        assert client_card["orders_count"] == 1
+        assert client_card["total_spent"] == 50000.0
+        assert client.get("/api/v1/nomenclature/1").json()["quantity"] == 3
+
+        client.put(f"/api/v1/orders/{order_id}", json={"status": "cancelled"})
+        assert client.get("/api/v1/clients/1").json()["orders_count"] == 0
+
+        client.delete(f"/api/v1/orders/{order_id}")
+        assert client.get("/api/v1/nomenclature/1").json()["quantity"] == 5
+    
     def test_delete_order_completed(self, client: TestClient, sample_orders):
         """Тест удаления выполненного заказа"""
         response = client.delete("/api/v1/orders/1")  # Статус completed
@@ -215,65 +271,26 @@ class TestOrdersAPI:
         data = response.json()
         assert len(data) == 1
     
-    def test_get_orders_with_filters(self, client: TestClient, sample_orders):
+    @pytest.mark.parametrize("field, value", [
+        ("client_id", 1),
+        ("status", "completed"),
+        ("payment_status", "paid"),
+    ])
+    def test_get_orders_with_filters(self, client: TestClient, sample_orders, field, value):
         """Тест фильтрации заказов"""
-        # Фильтр по клиенту
-        response = client.get("/api/v1/orders/?client_id=1")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert len(data) == 1
-        assert data[0]["client_id"] == 1
-        
-        # Фильтр по статусу
-        response = client.get("/api/v1/orders/?status=completed")
+        response = client.get("/api/v1/orders/", params={field: value})
         assert response.status_code == 200
         
         data = response.json()
         assert len(data) == 1
-        assert data[0]["status"] == "completed"
-        
-        # Фильтр по статусу оплаты
-        response = client.get("/api/v1/orders/?payment_status=paid")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert len(data) == 1
-        assert data[0]["payment_status"] == "paid"
+        assert data[0][field] == value
     
-    def test_order_validation(self, client: TestClient, sample_clients, sample_nomenclature):
+    @pytest.mark.parametrize("items", [
+        [],  # Пустой список товаров
+        [{"nomenclature_id": 1, "quantity": -1, "price": 25000.0}],  # Отрицательное количество
+        [{"nomenclature_id": 1, "quantity": 1, "price": -25000.0}],  # Отрицательная цена
+    ])
+    def test_order_validation(self, client: TestClient, items):
         """Тест валидации данных заказа"""
-        # Пустой список товаров
-        response = client.post("/api/v1/orders/", json={
-            "client_id": 1,
-            "items": []
-        })
-        assert response.status_code == 422
-        
-        # Отрицательное количество
-        response = client.post("/api/v1/orders/", json={
-            "client_id": 1,
-            "items": [
-                {
-                    "nomenclature_id": 1,
-                    "quantity": -1,
-                    "price": 25000.0,
-                    "total_price": -25000.0
-                }
-            ]
-        })
-        assert response.status_code == 422
-        
-        # Отрицательная цена
-        response = client.post("/api/v1/orders/", json={
-            "client_id": 1,
-            "items": [
-                {
-                    "nomenclature_id": 1,
-                    "quantity": 1,
-                    "price": -25000.0,
-                    "total_price": -25000.0
-                }
-            ]
-        })
+        response = client.post("/api/v1/orders/", json={"client_id": 1, "items": items})
         assert response.status_code == 422
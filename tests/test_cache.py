@@ -0,0 +1,94 @@
+"""
+Тесты кэша карточек в памяти процесса
+"""
+import pytest
+
+from app.core import cache
+from app.core.cache import LocalCache, clear_local_caches
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def local_caches(monkeypatch):
+    """Кэши, созданные в тесте, не попадают в общий список процесса"""
+    caches = []
+    monkeypatch.setattr(cache, "_local_caches", caches)
+    return caches
+
+
+class TestLocalCache:
+    """Тесты LocalCache"""
+
+    def test_get_set_delete(self):
+        """Тест сохранения, чтения и удаления записи"""
+        local_cache = LocalCache(maxsize=2, ttl=5)
+        assert local_cache.get(1) is None
+
+        local_cache.set(1, {"id": 1})
+        assert local_cache.get(1) == {"id": 1}
+
+        local_cache.delete(1)
+        local_cache.delete(1)
+        assert local_cache.get(1) is None
+
+    def test_lru_eviction(self):
+        """Тест: при превышении maxsize вытесняется запись, которую дольше всех не читали"""
+        local_cache = LocalCache(maxsize=2, ttl=5)
+        local_cache.set(1, "first")
+        local_cache.set(2, "second")
+
+        # Чтение делает запись самой свежей: вытесняется вторая
+        assert local_cache.get(1) == "first"
+        local_cache.set(3, "third")
+
+        assert local_cache.get(2) is None
+        assert local_cache.get(1) == "first"
+        assert local_cache.get(3) == "third"
+
+    def test_overwrite_refreshes_position(self):
+        """Тест: перезапись существующего ключа не увеличивает размер и делает запись самой свежей"""
+        local_cache = LocalCache(maxsize=2, ttl=5)
+        local_cache.set(1, "first")
+        local_cache.set(2, "second")
+        local_cache.set(1, "updated")
+        local_cache.set(3, "third")
+
+        assert local_cache.get(1) == "updated"
+        assert local_cache.get(2) is None
+
+    def test_ttl_expiry(self, clock):
+        """Тест: запись живет ttl секунд и удаляется при чтении после истечения срока"""
+        local_cache = LocalCache(maxsize=2, ttl=5)
+        local_cache.set(1, "value")
+
+        clock[0] += 5
+        assert local_cache.get(1) == "value"
+
+        clock[0] += 0.001
+        assert local_cache.get(1) is None
+        assert 1 not in local_cache._data
+
+    def test_zero_ttl_disables_cache(self):
+        """Тест: при ttl = 0 значения не сохраняются"""
+        local_cache = LocalCache(maxsize=2, ttl=0)
+        local_cache.set(1, "value")
+        assert local_cache.get(1) is None
+
+    def test_clear_local_caches(self, local_caches):
+        """Тест: clear_local_caches очищает все кэши процесса"""
+        first, second = LocalCache(maxsize=2, ttl=5), LocalCache(maxsize=2, ttl=5)
+        assert local_caches == [first, second]
+
+        first.set(1, "first")
+        second.set(1, "second")
+        clear_local_caches()
+
+        assert first.get(1) is None
+        assert second.get(1) is None
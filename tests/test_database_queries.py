@@ -27,44 +27,25 @@ class TestDatabaseQueries:
         rows = result.fetchall()
         
         assert len(rows) == 2
+        rows_by_name = {row[0]: row for row in rows}
         
         # Проверяем данные первого клиента
-        client_1 = next(row for row in rows if row[0] == "Иванов Иван Иванович")
+        client_1 = rows_by_name["Иванов Иван Иванович"]
         assert client_1[1] == 60000.0  # Сумма заказов
         
         # Проверяем данные второго клиента
-        client_2 = next(row for row in rows if row[0] == "Петров Петр Петрович")
+        client_2 = rows_by_name["Петров Петр Петрович"]
         assert client_2[1] == 45000.0  # Сумма заказов
     
     def test_query_2_2_category_children_count(self, db_session: Session, sample_categories):
         """Тест запроса 2.2: Количество дочерних элементов первого уровня"""
         query = text("""
-            WITH RECURSIVE category_hierarchy AS (
-                SELECT 
-                    id, name, parent_id, level,
-                    0 as depth,
-                    name as full_path,
-                    ARRAY[id] as path_array
-                FROM app.categories 
-                WHERE parent_id IS NULL AND is_active = TRUE
-                
-                UNION ALL
-                
-                SELECT 
-                    c.id, c.name, c.parent_id, c.level,
-                    ch.depth + 1,
-                    ch.full_path || ' -> ' || c.name,
-                    ch.path_array || c.id
-                FROM app.categories c
-                INNER JOIN category_hierarchy ch ON c.parent_id = ch.id
-                WHERE c.is_active = TRUE
-            )
             SELECT 
                 parent.name AS "Категория",
                 COUNT(child.id) AS "Количество дочерних элементов первого уровня"
-            FROM category_hierarchy parent
-            LEFT JOIN category_hierarchy child ON child.parent_id = parent.id AND child.depth = 1
-            WHERE parent.depth = 0
+            FROM app.categories parent
+            LEFT JOIN app.categories child ON child.parent_id = parent.id AND child.is_active = TRUE
+            WHERE parent.parent_id IS NULL AND parent.is_active = TRUE
             GROUP BY parent.id, parent.name
             ORDER BY parent.name
         """)
@@ -73,15 +54,34 @@ class TestDatabaseQueries:
         rows = result.fetchall()
         
         assert len(rows) == 2
+        rows_by_name = {row[0]: row for row in rows}
         
         # Проверяем категорию "Бытовая техника"
-        household_tech = next(row for row in rows if row[0] == "Бытовая техника")
+        household_tech = rows_by_name["Бытовая техника"]
         assert household_tech[1] == 2  # Стиральные машины, Холодильники
         
         # Проверяем категорию "Компьютеры"
-        computers = next(row for row in rows if row[0] == "Компьютеры")
+        computers = rows_by_name["Компьютеры"]
         assert computers[1] == 1  # Ноутбуки
-    
+
+    def test_children_count_keeps_parent_updated_at(self, db_session: Session, sample_categories):
+        """Тест: счетчик дочерних категорий меняется без изменения updated_at и path родителя"""
+        parent_query = text("SELECT updated_at, path::TEXT, children_count FROM app.categories WHERE id = 2")
+        updated_at, path, children_count = db_session.execute(parent_query).one()
+
+        db_session.execute(text(
+            "INSERT INTO app.categories (name, parent_id, created_by) VALUES ('Планшеты', 2, 'test')"
+        ))
+        db_session.execute(text("UPDATE app.categories SET is_active = FALSE WHERE id = 5"))
+        assert tuple(db_session.execute(parent_query).one()) == (updated_at, path, children_count)
+
+        db_session.execute(text("UPDATE app.categories SET is_active = TRUE WHERE id = 5"))
+        assert db_session.execute(parent_query).one().children_count == children_count + 1
+
+        # Изменение самого родителя по-прежнему обновляет updated_at
+        db_session.execute(text("UPDATE app.categories SET name = 'Компьютерная техника' WHERE id = 2"))
+        assert db_session.execute(parent_query).one().updated_at > updated_at
+
     def test_category_hierarchy_query(self, db_session: Session, sample_categories):
         """Тест запроса иерархии категорий"""
         query = text("""
@@ -89,7 +89,7 @@ class TestDatabaseQueries:
                 SELECT 
                     id, name, parent_id, level,
                     0 as depth,
-                    name as full_path
+                    name::TEXT as full_path
                 FROM app.categories 
                 WHERE parent_id IS NULL AND is_active = TRUE
                 
@@ -152,100 +152,109 @@ class TestDatabaseQueries:
         query = text("SELECT * FROM app.order_summary ORDER BY order_date DESC")
         
         result = db_session.execute(query)
+        # Структура данных одинакова для всех строк - проверяем колонки один раз
+        keys = set(result.keys())
+        assert {"id", "order_number", "client_name", "total_amount", "status", "items_count"}.issubset(keys)
+
         rows = result.fetchall()
-        
         assert len(rows) == 2
-        
-        # Проверяем структуру данных
-        for row in rows:
-            assert hasattr(row, 'id')
-            assert hasattr(row, 'order_number')
-            assert hasattr(row, 'client_name')
-            assert hasattr(row, 'total_amount')
-            assert hasattr(row, 'status')
-            assert hasattr(row, 'items_count')
     
     def test_category_hierarchy_view(self, db_session: Session, sample_categories):
         """Тест представления category_hierarchy"""
         query = text("SELECT * FROM app.category_hierarchy ORDER BY path")
         
         result = db_session.execute(query)
+        # Структура данных одинакова для всех строк - проверяем колонки один раз
+        keys = set(result.keys())
+        assert {"id", "name", "level", "path"}.issubset(keys)
+
         rows = result.fetchall()
-        
         assert len(rows) == 5  # Все категории
-        
-        # Проверяем структуру данных
-        for row in rows:
-            assert hasattr(row, 'id')
-            assert hasattr(row, 'name')
-            assert hasattr(row, 'level')
-            assert hasattr(row, 'path')
     
-    def test_foreign_key_constraints(self, db_session: Session):
+    def test_revenue_tables_follow_order_changes(self, db_session: Session, sample_orders):
+        """Тест дельтовых триггеров выручки: отмена, перенос заказа и изменение позиций"""
+        db_session.execute(text("UPDATE app.orders SET client_id = 1 WHERE id = 2"))
+        db_session.execute(text("UPDATE app.order_items SET quantity = 2 WHERE order_id = 2"))
+        db_session.execute(text("UPDATE app.orders SET status = 'cancelled' WHERE id = 1"))
+        db_session.execute(text("UPDATE app.orders SET status = 'completed' WHERE id = 1"))
+        db_session.execute(text("DELETE FROM app.order_items WHERE order_id = 1 AND nomenclature_id = 2"))
+
+        clients = db_session.execute(text("""
+            SELECT client_id, total_amount, orders_count, items_count
+            FROM app.client_revenue
+            WHERE orders_count > 0
+            ORDER BY client_id
+        """)).fetchall()
+        assert [tuple(row) for row in clients] == [(1, 115000, 2, 2)]
+
+        products = db_session.execute(text("""
+            SELECT nomenclature_id, total_sold, total_revenue, orders_count
+            FROM app.product_revenue
+            WHERE orders_count > 0
+            ORDER BY nomenclature_id
+        """)).fetchall()
+        assert [tuple(row) for row in products] == [(1, 1, 25000, 1), (3, 2, 90000, 1)]
+
+        # Удаление заказа вычитает его вклад целиком (позиции удаляются каскадно)
+        db_session.execute(text("DELETE FROM app.orders WHERE id = 2"))
+        client_1 = db_session.execute(text(
+            "SELECT total_amount, orders_count, items_count FROM app.client_revenue WHERE client_id = 1"
+        )).one()
+        assert tuple(client_1) == (25000, 1, 1)
+        product_3 = db_session.execute(text(
+            "SELECT total_sold, total_revenue, orders_count FROM app.product_revenue WHERE nomenclature_id = 3"
+        )).one()
+        assert tuple(product_3) == (0, 0, 0)
+    
+    def test_fact_sales_month_follows_past_orders(self, db_session: Session, sample_orders):
+        """Тест пересчета снимка продаж триггерами при изменении заказов завершенного месяца"""
+        db_session.execute(text("UPDATE app.orders SET order_date = '2024-01-10' WHERE id = 1"))
+        assert db_session.execute(text("SELECT app.refresh_fact_sales_month()")).scalar() == 1
+
+        snapshot = text("SELECT orders_count, items_count, total_amount FROM app.fact_sales_month")
+        assert [tuple(row) for row in db_session.execute(snapshot)] == [(1, 2, 60000)]
+
+        # Заказ, перенесенный в месяц снимка задним числом
+        db_session.execute(text("UPDATE app.orders SET order_date = '2024-01-20' WHERE id = 2"))
+        assert [tuple(row) for row in db_session.execute(snapshot)] == [(2, 3, 105000)]
+
+        # Удаление позиции и отмена заказа
+        db_session.execute(text("DELETE FROM app.order_items WHERE order_id = 1 AND nomenclature_id = 2"))
+        db_session.execute(text("UPDATE app.orders SET status = 'cancelled' WHERE id = 2"))
+        assert [tuple(row) for row in db_session.execute(snapshot)] == [(1, 1, 25000)]
+
+        # Без продаж месяц удаляется из снимка
+        db_session.execute(text("DELETE FROM app.orders WHERE id = 1"))
+        assert db_session.execute(snapshot).fetchall() == []
+    
+    def test_foreign_key_constraints(self, db_metadata):
         """Тест внешних ключей"""
-        # Проверяем внешние ключи для categories
-        query = text("""
-            SELECT CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
-            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
-            WHERE TABLE_NAME = 'categories' AND REFERENCED_TABLE_NAME IS NOT NULL
-            AND TABLE_SCHEMA = 'app'
-        """)
-        
-        result = db_session.execute(query)
-        fk_categories = result.fetchall()
-        assert len(fk_categories) > 0
-        
-        # Проверяем внешние ключи для nomenclature
-        query = text("""
-            SELECT CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
-            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
-            WHERE TABLE_NAME = 'nomenclature' AND REFERENCED_TABLE_NAME IS NOT NULL
-            AND TABLE_SCHEMA = 'app'
-        """)
-        
-        result = db_session.execute(query)
-        fk_nomenclature = result.fetchall()
-        assert len(fk_nomenclature) > 0
+        # Проверяем внешние ключи для categories и nomenclature
+        assert "categories" in db_metadata["foreign_keys"]
+        assert "nomenclature" in db_metadata["foreign_keys"]
     
-    def test_indexes_exist(self, db_session: Session):
+    def test_indexes_exist(self, db_metadata):
         """Тест существования индексов"""
-        query = text("""
-            SELECT indexname, tablename 
-            FROM pg_indexes 
-            WHERE schemaname = 'app' 
-            AND indexname LIKE 'idx_%'
-        """)
-        
-        result = db_session.execute(query)
-        indexes = result.fetchall()
-        
         # Проверяем наличие основных индексов
-        index_names = [idx[0] for idx in indexes]
         expected_indexes = [
             'idx_categories_parent_id',
             'idx_categories_name',
             'idx_nomenclature_category_id',
             'idx_nomenclature_name',
             'idx_clients_name',
-            'idx_orders_client_id'
+            'idx_orders_client_id',
+            # Составные индексы фильтров списков
+            'idx_orders_status_date',
+            'idx_nomenclature_cat_active',
+            'idx_nomenclature_quantity'
         ]
         
         for expected_idx in expected_indexes:
-            assert expected_idx in index_names
+            assert expected_idx in db_metadata["indexes"]
     
-    def test_triggers_exist(self, db_session: Session):
+    def test_triggers_exist(self, db_metadata):
         """Тест существования триггеров"""
-        query = text("""
-            SELECT trigger_name, event_manipulation, event_object_table
-            FROM information_schema.triggers
-            WHERE trigger_schema = 'app'
-        """)
-        
-        result = db_session.execute(query)
-        triggers = result.fetchall()
-        
         # Проверяем наличие основных триггеров
-        trigger_names = [trigger[0] for trigger in triggers]
         expected_triggers = [
             'update_categories_updated_at',
             'update_nomenclature_updated_at',
@@ -256,21 +265,11 @@ class TestDatabaseQueries:
         ]
         
         for expected_trigger in expected_triggers:
-            assert expected_trigger in trigger_names
+            assert expected_trigger in db_metadata["triggers"]
     
-    def test_functions_exist(self, db_session: Session):
+    def test_functions_exist(self, db_metadata):
         """Тест существования функций"""
-        query = text("""
-            SELECT routine_name, routine_type
-            FROM information_schema.routines
-            WHERE routine_schema = 'app'
-        """)
-        
-        result = db_session.execute(query)
-        functions = result.fetchall()
-        
         # Проверяем наличие основных функций
-        function_names = [func[0] for func in functions]
         expected_functions = [
             'update_updated_at_column',
             'update_category_path',
@@ -280,4 +279,4 @@ class TestDatabaseQueries:
         ]
         
         for expected_function in expected_functions:
-            assert expected_function in function_names
+            assert expected_function in db_metadata["functions"]
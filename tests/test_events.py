@@ -0,0 +1,339 @@
+"""
+Тесты слушателя событий PostgreSQL и обновления материализованных представлений
+"""
+import asyncio
+from typing import Callable, List
+
+import asyncpg
+import pytest
+
+from app.core.events import PgEventListener
+from app.db import views
+
+# Параметры слушателя, при которых циклы переподключения и проверки соединения проходят за миллисекунды
+_RETRY_INTERVAL = 0.01
+_MAX_BACKOFF = 0.04
+
+# Исходный asyncio.sleep: тест паузы подменяет его, а ожидание условий не должно попадать в запись
+_sleep = asyncio.sleep
+
+
+class FakeConnection:
+    """Соединение asyncpg с управляемой блокировкой и разрывом"""
+
+    def __init__(self, lock_granted: bool = True, probe_error: Exception = None):
+        self.lock_granted = lock_granted
+        self.probe_error = probe_error
+        self.listeners = {}
+        self.termination_listeners = []
+        self.executed: List[str] = []
+        self.terminated = False
+
+    async def fetchval(self, query: str, *args):
+        assert "pg_try_advisory_lock" in query
+        return self.lock_granted
+
+    async def add_listener(self, channel: str, callback: Callable):
+        self.listeners[channel] = callback
+
+    def add_termination_listener(self, callback: Callable):
+        self.termination_listeners.append(callback)
+
+    async def execute(self, query: str, timeout: float = None):
+        if query == "SELECT 1" and self.probe_error is not None:
+            raise self.probe_error
+        self.executed.append(query)
+
+    def terminate(self):
+        self.terminated = True
+
+    def lose(self):
+        """Разрыв соединения, замеченный asyncpg"""
+        for callback in self.termination_listeners:
+            callback(self)
+
+
+async def wait_until(predicate: Callable[[], bool], timeout: float = 2.0):
+    """Ожидание условия с периодической проверкой"""
+    async def poll():
+        while not predicate():
+            await _sleep(0.001)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def noop_handler(connection, payload):
+    """Обработчик-заглушка"""
+
+
+@pytest.fixture
+def listener():
+    """Слушатель с быстрыми повторами и подпиской на один канал"""
+    pg_listener = PgEventListener(
+        "postgresql://fake", debounce=0.01, retry_interval=_RETRY_INTERVAL, max_backoff=_MAX_BACKOFF
+    )
+    pg_listener.subscribe("cat_refresh", noop_handler)
+    return pg_listener
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Очередь соединений (или ошибок), которые по порядку вернет asyncpg.connect"""
+    queue: List = []
+    opened: List[FakeConnection] = []
+
+    async def connect(dsn):
+        item = queue.pop(0) if queue else FakeConnection(lock_granted=False)
+        if isinstance(item, Exception):
+            raise item
+        opened.append(item)
+        return item
+
+    monkeypatch.setattr(asyncpg, "connect", connect)
+    return queue, opened
+
+
+class TestPgEventListener:
+    """Тесты выборов лидера, переподключения и дебаунса"""
+
+    @pytest.mark.asyncio
+    async def test_lock_granted_listens(self, listener, connections):
+        """Тест: процесс с блокировкой становится лидером и подписывается на каналы"""
+        queue, opened = connections
+        connection = FakeConnection()
+        queue.append(connection)
+
+        await listener.start()
+        try:
+            await wait_until(lambda: listener.is_leader)
+            assert set(connection.listeners) == {"cat_refresh"}
+            assert not connection.terminated
+        finally:
+            await listener.stop()
+
+    @pytest.mark.asyncio
+    async def test_lock_denied_retries(self, listener, connections):
+        """Тест: без блокировки соединение закрывается, попытки захвата повторяются"""
+        queue, opened = connections
+
+        await listener.start()
+        try:
+            await wait_until(lambda: len(opened) >= 3)
+            assert not listener.is_leader
+            assert all(connection.terminated and not connection.listeners for connection in opened[:2])
+
+            # Бывший лидер отключился: блокировка свободна, и следующая попытка ее захватывает
+            queue.append(FakeConnection())
+            await wait_until(lambda: listener.is_leader)
+        finally:
+            await listener.stop()
+
+    @pytest.mark.asyncio
+    async def test_connection_lost_reconnects(self, listener, connections):
+        """Тест: после разрыва соединение закрывается и слушатель переподключается"""
+        queue, opened = connections
+        first, second = FakeConnection(), FakeConnection()
+        queue.extend([first, second])
+
+        await listener.start()
+        try:
+            await wait_until(lambda: listener.is_leader)
+            first.lose()
+
+            await wait_until(lambda: first.terminated)
+            await wait_until(lambda: listener.is_leader and second.listeners)
+            assert listener._connection is second
+        finally:
+            await listener.stop()
+
+    @pytest.mark.asyncio
+    async def test_liveness_probe(self, listener, connections):
+        """Тест: соединение проверяется запросом, ошибка проверки приводит к переподключению"""
+        queue, opened = connections
+        broken = FakeConnection(probe_error=asyncpg.InterfaceError("connection is closed"))
+        healthy = FakeConnection()
+        queue.extend([broken, healthy])
+
+        await listener.start()
+        try:
+            await wait_until(lambda: listener._connection is healthy)
+            assert broken.terminated
+            await wait_until(lambda: len(healthy.executed) >= 1)
+            assert healthy.executed[0] == "SELECT 1"
+        finally:
+            await listener.stop()
+
+    @pytest.mark.asyncio
+    async def test_connect_error_backoff(self, listener, connections, monkeypatch):
+        """Тест: пауза после ошибок подключения растет вдвое до max_backoff и сбрасывается после успеха"""
+        queue, opened = connections
+        queue.extend([OSError("refused")] * 4 + [FakeConnection(lock_granted=False), FakeConnection()])
+
+        delays = []
+
+        async def recording_sleep(delay, *args, **kwargs):
+            delays.append(delay)
+            await _sleep(0)
+
+        monkeypatch.setattr(asyncio, "sleep", recording_sleep)
+
+        await listener.start()
+        try:
+            await wait_until(lambda: listener.is_leader)
+        finally:
+            await listener.stop()
+
+        assert delays[:5] == [_RETRY_INTERVAL, 0.02, _MAX_BACKOFF, _MAX_BACKOFF, _RETRY_INTERVAL]
+
+    @pytest.mark.asyncio
+    async def test_start_without_handlers(self):
+        """Тест: без подписок слушатель не запускается"""
+        pg_listener = PgEventListener("postgresql://fake")
+        await pg_listener.start()
+        assert pg_listener._task is None
+        await pg_listener.stop()
+
+    @pytest.mark.asyncio
+    async def test_start_twice(self, listener, connections):
+        """Тест: повторный запуск не создает вторую задачу"""
+        await listener.start()
+        task = listener._task
+        await listener.start()
+        assert listener._task is task
+        await listener.stop()
+
+    @pytest.mark.asyncio
+    async def test_notify_burst_dispatched_once(self, listener):
+        """Тест: серия уведомлений за время дебаунса схлопывается в один вызов обработчиков"""
+        calls = []
+
+        async def handler(connection, payload):
+            calls.append((connection, payload))
+
+        listener.subscribe("client_refresh", handler)
+        connection = FakeConnection()
+        listener._connection = connection
+
+        for index in range(5):
+            listener._on_notify(connection, 1, "client_refresh", f"payload-{index}")
+        assert len(listener._pending) == 1
+
+        await wait_until(lambda: not listener._pending)
+        await wait_until(lambda: calls)
+        await asyncio.sleep(0.02)
+        assert calls == [(connection, "payload-0")]
+
+    @pytest.mark.asyncio
+    async def test_handler_error_does_not_stop_others(self, listener):
+        """Тест: ошибка обработчика не мешает остальным обработчикам канала"""
+        calls = []
+
+        async def failing(connection, payload):
+            raise RuntimeError("boom")
+
+        async def handler(connection, payload):
+            calls.append(payload)
+
+        listener.subscribe("sales_refresh", failing)
+        listener.subscribe("sales_refresh", handler)
+        listener._connection = FakeConnection()
+
+        await listener._dispatch("sales_refresh", "order")
+        assert calls == ["order"]
+
+    @pytest.mark.asyncio
+    async def test_lost_leadership_skips_event(self, listener):
+        """Тест: если до конца дебаунса лидерство потеряно, событие пропускается"""
+        calls = []
+
+        async def handler(connection, payload):
+            calls.append(payload)
+
+        listener.subscribe("client_refresh", handler)
+        listener._on_notify(FakeConnection(), 1, "client_refresh", "client")
+
+        await wait_until(lambda: not listener._pending)
+        await asyncio.sleep(0.02)
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_pending(self, listener):
+        """Тест: остановка отменяет отложенные обработчики"""
+        listener.debounce = 10
+        listener._on_notify(FakeConnection(), 1, "cat_refresh", "category")
+        task = listener._pending["cat_refresh"]
+
+        await listener.stop()
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        assert listener._pending == {}
+
+
+class TestViewRefresh:
+    """Тесты обновления представлений и их версий"""
+
+    @pytest.mark.asyncio
+    async def test_refresh_handler_order(self, monkeypatch):
+        """Тест: REFRESH, затем сброс кэша представления, затем новая версия"""
+        steps = []
+        connection = FakeConnection()
+
+        async def execute(query, timeout=None):
+            steps.append(query)
+
+        async def invalidate(*patterns):
+            steps.append(("invalidate", patterns))
+            return 0
+
+        async def cache_set(key, value, ttl=None):
+            steps.append(("set", key, ttl))
+            return True
+
+        monkeypatch.setattr(connection, "execute", execute)
+        monkeypatch.setattr(views, "invalidate_cache", invalidate)
+        monkeypatch.setattr(views.cache_manager, "set", cache_set)
+
+        refresh = views._make_refresh_handler(("app.mv_category_stats", "app.mv_client_stats"))
+        await refresh(connection, "category")
+
+        assert steps == [
+            "REFRESH MATERIALIZED VIEW CONCURRENTLY app.mv_category_stats",
+            ("invalidate", ("analytics:get_category_stats:*",)),
+            ("set", "view_version:app.mv_category_stats", views.VIEW_VERSION_TTL),
+            "REFRESH MATERIALIZED VIEW CONCURRENTLY app.mv_client_stats",
+            ("set", "view_version:app.mv_client_stats", views.VIEW_VERSION_TTL),
+        ]
+
+    def test_register_view_refresh(self):
+        """Тест: каждый канал обновления получает обработчик"""
+        pg_listener = PgEventListener("postgresql://fake")
+        views.register_view_refresh(pg_listener)
+        assert set(pg_listener._handlers) == set(views.REFRESH_CHANNELS)
+
+    @pytest.mark.parametrize("stored, expected", [
+        ({"view_version:app.mv_client_stats": "a1"}, "a1"),
+        ({}, None),
+    ])
+    @pytest.mark.asyncio
+    async def test_endpoint_version(self, monkeypatch, stored, expected):
+        """Тест: версия endpoint'а - версии его представлений; без любой из них версия неизвестна"""
+        requested = []
+
+        async def get_many(keys):
+            requested.append(keys)
+            return [stored.get(key) for key in keys]
+
+        monkeypatch.setattr(views.cache_manager, "get_many", get_many)
+
+        assert await views.endpoint_version("/api/v1/clients/stats/") == expected
+        assert requested == [["view_version:app.mv_client_stats"]]
+
+    @pytest.mark.asyncio
+    async def test_endpoint_version_unknown_path(self, monkeypatch):
+        """Тест: для endpoint'а не из представлений версия не запрашивается"""
+
+        async def get_many(keys):
+            raise AssertionError("Redis не должен запрашиваться")
+
+        monkeypatch.setattr(views.cache_manager, "get_many", get_many)
+        assert await views.endpoint_version("/api/v1/analytics/top-clients") is None
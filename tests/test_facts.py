@@ -0,0 +1,91 @@
+"""
+Тесты периодической пересборки снимков продаж
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+
+from app.db import facts
+
+
+async def run_for(interval: float, duration: float = 0.05):
+    """Запуск цикла пересборки на заданное время"""
+    task = asyncio.create_task(facts.run_fact_refresh(interval))
+    await asyncio.sleep(duration)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.fixture
+def refresh_calls(monkeypatch):
+    """Подмена пересборки и частая проверка лидерства"""
+    calls = []
+
+    async def refresh_sales_facts():
+        calls.append(None)
+        return 1
+
+    monkeypatch.setattr(facts, "refresh_sales_facts", refresh_sales_facts)
+    monkeypatch.setattr(facts, "_LEADER_POLL_INTERVAL", 0.001)
+    return calls
+
+
+class TestFactRefresh:
+    """Тесты пересборки снимка продаж"""
+
+    @pytest.mark.asyncio
+    async def test_non_leader_skips(self, monkeypatch, refresh_calls):
+        """Тест: процесс без блокировки слушателя снимок не пересобирает"""
+        monkeypatch.setattr(facts, "pg_events", SimpleNamespace(is_leader=False))
+        await run_for(interval=0)
+        assert refresh_calls == []
+
+    @pytest.mark.asyncio
+    async def test_leader_refreshes_once_per_interval(self, monkeypatch, refresh_calls):
+        """Тест: лидер пересобирает снимок сразу, следующая пересборка - через интервал"""
+        monkeypatch.setattr(facts, "pg_events", SimpleNamespace(is_leader=True))
+        await run_for(interval=60)
+        assert len(refresh_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_error_does_not_stop_loop(self, monkeypatch):
+        """Тест: ошибка пересборки логируется, цикл продолжает работу и не повторяет ее до интервала"""
+        calls = []
+
+        async def failing_refresh():
+            calls.append(None)
+            raise RuntimeError("deadlock detected")
+
+        monkeypatch.setattr(facts, "refresh_sales_facts", failing_refresh)
+        monkeypatch.setattr(facts, "_LEADER_POLL_INTERVAL", 0.001)
+        monkeypatch.setattr(facts, "pg_events", SimpleNamespace(is_leader=True))
+
+        await run_for(interval=60)
+        assert len(calls) == 1
+
+        await run_for(interval=0)
+        assert len(calls) > 2
+
+    @pytest.mark.parametrize("months", [3, None])
+    @pytest.mark.asyncio
+    async def test_refresh_sales_facts(self, monkeypatch, months: Optional[int]):
+        """Тест: результат функции БД возвращается как есть (None - пересборку выполняет другая транзакция)"""
+        queries = []
+
+        class Connection:
+            async def execute(self, query):
+                queries.append(str(query))
+                return SimpleNamespace(scalar=lambda: months)
+
+        @asynccontextmanager
+        async def begin():
+            yield Connection()
+
+        monkeypatch.setattr(facts, "engine", SimpleNamespace(begin=begin))
+
+        assert await facts.refresh_sales_facts() == months
+        assert queries == ["SELECT app.refresh_fact_sales_month()"]
@@ -0,0 +1,160 @@
+"""
+Тесты HTTP-кэширования (ETag, 304 Not Modified)
+"""
+from typing import List, Optional
+
+import pytest
+
+from app.core.http_cache import ETagMiddleware, etag_matches, weak_etag
+
+# Тело ответа тестового приложения, отправляемое двумя частями
+_CHUNKS = [b'[{"id": 1}', b', {"id": 2}]']
+_BODY = b"".join(_CHUNKS)
+
+
+def make_app(status: int = 200, chunks: List[bytes] = _CHUNKS):
+    """ASGI-приложение, отдающее тело по частям"""
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+
+    return app
+
+
+def make_scope(path: str = "/api/v1/analytics/top-clients", if_none_match: Optional[str] = None, method: str = "GET"):
+    """Scope HTTP-запроса"""
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return {"type": "http", "method": method, "path": path, "query_string": b"", "headers": headers}
+
+
+async def call(middleware: ETagMiddleware, scope: dict) -> List[dict]:
+    """Вызов middleware с сохранением отправленных сообщений"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+def header(message: dict, name: bytes) -> Optional[bytes]:
+    """Значение заголовка в сообщении http.response.start"""
+    return dict(message["headers"]).get(name)
+
+
+class TestETagMatches:
+    """Тесты сравнения If-None-Match"""
+
+    @pytest.mark.parametrize("if_none_match, expected", [
+        (None, False),
+        ("", False),
+        ("*", True),
+        (" * ", True),
+        ('W/"abc"', True),
+        ('"abc"', True),
+        ('"other", W/"abc"', True),
+        ('"other",W/"abc" , "third"', True),
+        ('"other", "abcd"', False),
+    ])
+    def test_etag_matches(self, if_none_match, expected):
+        """Тест: *, списки через запятую и слабые ETag с префиксом W/"""
+        assert etag_matches(if_none_match, 'W/"abc"') is expected
+
+    def test_strong_etag_matches_weak_header(self):
+        """Тест: сравнение слабое и для ETag без префикса"""
+        assert etag_matches('W/"abc"', '"abc"')
+
+
+class TestETagMiddleware:
+    """Тесты middleware ETag"""
+
+    @pytest.mark.asyncio
+    async def test_body_etag(self):
+        """Тест: ETag по телу ответа, 304 для повторного запроса"""
+        middleware = ETagMiddleware(make_app(), prefixes=("/api/v1/analytics",), max_age=30)
+        start, body = await call(middleware, make_scope())
+
+        etag = weak_etag(_BODY)
+        assert header(start, b"etag") == etag.encode()
+        assert header(start, b"cache-control") == b"private, max-age=30"
+        assert body == {"type": "http.response.body", "body": _BODY}
+
+        start, body = await call(middleware, make_scope(if_none_match=etag))
+        assert start["status"] == 304
+        assert body["body"] == b""
+
+    @pytest.mark.asyncio
+    async def test_non_200_passed_through(self):
+        """Тест: ответы с ошибкой не буферизуются и не получают ETag"""
+        middleware = ETagMiddleware(make_app(status=404), prefixes=("/api/v1/analytics",))
+        messages = await call(middleware, make_scope())
+
+        assert [message["type"] for message in messages] == ["http.response.start"] + ["http.response.body"] * 2
+        assert messages[0]["status"] == 404
+        assert header(messages[0], b"etag") is None
+
+    @pytest.mark.parametrize("scope", [
+        make_scope(method="POST"),
+        make_scope(path="/api/v1/orders/"),
+        make_scope(path="/api/v1/clients/"),
+        {"type": "websocket", "path": "/api/v1/clients/1"},
+    ])
+    @pytest.mark.asyncio
+    async def test_unmatched_requests_passed_through(self, scope):
+        """Тест: запросы вне префиксов и шаблона, не GET и не HTTP обрабатываются без ETag"""
+        middleware = ETagMiddleware(make_app(), prefixes=("/api/v1/analytics", "/api/v1/clients/"), pattern=r".*/\d+")
+        messages = await call(middleware, scope)
+
+        assert len(messages) == 3
+        assert header(messages[0], b"etag") is None
+
+    @pytest.mark.asyncio
+    async def test_pattern_match(self):
+        """Тест: путь, подходящий под шаблон, получает ETag"""
+        middleware = ETagMiddleware(make_app(), prefixes=("/api/v1/clients/",), pattern=r"/api/v1/clients/\d+")
+        start, _ = await call(middleware, make_scope(path="/api/v1/clients/1"))
+        assert header(start, b"etag") == weak_etag(_BODY).encode()
+
+    @pytest.mark.asyncio
+    async def test_version_etag(self):
+        """Тест: ETag по версии данных ставится без буферизации, совпадение дает 304 без вызова приложения"""
+
+        async def version_of(path: str) -> Optional[str]:
+            return "v1"
+
+        middleware = ETagMiddleware(make_app(), prefixes=("/api/v1/analytics",), version_of=version_of)
+        messages = await call(middleware, make_scope())
+
+        assert len(messages) == 3
+        etag = header(messages[0], b"etag").decode()
+
+        start, body = await call(middleware, make_scope(if_none_match=etag))
+        assert start["status"] == 304
+        assert body["body"] == b""
+
+        # Ответ с ошибкой не тегируется
+        middleware = ETagMiddleware(make_app(status=500), prefixes=("/api/v1/analytics",), version_of=version_of)
+        messages = await call(middleware, make_scope())
+        assert header(messages[0], b"etag") is None
+
+    @pytest.mark.asyncio
+    async def test_versioned_path_without_version_streamed(self):
+        """Тест: без версии ответ endpoint'а из представлений уходит частями без ETag"""
+
+        async def version_of(path: str) -> Optional[str]:
+            return None
+
+        path = "/api/v1/categories/stats/"
+        middleware = ETagMiddleware(
+            make_app(), prefixes=(path,), version_of=version_of, versioned_paths={path: ("app.mv_category_stats",)}
+        )
+        messages = await call(middleware, make_scope(path=path))
+
+        assert [message.get("body") for message in messages[1:]] == _CHUNKS
+        assert header(messages[0], b"etag") is None
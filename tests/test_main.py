@@ -1,52 +1,45 @@
 """
 Тесты основного приложения
 """
+import asyncio
+
+import httpx
+import orjson
 import pytest
 from fastapi.testclient import TestClient
 
+# Обязательные поля категории в ответе списка
+_REQUIRED_CATEGORY_FIELDS = frozenset({"id", "name", "is_active", "created_at"})
+
 
 class TestMainApp:
     """Тесты основного приложения"""
     
-    def test_root_endpoint(self, client: TestClient):
-        """Тест корневого endpoint"""
-        response = client.get("/")
+    @pytest.mark.parametrize("url, expected, keys", [
+        ("/", {"message": "Система управления заказами", "version": "1.0.0"}, {"docs"}),
+        ("/health", {"status": "healthy"}, {"environment", "database"}),
+    ])
+    def test_static_endpoints(self, client: TestClient, url, expected, keys):
+        """Тест служебных endpoint'ов приложения"""
+        response = client.get(url)
         assert response.status_code == 200
-        
-        data = response.json()
-        assert data["message"] == "Система управления заказами"
-        assert data["version"] == "1.0.0"
-        assert "docs" in data
+
+        data = orjson.loads(response.content)
+        assert data.items() >= expected.items()
+        assert keys.issubset(data)
     
-    def test_health_check(self, client: TestClient):
-        """Тест проверки здоровья приложения"""
-        response = client.get("/health")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["status"] == "healthy"
-        assert "environment" in data
-        assert "database" in data
+    def test_docs_registered(self, client: TestClient):
+        """Тест подключения документации (Swagger UI и ReDoc) без загрузки HTML"""
+        paths = {route.path for route in client.app.routes}
+        assert {"/docs", "/redoc"}.issubset(paths)
     
     def test_metrics_endpoint(self, client: TestClient):
         """Тест endpoint метрик"""
         response = client.get("/metrics")
         assert response.status_code == 200
-        
-        data = response.json()
-        assert "requests_total" in data
-        assert "active_connections" in data
-        assert "uptime" in data
-    
-    def test_docs_endpoint(self, client: TestClient):
-        """Тест endpoint документации"""
-        response = client.get("/docs")
-        assert response.status_code == 200
-    
-    def test_redoc_endpoint(self, client: TestClient):
-        """Тест endpoint ReDoc"""
-        response = client.get("/redoc")
-        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "http_requests_total" in response.text
+        assert "active_connections" in response.text
     
     def test_api_v1_endpoints_exist(self, client: TestClient):
         """Тест существования основных API endpoints"""
@@ -58,9 +51,14 @@ class TestMainApp:
             "/api/v1/analytics/client-summary",
             "/api/v1/analytics/category-children"
         ]
-        
-        for endpoint in endpoints:
-            response = client.get(endpoint)
+
+        async def get_all():
+            # Запросы выполняются параллельно в цикле событий TestClient, к которому привязан пул соединений приложения
+            transport = httpx.ASGITransport(app=client.app)
+            async with httpx.AsyncClient(transport=transport, base_url=str(client.base_url)) as async_client:
+                return await asyncio.gather(*(async_client.get(endpoint) for endpoint in endpoints))
+
+        for response in client.portal.call(get_all):
             # Может быть 200 (данные есть) или 422 (ошибка валидации параметров)
             assert response.status_code in [200, 422]
     
@@ -91,11 +89,45 @@ class TestMainApp:
         response = client.get("/api/v1/categories/")
         assert response.status_code == 200
         
-        data = response.json()
+        data = orjson.loads(response.content)
         assert isinstance(data, list)
         
         if data:  # Если есть данные
-            category = data[0]
-            required_fields = ["id", "name", "is_active", "created_at"]
-            for field in required_fields:
-                assert field in category
+            assert _REQUIRED_CATEGORY_FIELDS.issubset(data[0])
+
+    @pytest.mark.asyncio
+    async def test_lifespan_waits_for_fact_refresh(self, monkeypatch):
+        """Тест: при остановке пересборка снимков завершается до закрытия пула соединений БД"""
+        from app import main
+
+        steps = []
+
+        async def run_fact_refresh(interval):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                # Отмена приходит во время запроса: задача успевает его завершить
+                await asyncio.sleep(0)
+                steps.append("fact_refresh_stopped")
+                raise
+
+        async def step(name):
+            steps.append(name)
+
+        async def noop():
+            pass
+
+        monkeypatch.setattr(main, "run_fact_refresh", run_fact_refresh)
+        monkeypatch.setattr(main, "init_db", noop)
+        monkeypatch.setattr(main, "close_db", lambda: step("close_db"))
+        monkeypatch.setattr(main.cache_manager, "connect", noop)
+        monkeypatch.setattr(main.cache_manager, "aclose", noop)
+        monkeypatch.setattr(main.pg_events, "start", noop)
+        monkeypatch.setattr(main.pg_events, "stop", noop)
+        monkeypatch.setattr(main, "start_logging", lambda: None)
+        monkeypatch.setattr(main, "shutdown_logging", lambda: None)
+
+        async with main.lifespan(main.app):
+            await asyncio.sleep(0)
+
+        assert steps == ["fact_refresh_stopped", "close_db"]